@@ -0,0 +1,177 @@
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+from __future__ import absolute_import, print_function
+
+import array
+import codecs
+import os
+import random
+
+import numpy as np
+from pimlico.datatypes.base import PimlicoDatatypeWriter
+from pimlico.datatypes.files import File
+
+from dlt.utils import tokenizer_module
+
+
+class CorpusIndexType(File):
+    """Where each document of a tarred corpus is, and how many lines and tokens it has.
+
+    archive.npy holds the indices of the documents' tar files in the
+    archives file, offsets.npy and sizes.npy where their data is in the tar
+    file, and lines.npy and tokens.npy their line and token counts with the
+    tokenizer named in the token_type file.  Invalid documents are left
+    out.  Documents are read straight from the tar files, so only the
+    documents asked for are read and tokenized.
+
+    """
+    @property
+    def absolute_path(self):
+        return os.path.join(self.data_dir, "offsets.npy")
+
+    def _array(self, name):
+        return np.load(os.path.join(self.data_dir, name))
+
+    def _read_list(self, name):
+        with codecs.open(os.path.join(self.data_dir, name), 'r', encoding='utf-8') as f:
+            return [line.rstrip(u'\n') for line in f]
+
+    def read_token_type(self):
+        return self._read_list("token_type")[0]
+
+    def read_document_names(self):
+        return self._read_list("document_names")
+
+    def line_counts(self):
+        return self._array("lines.npy")
+
+    def token_counts(self):
+        return self._array("tokens.npy")
+
+    def token_offsets(self):
+        """Offsets of the documents in the tokens, ending with the total count."""
+        return np.concatenate([[0], np.cumsum(self.token_counts())])
+
+    def __len__(self):
+        return len(self._array("offsets.npy"))
+
+    def documents(self, start=0, end=None):
+        """(document name, lines) pairs of the documents from start up to end, like iterating the corpus."""
+        archives = self._read_list("archives")
+        names = self.read_document_names()
+        archive_indices = self._array("archive.npy")
+        offsets = self._array("offsets.npy")
+        sizes = self._array("sizes.npy")
+        open_archive, f = None, None
+        try:
+            for index in xrange(*slice(start, end).indices(len(names))):
+                if archive_indices[index] != open_archive:
+                    if f is not None:
+                        f.close()
+                    open_archive = archive_indices[index]
+                    f = open(archives[open_archive], 'rb')
+                f.seek(int(offsets[index]))
+                yield names[index], f.read(int(sizes[index])).decode('utf-8').split(u"\n")
+        finally:
+            if f is not None:
+                f.close()
+
+    def __iter__(self):
+        return self.documents()
+
+    def token_window(self, start, count):
+        """The documents holding tokens start..start + count: (first document, end document, tokens to skip).
+
+        Documents without tokens at either end of the window are left out,
+        so an empty window holds no documents.
+
+        """
+        token_offsets = self.token_offsets()
+        if start < 0 or count < 0 or start + count > token_offsets[-1]:
+            raise ValueError("token window out of range: {}..{} of {}".format(start, start + count,
+                                                                             token_offsets[-1]))
+        first = np.searchsorted(token_offsets, start, side='right') - 1
+        if count == 0:
+            return int(first), int(first), 0
+        end = np.searchsorted(token_offsets, start + count, side='left')
+        return int(first), int(end), int(start - token_offsets[first])
+
+    def random_token_window(self, count, random_int_generator=random.randint):
+        """Like token_window() for a random window of count tokens."""
+        total = int(self.token_offsets()[-1])
+        if count > total:
+            raise ValueError("sample size is greater than corpus length: {} vs {}".format(count, total))
+        return self.token_window(random_int_generator(0, total - count), count)
+
+    def read_tokens(self, start, count):
+        """Tokens start..start + count of the corpus, tokenizing only the documents holding them."""
+        tokenizer = tokenizer_module(self.read_token_type()).token_gen
+        first, end, skip = self.token_window(start, count)
+        if count == 0:
+            return
+        for doc_name, lines in self.documents(first, end):
+            for line in lines:
+                for token in tokenizer(line):
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    yield token
+                    count -= 1
+                    if count == 0:
+                        return
+
+
+class CorpusIndexTypeWriter(PimlicoDatatypeWriter):
+    def __init__(self, base_dir, token_type, **kwargs):
+        super(CorpusIndexTypeWriter, self).__init__(base_dir, **kwargs)
+        self.token_type = token_type
+        self.archives = []
+        self.document_names = []
+        self.archive_indices = array.array('i')
+        self.offsets = array.array('l')
+        self.sizes = array.array('l')
+        self.line_counts = array.array('l')
+        self.token_counts = array.array('l')
+
+    def add_document(self, archive, name, offset, size, line_count, token_count):
+        """Adds a document whose data is size bytes at offset in the tar file archive."""
+        if len(self.archives) == 0 or self.archives[-1] != archive:
+            self.archives.append(archive)
+        self.archive_indices.append(len(self.archives) - 1)
+        self.document_names.append(name)
+        self.offsets.append(offset)
+        self.sizes.append(size)
+        self.line_counts.append(line_count)
+        self.token_counts.append(token_count)
+
+    def __exit__(self, *args, **kwargs):
+        np.save(os.path.join(self.data_dir, "archive.npy"), np.array(self.archive_indices, dtype=np.int32))
+        for name, counts in [("sizes.npy", self.sizes), ("lines.npy", self.line_counts),
+                             ("tokens.npy", self.token_counts)]:
+            np.save(os.path.join(self.data_dir, name), np.array(counts, dtype=np.int64))
+        for name, items in [("archives", self.archives), ("document_names", self.document_names),
+                            ("token_type", [self.token_type])]:
+            with codecs.open(os.path.join(self.data_dir, name), 'w', encoding='utf-8') as f:
+                for item in items:
+                    print(item, file=f)
+        # Written last, as its presence marks the data as ready
+        np.save(os.path.join(self.data_dir, "offsets.npy"), np.array(self.offsets, dtype=np.int64))
+
+        super(CorpusIndexTypeWriter, self).__exit__(*args, **kwargs)
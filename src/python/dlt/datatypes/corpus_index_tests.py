@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from dlt.datatypes.corpus_index import CorpusIndexType, CorpusIndexTypeWriter
+from dlt.text_tokenizer import token_gen
+
+
+# Documents without tokens at the start, in the middle and at the end, split over two archives
+DOCUMENTS = [
+    [(u"empty", u""), (u"numbers", u"12 34\n-"), (u"one", u"Ab c\nde"), (u"two", u"\nf ghi\n")],
+    [(u"blank", u"\n\n"), (u"three", u"jk l ä"), (u"last_empty", u"")],
+]
+
+
+def _tokens(text):
+    return [(token.letter, token.is_beginning, token.is_ending)
+            for line in text.split(u"\n") for token in token_gen(line)]
+
+
+class CorpusIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with CorpusIndexTypeWriter(self.directory, "text") as writer:
+            for archive_number, documents in enumerate(DOCUMENTS):
+                archive_path = os.path.join(self.directory, "{}.tar".format(archive_number))
+                with tarfile.open(archive_path, 'w') as archive:
+                    for name, text in documents:
+                        data = text.encode('utf-8')
+                        info = tarfile.TarInfo(name)
+                        info.size = len(data)
+                        archive.addfile(info, io.BytesIO(data))
+                with tarfile.open(archive_path) as archive:
+                    for member, (name, text) in zip(archive, documents):
+                        writer.add_document(archive_path, name, member.offset_data, member.size,
+                                            len(text.split(u"\n")), len(_tokens(text)))
+        self.index = CorpusIndexType(self.directory, None)
+        self.texts = [text for documents in DOCUMENTS for _, text in documents]
+        self.all_tokens = sum((_tokens(text) for text in self.texts), [])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_tokens(self, start, count):
+        return [(token.letter, token.is_beginning, token.is_ending)
+                for token in self.index.read_tokens(start, count)]
+
+    def test_documents(self):
+        self.assertEqual(len(self.index), 7)
+        self.assertEqual(list(self.index.token_counts()), [0, 0, 5, 4, 0, 4, 0])
+        self.assertEqual([(name, u"\n".join(lines)) for name, lines in self.index],
+                         [document for documents in DOCUMENTS for document in documents])
+        self.assertEqual([name for name, _ in self.index.documents(2, 5)], [u"one", u"two", u"blank"])
+
+    def test_token_window(self):
+        # Documents without tokens before the window are skipped, and ones after it left out; token offsets
+        # are 0, 0, 0, 5, 9, 9, 13, 13
+        self.assertEqual(self.index.token_window(0, 1), (2, 3, 0))
+        self.assertEqual(self.index.token_window(0, 5), (2, 3, 0))
+        self.assertEqual(self.index.token_window(4, 2), (2, 4, 4))
+        self.assertEqual(self.index.token_window(5, 4), (3, 4, 0))
+        self.assertEqual(self.index.token_window(5, 5), (3, 6, 0))
+        # Windows at the end of the corpus
+        self.assertEqual(self.index.token_window(12, 1), (5, 6, 3))
+        self.assertEqual(self.index.token_window(0, 13), (2, 6, 0))
+        # Empty windows hold no documents
+        self.assertEqual(self.index.token_window(0, 0), (2, 2, 0))
+        self.assertEqual(self.index.token_window(7, 0), (3, 3, 0))
+        self.assertEqual(self.index.token_window(9, 0), (5, 5, 0))
+        self.assertEqual(self.index.token_window(13, 0), (7, 7, 0))
+        for start, count in [(-1, 1), (0, -1), (12, 2), (14, 0)]:
+            with self.assertRaises(ValueError):
+                self.index.token_window(start, count)
+
+    def test_read_tokens(self):
+        self.assertEqual(len(self.all_tokens), 13)
+        for start in xrange(len(self.all_tokens) + 1):
+            for count in xrange(len(self.all_tokens) - start + 1):
+                self.assertEqual(self.read_tokens(start, count), self.all_tokens[start:start + count])
+
+    def test_random_token_window(self):
+        self.assertEqual(self.index.random_token_window(13, lambda a, b: b), (2, 6, 0))
+        self.assertEqual(self.index.random_token_window(2, lambda a, b: b), (5, 6, 2))
+        with self.assertRaises(ValueError):
+            self.index.random_token_window(14)
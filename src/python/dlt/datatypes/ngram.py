@@ -17,7 +17,7 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
-from __future__ import print_function
+from __future__ import absolute_import, print_function
 
 import json
 
@@ -26,6 +26,32 @@ import collections
 import os
 from pimlico.datatypes.files import File
 from pimlico.datatypes.base import PimlicoDatatypeWriter
+from pimlico.datatypes.results import NumericResult, NumericResultWriter
+
+from ngram.models import UnigramModel, BigramModel, TrigramModel
+from ngram.packed import SymbolTable, read_binary_vocabulary
+
+
+def _read_model(model_class, datatype, **kwargs):
+    # Outputs written before the binary format was introduced only have the text file
+    if os.path.exists(datatype.binary_path):
+        return model_class.read_binary(datatype.binary_path, **kwargs)
+    with codecs.open(datatype.absolute_path, 'r', encoding='utf-8') as f:
+        return model_class.read_from_file(f, **kwargs)
+
+
+def _model_data_ready(datatype):
+    # Models written without the text copy only have the binary file
+    return super(File, datatype).data_ready() and \
+        (os.path.exists(datatype.binary_path) or os.path.exists(datatype.absolute_path))
+
+
+def _write_model(writer, model, text_copy):
+    if text_copy:
+        with codecs.open(writer.absolute_path, 'w', encoding='utf-8') as f:
+            model.write_to_file(f)
+    with open(writer.binary_path, 'wb') as f:
+        model.write_binary(f)
 
 
 class UnigramFrequencyType(File):
@@ -33,36 +59,127 @@ class UnigramFrequencyType(File):
     def absolute_path(self):
         return os.path.join(self.data_dir, "unigram_frequency")
 
+    @property
+    def binary_path(self):
+        return os.path.join(self.data_dir, "unigram_frequency.bin")
+
+    def data_ready(self):
+        return _model_data_ready(self)
+
+    def read_model(self, **kwargs):
+        return _read_model(UnigramModel, self, **kwargs)
+
+    def read_vocabulary(self):
+        if os.path.exists(self.binary_path):
+            return set(read_binary_vocabulary(self.binary_path))
+        return self.read_model().vocabulary
+
 
 class UnigramFrequencyTypeWriter(PimlicoDatatypeWriter):
     @property
     def absolute_path(self):
         return os.path.join(self.data_dir, "unigram_frequency")
 
+    @property
+    def binary_path(self):
+        return os.path.join(self.data_dir, "unigram_frequency.bin")
+
+    def write_model(self, model, text_copy=True):
+        _write_model(self, model, text_copy)
+
 
 class BigramModelType(File):
     @property
     def absolute_path(self):
         return os.path.join(self.data_dir, "bigram_model")
 
+    @property
+    def binary_path(self):
+        return os.path.join(self.data_dir, "bigram_model.bin")
+
+    def data_ready(self):
+        return _model_data_ready(self)
+
+    def read_model(self, **kwargs):
+        return _read_model(BigramModel, self, **kwargs)
+
 
 class BigramModelTypeWriter(PimlicoDatatypeWriter):
     @property
     def absolute_path(self):
         return os.path.join(self.data_dir, "bigram_model")
 
+    @property
+    def binary_path(self):
+        return os.path.join(self.data_dir, "bigram_model.bin")
+
+    def write_model(self, model, text_copy=True):
+        _write_model(self, model, text_copy)
+
 
 class TrigramModelType(File):
     @property
     def absolute_path(self):
         return os.path.join(self.data_dir, "trigram_model")
 
+    @property
+    def binary_path(self):
+        return os.path.join(self.data_dir, "trigram_model.bin")
+
+    def data_ready(self):
+        return _model_data_ready(self)
+
+    def read_model(self, **kwargs):
+        return _read_model(TrigramModel, self, **kwargs)
+
 
 class TrigramModelTypeWriter(PimlicoDatatypeWriter):
     @property
     def absolute_path(self):
         return os.path.join(self.data_dir, "trigram_model")
 
+    @property
+    def binary_path(self):
+        return os.path.join(self.data_dir, "trigram_model.bin")
+
+    def write_model(self, model, text_copy=True):
+        _write_model(self, model, text_copy)
+
+
+class VocabularyType(File):
+    """Tokens of all languages with ids shared across the pipeline: a token per line, numbered from 0."""
+    @property
+    def absolute_path(self):
+        return os.path.join(self.data_dir, "vocabulary")
+
+    def read_tokens(self):
+        with codecs.open(self.absolute_path, 'r', encoding='utf-8') as f:
+            return [line.rstrip(u'\n') for line in f]
+
+    def read_symbols(self):
+        """A SymbolTable holding the tokens at their ids; tokens added later get ids after them."""
+        return SymbolTable(self.read_tokens())
+
+
+class VocabularyTypeWriter(PimlicoDatatypeWriter):
+    def __init__(self, *args, **kwargs):
+        super(VocabularyTypeWriter, self).__init__(*args, **kwargs)
+        self.tokens = []
+
+    @property
+    def absolute_path(self):
+        return os.path.join(self.data_dir, "vocabulary")
+
+    def __exit__(self, *args, **kwargs):
+        if len(self.tokens) == 0:
+            raise Exception("'tokens' attribute must be populated for the writer within the context")
+
+        with codecs.open(self.absolute_path, 'w', encoding='utf-8') as f:
+            for token in self.tokens:
+                print(token, file=f)
+
+        super(VocabularyTypeWriter, self).__exit__(*args, **kwargs)
+
 
 class DecimalDistancesType(File):
     @property
@@ -90,6 +207,50 @@ class DecimalDistancesTypeWriter(PimlicoDatatypeWriter):
         super(DecimalDistancesTypeWriter, self).__exit__(*args, **kwargs)
 
 
+class LanguageDistancesType(NumericResult):
+    """Model-corpus distances of many language pairs at once; the numeric result is their mean."""
+    @property
+    def absolute_path(self):
+        return os.path.join(self.data_dir, "language_distances")
+
+    def read_distances(self):
+        """Returns distances keyed by (model language code, corpus language code) and language names by code."""
+        distances = {}
+        lang_names = {}
+        with codecs.open(self.absolute_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                model_lang, corpus_lang, distance, model_name, corpus_name = line.rstrip(u'\n').split(u'\t')
+                distances[(model_lang, corpus_lang)] = float(distance)
+                lang_names[model_lang] = model_name
+                lang_names[corpus_lang] = corpus_name
+        return distances, lang_names
+
+
+class LanguageDistancesTypeWriter(NumericResultWriter):
+    def __init__(self, *args, **kwargs):
+        super(LanguageDistancesTypeWriter, self).__init__(*args, **kwargs)
+        # (model language code, corpus language code) => distance
+        self.distances = {}
+        # Language code => name
+        self.lang_names = {}
+
+    @property
+    def absolute_path(self):
+        return os.path.join(self.data_dir, "language_distances")
+
+    def __exit__(self, *args, **kwargs):
+        if len(self.distances) == 0:
+            raise Exception("'distances' attribute must be populated for the writer within the context")
+
+        with codecs.open(self.absolute_path, 'w', encoding='utf-8') as f:
+            for (model_lang, corpus_lang), distance in sorted(self.distances.iteritems()):
+                print(model_lang, corpus_lang, repr(distance), self.lang_names[model_lang],
+                      self.lang_names[corpus_lang], sep=u'\t', file=f)
+        self.result = sum(self.distances.itervalues()) / float(len(self.distances))
+
+        super(LanguageDistancesTypeWriter, self).__exit__(*args, **kwargs)
+
+
 class SetSizeAndStatistics(File):
     @property
     def absolute_path(self):
@@ -0,0 +1,162 @@
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+from __future__ import absolute_import, print_function
+
+import array
+import codecs
+import os
+
+import numpy as np
+from pimlico.datatypes.base import PimlicoDatatypeWriter
+from pimlico.datatypes.files import File
+
+from dlt.text_tokenizer import Token
+from ngram.batch import TokenBatch
+from ngram.packed import SymbolTable
+
+
+# Bits of the token flags
+IS_BEGINNING = 1
+IS_ENDING = 2
+
+
+class TokenizedCorpusType(File):
+    """A corpus tokenized once, as arrays that are memory mapped when read.
+
+    tokens.npy holds the token ids (indices to the vocabulary file, a token per
+    line) and flags.npy their IS_BEGINNING and IS_ENDING bits.  lines.npy
+    holds the offsets of the lines in the tokens and documents.npy the offsets
+    of the documents in the lines, both ending with the total count.  Invalid
+    documents are left out.
+
+    Readers take the tokens with read_batch(), straight from the arrays.
+    ngram_models and all_pairs_distance only read tokenized corpora; the
+    per-model, per-pair distance, word length, input constraint and phoneme
+    mapping modules read either this or the raw text.
+
+    """
+    @property
+    def absolute_path(self):
+        return os.path.join(self.data_dir, "tokens.npy")
+
+    def _array(self, name):
+        return np.load(os.path.join(self.data_dir, name), mmap_mode='r')
+
+    def read_vocabulary(self):
+        with codecs.open(os.path.join(self.data_dir, "vocabulary"), 'r', encoding='utf-8') as f:
+            return [line.rstrip(u'\n') for line in f]
+
+    def read_document_names(self):
+        with codecs.open(os.path.join(self.data_dir, "document_names"), 'r', encoding='utf-8') as f:
+            return [line.rstrip(u'\n') for line in f]
+
+    def __len__(self):
+        return len(self._array("tokens.npy"))
+
+    def __iter__(self):
+        """(document name, lines) pairs, the lines being lists of tokens.
+
+        Can stand in for the raw corpus with a tokenizer that returns the line
+        as it is, such as iter().
+
+        """
+        vocabulary = self.read_vocabulary()
+        tokens = self._array("tokens.npy")
+        flags = self._array("flags.npy")
+        lines = self._array("lines.npy")
+        documents = self._array("documents.npy")
+        for index, name in enumerate(self.read_document_names()):
+            doc_lines = []
+            for line in xrange(documents[index], documents[index + 1]):
+                start, end = lines[line], lines[line + 1]
+                doc_lines.append([Token(vocabulary[id_], bool(flag & IS_BEGINNING), bool(flag & IS_ENDING))
+                                  for id_, flag in zip(tokens[start:end].tolist(), flags[start:end].tolist())])
+            yield name, doc_lines
+
+    def complete_lines_and_documents(self, token_count):
+        """How many lines and documents lie entirely within the first token_count tokens."""
+        lines = self._array("lines.npy")
+        documents = self._array("documents.npy")
+        return (int(np.searchsorted(lines[1:], token_count, side='right')),
+                int(np.searchsorted(lines[documents[1:]], token_count, side='right')))
+
+    def read_batch(self, symbols, max_token_count=None):
+        """The first max_token_count tokens (all by default) as a TokenBatch over the symbol table."""
+        mapping = np.array([symbols.add(token) for token in self.read_vocabulary()], dtype=np.int64)
+        flags = self._array("flags.npy")[:max_token_count]
+        return TokenBatch(mapping[self._array("tokens.npy")[:max_token_count]],
+                          (flags & IS_BEGINNING) != 0, (flags & IS_ENDING) != 0, symbols)
+
+
+class TokenizedCorpusTypeWriter(PimlicoDatatypeWriter):
+    def __init__(self, *args, **kwargs):
+        super(TokenizedCorpusTypeWriter, self).__init__(*args, **kwargs)
+        # Batches added with add_batch_document() are encoded over this table
+        self.symbols = SymbolTable()
+        self.token2id = self.symbols.token2id
+        self.vocabulary = self.symbols.id2token
+        self.document_names = []
+        self.tokens = array.array('i')
+        self.flags = array.array('B')
+        self.line_offsets = [0]
+        self.document_offsets = [0]
+
+    def add_document(self, name, lines):
+        """Adds a document given as an iterable of lines, each an iterable of tokens."""
+        for line in lines:
+            for token in line:
+                id_ = self.token2id.get(token.letter, None)
+                if id_ is None:
+                    id_ = len(self.vocabulary)
+                    self.token2id[token.letter] = id_
+                    self.vocabulary.append(token.letter)
+                self.tokens.append(id_)
+                self.flags.append((IS_BEGINNING if token.is_beginning else 0) |
+                                  (IS_ENDING if token.is_ending else 0))
+            self.line_offsets.append(len(self.tokens))
+        self.document_offsets.append(len(self.line_offsets) - 1)
+        self.document_names.append(name)
+
+    def add_batch_document(self, name, batches):
+        """Like add_document(), but with each line given as a TokenBatch over self.symbols."""
+        for batch in batches:
+            if batch.symbols is not self.symbols:
+                batch = batch.recode(self.symbols)
+            self.tokens.fromstring(batch.ids.astype(np.intc).tostring())
+            flags = np.where(batch.is_beginning, IS_BEGINNING, 0) | np.where(batch.is_ending, IS_ENDING, 0)
+            self.flags.fromstring(flags.astype(np.uint8).tostring())
+            self.line_offsets.append(len(self.tokens))
+        self.document_offsets.append(len(self.line_offsets) - 1)
+        self.document_names.append(name)
+
+    def __exit__(self, *args, **kwargs):
+        np.save(os.path.join(self.data_dir, "flags.npy"), np.frombuffer(self.flags, dtype=np.uint8))
+        np.save(os.path.join(self.data_dir, "lines.npy"), np.array(self.line_offsets, dtype=np.int64))
+        np.save(os.path.join(self.data_dir, "documents.npy"), np.array(self.document_offsets, dtype=np.int64))
+        with codecs.open(os.path.join(self.data_dir, "vocabulary"), 'w', encoding='utf-8') as f:
+            for token in self.vocabulary:
+                print(token, file=f)
+        with codecs.open(os.path.join(self.data_dir, "document_names"), 'w', encoding='utf-8') as f:
+            for name in self.document_names:
+                print(name, file=f)
+        # Written last, as its presence marks the data as ready
+        np.save(os.path.join(self.data_dir, "tokens.npy"), np.frombuffer(self.tokens, dtype=np.intc))
+
+        super(TokenizedCorpusTypeWriter, self).__exit__(*args, **kwargs)
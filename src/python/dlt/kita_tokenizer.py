@@ -21,7 +21,8 @@
 #
 import unicodedata as ud
 
-from text_tokenizer import token_gen as _tg
+from ngram.batch import TokenBatch
+from text_tokenizer import letter_gen as _lg, Token
 
 
 def _rmdiacritics(char):
@@ -32,10 +33,53 @@ def _rmdiacritics(char):
     return ud.lookup(desc)
 
 
+# Lowercase character code -> the character without diacritics, extended as new characters are seen
+_STRIPPED = {}
+_SEEN = set()
+# Characters the table can't stand in for, e.g. ones _rmdiacritics() fails on
+_UNTRANSLATABLE = set()
+
+
+def _extend_table(text):
+    for char in set(text).difference(_SEEN):
+        _SEEN.add(char)
+        if char.isspace():
+            continue
+        try:
+            stripped = _rmdiacritics(char)
+        except (KeyError, ValueError):
+            _UNTRANSLATABLE.add(char)
+            continue
+        # The stripped line is lowercased again and split into words, which must not change the result
+        if stripped.lower() != stripped or \
+                stripped != char and (stripped.isspace() or stripped in u'0123456789-"'):
+            _UNTRANSLATABLE.add(char)
+        elif stripped != char:
+            _STRIPPED[ord(char)] = stripped
+
+
+def letter_gen(text):
+    """Like token_gen(), but yields (letter, is_beginning, is_ending) tuples.
+
+    Whole lines are stripped of diacritics with a translation table, except
+    for the rare ones with characters it can't handle.
+
+    """
+    lowered = unicode(text).lower()
+    _extend_table(lowered)
+    if _UNTRANSLATABLE.isdisjoint(lowered):
+        return _lg(lowered.translate(_STRIPPED))
+    return ((_rmdiacritics(letter), is_beginning, is_ending) for letter, is_beginning, is_ending in _lg(text))
+
+
 def token_gen(text):
-    for token in _tg(text):
-        token.letter = _rmdiacritics(token.letter)
-        yield token
+    for letter, is_beginning, is_ending in letter_gen(text):
+        yield Token(letter, is_beginning, is_ending)
+
+
+def token_batch(text, symbols):
+    """The tokens of text as a TokenBatch over symbols, without creating Token objects."""
+    return TokenBatch.from_rows(letter_gen(text), symbols)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import random
+import unicodedata as ud
+import unittest
+
+from dlt.kita_tokenizer import letter_gen, _rmdiacritics
+from dlt.text_tokenizer import letter_gen as text_letter_gen
+
+
+def stripped_char_by_char(text):
+    return [(_rmdiacritics(letter), is_beginning, is_ending)
+            for letter, is_beginning, is_ending in text_letter_gen(text)]
+
+
+class LetterGenTest(unittest.TestCase):
+    def test_lines(self):
+        for line in [u"", u"Hyvää päivää, Škoda Łódź", u"Ça va très bien 2009 - \"", u"İstanbul Ǆ ǅ ǆ",
+                     u"x y z", u"ﬁ ﬂ ṩ ẞ"]:
+            self.assertEqual(stripped_char_by_char(line), list(letter_gen(line)))
+
+    def test_random_lines(self):
+        rnd = random.Random(1)
+        alphabet = [char for char in (unichr(rnd.randint(32, 0x2ff)) for _ in xrange(100)) if ud.name(char, None)] + \
+            [u" ", u"\t", u"-", u"\"", u"1"]
+        for _ in xrange(2000):
+            line = u"".join(rnd.choice(alphabet) for _ in xrange(rnd.randint(0, 25)))
+            self.assertEqual(stripped_char_by_char(line), list(letter_gen(line)))
+
+    def test_failing_characters(self):
+        # Unnamed characters fail in _rmdiacritics(), and must still fail when in a word
+        self.assertRaises(ValueError, list, letter_gen(u"a͸b"))
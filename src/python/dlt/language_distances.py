@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import multiprocessing
+
+import numpy as np
+
+from ngram.all_pairs import perplexity_matrix, kita_matrix
+from ngram.batch import batch_probability, model_symbols
+from ngram.models import UnigramModel, DeletedInterpolationTrigramModel
+
+
+class LanguageDistances(object):
+    """Distances of every language's trigram model to every language's test corpus.
+
+    Each corpus is given as a TransitionHistogram counted once.  A pair is
+    scored as the trigram_model_distance module does: the unigram models are
+    smoothed over the vocabulary shared by the two languages, and the model
+    language's tokens are substituted into the corpus by the token mapping.
+
+    """
+    def __init__(self, histograms, vocabularies, unigram_counts, bigram_models, trigram_models, token_mapping,
+                 symbols, interpolation_method="none", additive_smoothing=False, additive_smoothing_a=0.1,
+                 distance_measure="perplexity"):
+        self.histograms = histograms
+        self.vocabularies = vocabularies
+        self.unigram_counts = unigram_counts
+        self.bigram_models = bigram_models
+        self.trigram_models = trigram_models
+        self.token_mapping = token_mapping
+        self.symbols = symbols
+        self.interpolation_method = interpolation_method
+        self.additive_smoothing = additive_smoothing
+        self.additive_smoothing_a = additive_smoothing_a
+        self.distance_measure = distance_measure
+
+    def model(self, language, shared_vocabulary):
+        if self.interpolation_method == "none":
+            return self.trigram_models[language]
+        unigram_model = UnigramModel(self.unigram_counts[language], additional_vocabulary=shared_vocabulary,
+                                     additive_smoothing=self.additive_smoothing,
+                                     additive_smoothing_a=self.additive_smoothing_a, symbols=self.symbols)
+        return DeletedInterpolationTrigramModel(self.trigram_models[language], self.bigram_models[language],
+                                                unigram_model)
+
+    def substitution_map(self, model_language, corpus_language):
+        return {v: k for k, v in self.token_mapping.get((model_language, corpus_language), {}).iteritems()}
+
+    def distance(self, model_language, corpus_language):
+        shared_vocabulary = self.vocabularies[model_language] | self.vocabularies[corpus_language]
+        token_map = self.substitution_map(model_language, corpus_language)
+        histogram = self.histograms[corpus_language]
+        model = self.model(model_language, shared_vocabulary)
+
+        if self.distance_measure == "perplexity":
+            return histogram.perplexity(model, substitution_map=token_map)
+        elif self.distance_measure == "kita":
+            corpus_model = self.model(corpus_language, shared_vocabulary)
+            return histogram.kita_distance(model, corpus_model, substitution_map=token_map)
+        raise Exception("Unknown distance measure: {}".format(self.distance_measure))
+
+    def confusion_matrix(self, model_language, corpus_language):
+        """Expected counts of the model language's tokens predicted for each target token of the corpus.
+
+        As in trigram_model_distance, rows are the model language's sorted
+        vocabulary and an OOV row, columns the same plus OOV and STOP.
+
+        """
+        vocabulary = sorted(self.vocabularies[model_language])
+        shared_vocabulary = self.vocabularies[model_language] | self.vocabularies[corpus_language]
+        token_map = self.substitution_map(model_language, corpus_language)
+        histogram = self.histograms[corpus_language]
+        model = self.model(model_language, shared_vocabulary)
+        oov = len(vocabulary)
+
+        if model_symbols(model) is not self.symbols:
+            token2id = {token: index for index, token in enumerate(vocabulary)}
+            matrix = np.zeros((oov + 1, oov + 2), dtype=np.float64)
+            for transition, count in histogram.transition_count.iteritems():
+                ctx1, ctx2, target = (token_map.get(item, item) for item in transition)
+                row = token2id.get(target, oov)
+                for column, item in enumerate(vocabulary):
+                    probability = model.probability((ctx1, ctx2, item), None)
+                    if probability is not None:
+                        matrix[row, column] += count * probability
+            return matrix.astype(np.float32)
+
+        ids, counts = histogram.substituted_ids(self.symbols, token_map)
+        vocabulary_ids = np.array([self.symbols.add(token) for token in vocabulary], dtype=np.int64)
+        rows = np.full(len(self.symbols), oov, dtype=np.int64)
+        rows[vocabulary_ids] = np.arange(oov)
+        contexts, context_index = np.unique(ids[:, :2], axis=0, return_inverse=True)
+
+        # Probability of every vocabulary item after every context, and the
+        # counts of each target after each context
+        probabilities = batch_probability(model, (np.repeat(contexts[:, 0], oov),
+                                                  np.repeat(contexts[:, 1], oov),
+                                                  np.tile(vocabulary_ids, len(contexts))))
+        probabilities = np.nan_to_num(probabilities).reshape(len(contexts), oov)
+        target_counts = np.zeros((oov + 1, len(contexts)), dtype=np.float64)
+        np.add.at(target_counts, (rows[ids[:, 2]], context_index), counts)
+
+        matrix = np.zeros((oov + 1, oov + 2), dtype=np.float32)
+        matrix[:, :oov] = target_counts.dot(probabilities)
+        return matrix
+
+    def corpus_distances(self, corpus_language):
+        return {(model_language, corpus_language): self.distance(model_language, corpus_language)
+                for model_language in sorted(self.trigram_models)}
+
+    def matrix(self):
+        """All distances at once as matrix products; see ngram.all_pairs.
+
+        The unigram models are smoothed over the vocabulary of all languages
+        rather than that of each pair, so with additive smoothing the
+        distances differ slightly from distance().
+
+        """
+        vocabulary = set().union(*self.vocabularies.values())
+        models = {language: self.model(language, vocabulary) for language in self.trigram_models}
+        substitution_maps = {(model_language, corpus_language): self.substitution_map(model_language, corpus_language)
+                             for model_language in self.trigram_models for corpus_language in self.histograms}
+
+        if self.distance_measure == "perplexity":
+            return perplexity_matrix(self.histograms, models, substitution_maps, self.symbols)
+        elif self.distance_measure == "kita":
+            return kita_matrix(self.histograms, models, models, substitution_maps, self.symbols)
+        raise Exception("Unknown distance measure: {}".format(self.distance_measure))
+
+
+# Set in the pool processes so the models aren't sent along with every corpus
+_distances = None
+
+
+def _init_worker(distances):
+    global _distances
+    _distances = distances
+
+
+def _corpus_distances(corpus_language):
+    return _distances.corpus_distances(corpus_language)
+
+
+def all_pairs(distances, processes=1):
+    """Scores every (model language, corpus language) pair, one corpus per task."""
+    corpus_languages = sorted(distances.histograms)
+    result = {}
+    if processes <= 1:
+        for corpus_language in corpus_languages:
+            result.update(distances.corpus_distances(corpus_language))
+        return result
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(distances,))
+    try:
+        for corpus_result in pool.imap_unordered(_corpus_distances, corpus_languages):
+            result.update(corpus_result)
+    finally:
+        pool.terminate()
+        pool.join()
+    return result
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import codecs
+
+from pimlico.core.modules.base import BaseModuleExecutor
+from pimlico.datatypes.dictionary import DictionaryData
+from dlt.datatypes.ngram import LanguageDistancesTypeWriter
+from dlt.language_distances import LanguageDistances, all_pairs
+from dlt.utils import read_token_mapping
+from langsim.datatypes.confusion import ConfusionMatricesWriter
+from ngram.histogram import TransitionHistogram
+
+
+class ModuleExecutor(BaseModuleExecutor):
+    def execute(self):
+        token_count = self.info.options["count"]
+        distance_measure = self.info.options["distance_measure"]
+
+        with codecs.open(self.info.get_input("token_mapping").absolute_path, 'r', encoding='utf-8') as f:
+            token_mapping = read_token_mapping(f)
+
+        lang_names = {}
+        vocabularies = {}
+        unigram_inputs = {}
+        for model_input in self.info.get_input("unigram_models"):
+            language = model_input.module.module_variables["lang_code"]
+            lang_names[language] = model_input.module.module_variables["lang"]
+            vocabularies[language] = model_input.read_vocabulary()
+            unigram_inputs[language] = model_input
+        symbols = self.info.get_input("vocabulary").read_symbols()
+        all_vocabulary = set(symbols.id2token)
+
+        unigram_counts = {language: model_input.read_model(symbols=symbols).token_counts
+                          for language, model_input in unigram_inputs.iteritems()}
+        bigram_models = {}
+        for model_input in self.info.get_input("bigram_models"):
+            bigram_models[model_input.module.module_variables["lang_code"]] = \
+                model_input.read_model(additional_vocabulary=all_vocabulary, symbols=symbols)
+        trigram_models = {}
+        for model_input in self.info.get_input("trigram_models"):
+            trigram_models[model_input.module.module_variables["lang_code"]] = \
+                model_input.read_model(additional_vocabulary=all_vocabulary, symbols=symbols)
+        self.log.info(u'Read in models for {} languages: {}'
+                      .format(len(trigram_models), u', '.join(sorted(trigram_models))))
+
+        # Each test corpus is kept as its trigram histogram
+        histograms = {}
+        for corpus in self.info.get_input("corpora"):
+            language = corpus.module.module_variables["lang_code"]
+            batch = corpus.read_batch(symbols, token_count)
+            if len(batch) < token_count:
+                raise Exception(u"Not enough tokens found for {}".format(language))
+            histograms[language] = TransitionHistogram.from_batch(batch, 3)
+            self.log.info(u'Corpus for {} read, {} distinct trigrams'
+                          .format(language, len(histograms[language].transition_count)))
+
+        distances = LanguageDistances(histograms, vocabularies, unigram_counts, bigram_models, trigram_models,
+                                      token_mapping, symbols,
+                                      interpolation_method=self.info.options["interpolation_method"],
+                                      additive_smoothing=self.info.options["additive_smoothing"],
+                                      additive_smoothing_a=self.info.options["additive_smoothing_a"],
+                                      distance_measure=distance_measure)
+        if self.info.options["method"] == "matrix":
+            result = distances.matrix()
+        else:
+            result = all_pairs(distances, processes=self.info.options["processes"])
+        self.log.info(u'{} distances ({}) computed'.format(len(result), distance_measure))
+
+        with LanguageDistancesTypeWriter(self.info.get_absolute_output_dir("distances")) as writer:
+            writer.distances = result
+            writer.lang_names = lang_names
+            writer.label = distance_measure
+
+        with ConfusionMatricesWriter(self.info.get_absolute_output_dir("confusion_matrices")) as writer:
+            for model_language in sorted(trigram_models):
+                vocab = DictionaryData()
+                vocab.token2id = {token: index for index, token in enumerate(sorted(vocabularies[model_language]))}
+                for corpus_language in sorted(histograms):
+                    writer.store_matrix(u"{}-{}".format(model_language, corpus_language),
+                                        lang_names[model_language], lang_names[corpus_language], vocab,
+                                        distances.confusion_matrix(model_language, corpus_language))
+        self.log.info(u'Confusion matrices written')
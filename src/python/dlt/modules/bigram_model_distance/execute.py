@@ -24,15 +24,11 @@ import codecs
 import numpy as np
 
 from langsim.datatypes.confusion import ConfusionMatrixWriter
-from dlt.kita_tokenizer import token_gen as kita_token_gen
 from dlt.modules.trigram_model_distance.execute import model_pimlico_vocabulary
-from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_token_gen
-from dlt.text_tokenizer import token_gen as text_token_gen
-from dlt.utils import read_token_mapping
-from ngram.models import BigramModel, BigramModelPerplexitySink, UnigramModel, DeletedInterpolationBigramModel, \
-    BigramModelKitaDistanceSink
+from dlt.ngram_counting import count_tokens
+from dlt.utils import read_token_mapping, corpus_tokenizer
+from ngram.models import BigramModelPerplexitySink, DeletedInterpolationBigramModel, BigramModelKitaDistanceSink
 from pimlico.core.modules.base import BaseModuleExecutor
-from pimlico.datatypes.base import InvalidDocument
 from pimlico.datatypes.results import NumericResultWriter
 
 _is_pypy = '__pypy__' in sys.builtin_module_names
@@ -53,26 +49,19 @@ class ModuleExecutor(BaseModuleExecutor):
         additive_smoothing_a = self.info.options["additive_smoothing_a"]
         distance_measure = self.info.options["distance_measure"]
 
-        with codecs.open(corpus_ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_vocabulary = UnigramModel.read_from_file(f).vocabulary
-        with codecs.open(ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            original_unigram_model = UnigramModel.read_from_file(f)
-            model_vocabulary = original_unigram_model.vocabulary
+        corpus_vocabulary = corpus_ug_model.read_vocabulary()
+        model_vocabulary = ug_model.read_vocabulary()
         shared_vocabulary = corpus_vocabulary | model_vocabulary
 
-        with codecs.open(ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            unigram_model = UnigramModel.read_from_file(f, additive_smoothing=additive_smoothing,
-                                                        additive_smoothing_a=additive_smoothing_a,
-                                                        additional_vocabulary=shared_vocabulary)
-        with codecs.open(corpus_ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_unigram_model = UnigramModel.read_from_file(f, additive_smoothing=additive_smoothing,
-                                                               additive_smoothing_a=additive_smoothing_a,
-                                                               additional_vocabulary=shared_vocabulary)
+        unigram_model = ug_model.read_model(additive_smoothing=additive_smoothing,
+                                            additive_smoothing_a=additive_smoothing_a,
+                                            additional_vocabulary=shared_vocabulary)
+        corpus_unigram_model = corpus_ug_model.read_model(additive_smoothing=additive_smoothing,
+                                                          additive_smoothing_a=additive_smoothing_a,
+                                                          additional_vocabulary=shared_vocabulary)
 
-        with codecs.open(bg_model.absolute_path, 'r', encoding='utf-8') as f:
-            bigram_model = BigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary)
-        with codecs.open(corpus_bg_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_bigram_model = BigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary)
+        bigram_model = bg_model.read_model(additional_vocabulary=shared_vocabulary)
+        corpus_bigram_model = corpus_bg_model.read_model(additional_vocabulary=shared_vocabulary)
 
         model_language = bg_model.module.module_variables["lang_code"]
         corpus_language = corpus.module.module_variables["lang_code"]
@@ -80,14 +69,7 @@ class ModuleExecutor(BaseModuleExecutor):
             token_map = {v: k
                          for k, v in read_token_mapping(f).get((model_language, corpus_language), {}).iteritems()}
 
-        if token_type == "text":
-            tokenizer = text_token_gen
-        elif token_type == "phonemes":
-            tokenizer = phoneme_token_gen
-        elif token_type == "kita":
-            tokenizer = kita_token_gen
-        else:
-            raise Exception("Unknown token type: {}".format(token_type))
+        tokenizer = corpus_tokenizer(corpus, token_type)
 
         if interpolation_method == "deleted":
             eff_bg_model = DeletedInterpolationBigramModel(bigram_model, unigram_model)
@@ -101,35 +83,13 @@ class ModuleExecutor(BaseModuleExecutor):
         elif distance_measure == "kita":
             sink = BigramModelKitaDistanceSink(eff_bg_model, eff_corpus_bg_model, substitution_map=token_map)
 
-        docs_processed = 0
-        lines_processed = 0
-        tokens_processed = 0
-        docs_skipped = 0
-        for doc_name, doc_text in corpus:
-            self.log.debug(u"Processing {}".format(doc_name))
-            if isinstance(doc_text, InvalidDocument):
-                self.log.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
-                docs_skipped += 1
-                continue
-
-            for line in doc_text:
-                for token in tokenizer(line):
-                    sink.handle(token)
-                    tokens_processed += 1
-                    if tokens_processed >= token_count:
-                        break
-                if tokens_processed >= token_count:
-                    break
-                lines_processed += 1
-            if tokens_processed >= token_count:
-                break
-            docs_processed += 1
-
-        self.log.info(u"{} documents skipped".format(docs_skipped))
+        statistics = count_tokens(corpus, tokenizer, sink, token_count, self.log)
+
+        self.log.info(u"{} documents skipped".format(statistics.docs_skipped))
         self.log.info(u"{} documents, {} lines and {} tokens processed"
-                      .format(docs_processed, lines_processed, tokens_processed))
+                      .format(statistics.docs_processed, statistics.lines_processed, statistics.tokens_processed))
 
-        if tokens_processed < token_count:
+        if statistics.tokens_processed < token_count:
             raise Exception("Not enough tokens found")
 
         distance = sink.distance()
@@ -141,7 +101,7 @@ class ModuleExecutor(BaseModuleExecutor):
 
         # Confusion matrix
         with ConfusionMatrixWriter(self.info.get_absolute_output_dir("confusion_matrix")) as writer:
-            model_vocab = model_pimlico_vocabulary(original_unigram_model)
+            model_vocab = model_pimlico_vocabulary(model_vocabulary)
             writer.store_vocab(model_vocab)
 
             # Initialize a regular Python list of lists for PyPy, numpy array for CPython. Numpy array access is
@@ -22,6 +22,7 @@ from pimlico.core.dependencies.python import numpy_dependency
 from langsim.datatypes.confusion import ConfusionMatrix
 from dlt.datatypes.ngram import TokenMappingType, BigramModelType, UnigramFrequencyType
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
+from dlt.datatypes.tokenized import TokenizedCorpusType
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.core.modules.options import choose_from_list, str_to_bool
 from pimlico.datatypes.results import NumericResult
@@ -32,7 +33,7 @@ class ModuleInfo(BaseModuleInfo):
     module_type_name = "bigram_model_distance"
     module_inputs = [("unigram_model", UnigramFrequencyType),
                      ("bigram_model", BigramModelType),
-                     ("corpus", TarredCorpusType(RawTextLinesDocumentType)),
+                     ("corpus", (TarredCorpusType(RawTextLinesDocumentType), TokenizedCorpusType)),
                      ("corpus_unigram_model", UnigramFrequencyType),
                      ("corpus_bigram_model", BigramModelType),
                      ("token_mapping", TokenMappingType)]
@@ -40,8 +41,7 @@ class ModuleInfo(BaseModuleInfo):
                       ("confusion_matrix", ConfusionMatrix)]
     module_options = {
         "token_type": {
-            "help": "Type of token: either 'text', 'phonemes' or 'kita'.",
-            "required": True,
+            "help": "Type of token: either 'text', 'phonemes' or 'kita'. Only needed for a raw text corpus.",
             "type": choose_from_list(["text", "phonemes", "kita"]),
         },
         "count": {
@@ -0,0 +1,64 @@
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import os
+import tarfile
+
+from pimlico.core.modules.base import BaseModuleExecutor
+from pimlico.datatypes.base import InvalidDocument
+
+from dlt.datatypes.corpus_index import CorpusIndexTypeWriter
+from dlt.utils import tokenizer_module
+from ngram.packed import SymbolTable
+
+
+def _members(path):
+    with tarfile.open(path) as archive:
+        return dict((member.name, member) for member in archive)
+
+
+class ModuleExecutor(BaseModuleExecutor):
+    def execute(self):
+        corpus = self.info.get_input("corpus")
+        token_type = self.info.options["token_type"]
+        tokenizer = tokenizer_module(token_type).token_batch
+
+        symbols = SymbolTable()
+        docs_skipped = 0
+        archive_path, members = None, None
+        with CorpusIndexTypeWriter(self.info.get_absolute_output_dir("index"), token_type) as writer:
+            for archive_name, doc_name, doc_text in corpus.archive_iter():
+                self.log.debug(u"Processing {}".format(doc_name))
+                if isinstance(doc_text, InvalidDocument):
+                    self.log.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
+                    docs_skipped += 1
+                    continue
+
+                path = os.path.abspath(os.path.join(corpus.data_dir, archive_name))
+                if path != archive_path:
+                    archive_path, members = path, _members(path)
+                if doc_name not in members:
+                    raise Exception(u"Document {} not found in {}".format(doc_name, archive_path))
+                member = members[doc_name]
+                writer.add_document(archive_path, doc_name, member.offset_data, member.size, len(doc_text),
+                                    sum(len(tokenizer(line, symbols)) for line in doc_text))
+
+            self.log.info(u"{} documents skipped".format(docs_skipped))
+            self.log.info(u"{} documents, {} lines and {} tokens indexed"
+                          .format(len(writer.document_names), sum(writer.line_counts), sum(writer.token_counts)))
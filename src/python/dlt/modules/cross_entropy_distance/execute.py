@@ -23,7 +23,6 @@ import codecs
 import math
 
 from dlt.utils import read_token_mapping
-from ngram.models import UnigramModel
 from pimlico.core.modules.base import BaseModuleExecutor
 from pimlico.datatypes.results import NumericResultWriter
 
@@ -35,10 +34,8 @@ class ModuleExecutor(BaseModuleExecutor):
         token_mapping = self.info.get_input("token_mapping")
         min_frequency = self.info.options["min_frequency"]
 
-        with codecs.open(model_a_input.absolute_path, 'r', encoding='utf-8') as f:
-            model_a = UnigramModel.read_from_file(f)
-        with codecs.open(model_b_input.absolute_path, 'r', encoding='utf-8') as f:
-            model_b = UnigramModel.read_from_file(f)
+        model_a = model_a_input.read_model()
+        model_b = model_b_input.read_model()
 
         model_a_language = model_a_input.module.module_variables["lang"]
         model_b_language = model_b_input.module.module_variables["lang"]
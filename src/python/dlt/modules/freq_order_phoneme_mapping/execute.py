@@ -19,14 +19,15 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
-import codecs
 from operator import itemgetter
 
 from dlt import thresholded_phoneme_map
 from dlt.datatypes.ngram import TokenMappingTypeWriter
+from dlt.datatypes.tokenized import TokenizedCorpusType
 from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_tokenizer
-from ngram.models import UnigramModel, BigramModel, BigramModelPerplexitySink, UnigramModelPerplexitySink, \
-    TrigramModelPerplexitySink, TrigramModel
+from dlt.text_tokenizer import Token
+from ngram.models import BigramModelPerplexitySink, UnigramModelPerplexitySink, TrigramModelPerplexitySink
+from ngram.packed import SymbolTable
 from pimlico.core.modules.base import BaseModuleExecutor
 from pimlico.datatypes import InvalidDocument
 
@@ -171,6 +172,19 @@ def find_mappings(ug_a, ug_b, bg_a, bg_b, tr_a, tr_b, corpus_a, corpus_b, phonem
 
 
 def _read_tokens(corpus, token_count, logger):
+    if isinstance(corpus, TokenizedCorpusType):
+        result = [Token(*row) for row in corpus.read_batch(SymbolTable(), token_count).rows()]
+    else:
+        result = _tokenize(corpus, token_count, logger)
+
+    if len(result) < token_count:
+        raise Exception(u'Not enough tokens in input, expected at least {}, got {}'
+                        .format(token_count, len(result)))
+
+    return result
+
+
+def _tokenize(corpus, token_count, logger):
     result = []
     tokens_processed = 0
     for doc_name, doc_text in corpus:
@@ -190,10 +204,6 @@ def _read_tokens(corpus, token_count, logger):
         if tokens_processed >= token_count:
             break
 
-    if len(result) < token_count:
-        raise Exception(u'Not enough tokens in input, expected at least {}, got {}'
-                        .format(token_count, len(result)))
-
     return result
 
 
@@ -212,11 +222,11 @@ class ModuleExecutor(BaseModuleExecutor):
             corpora[language] = _read_tokens(corpora_input, token_count, self.log)
         self.log.info(u'Corpora read.')
 
+        symbols = SymbolTable()
         unigram_models = {}
         for model_input in unigram_model_inputs:
             language = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                unigram_models[language] = UnigramModel.read_from_file(f)
+            unigram_models[language] = model_input.read_model(symbols=symbols)
 
         self.log.info(u'Read in {} unigram distributions, languages: {}'
                       .format(len(unigram_models.keys()), u', '.join(unigram_models.keys())))
@@ -224,8 +234,7 @@ class ModuleExecutor(BaseModuleExecutor):
         bigram_models = {}
         for model_input in bigram_model_inputs:
             language = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                bigram_models[language] = BigramModel.read_from_file(f)
+            bigram_models[language] = model_input.read_model(symbols=symbols)
 
         self.log.info(u'Read in {} bigram distributions, languages: {}'
                       .format(len(bigram_models.keys()), u', '.join(bigram_models.keys())))
@@ -233,8 +242,7 @@ class ModuleExecutor(BaseModuleExecutor):
         trigram_models = {}
         for model_input in trigram_model_inputs:
             language = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                trigram_models[language] = TrigramModel.read_from_file(f)
+            trigram_models[language] = model_input.read_model(symbols=symbols)
 
         self.log.info(u'Read in {} trigram distributions, languages: {}'
                       .format(len(bigram_models.keys()), u', '.join(bigram_models.keys())))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+from __future__ import print_function
+
+import shutil
+
+import codecs
+import os
+from pimlico.core.modules.base import BaseModuleExecutor
+
+from dlt.datatypes.ngram import UnigramFrequencyTypeWriter, BigramModelTypeWriter, TrigramModelTypeWriter
+from dlt.modules.word_length.execute import WordLengthSink
+from ngram.models import MultiOrderModelBuilderTokenSink, UnigramModel, BigramModel, TrigramModel
+from ngram.packed import SymbolTable
+
+
+class MultiOrderModelAndWordLengthSink(MultiOrderModelBuilderTokenSink):
+    def __init__(self, logger):
+        super(MultiOrderModelAndWordLengthSink, self).__init__(logger)
+        self.word_length_sink = WordLengthSink(logger)
+
+    def handle(self, token):
+        super(MultiOrderModelAndWordLengthSink, self).handle(token)
+        self.word_length_sink.handle(token)
+
+    def handle_batch(self, batch):
+        super(MultiOrderModelAndWordLengthSink, self).handle_batch(batch)
+        self.word_length_sink.handle_batch(batch)
+
+
+class ModuleExecutor(BaseModuleExecutor):
+    def execute(self):
+        corpus = self.info.get_input("tokens")
+        token_count = self.info.options["count"]
+        word_length = self.info.options["word_length"]
+        text_copy = self.info.options["text_copy"]
+
+        if word_length:
+            sink = MultiOrderModelAndWordLengthSink(self.log)
+        else:
+            sink = MultiOrderModelBuilderTokenSink(self.log)
+        batch = corpus.read_batch(SymbolTable(), token_count)
+        if len(batch) < token_count:
+            raise Exception("Not enough tokens found")
+        sink.handle_batch(batch)
+        self.log.info(u"{} tokens processed".format(len(batch)))
+
+        with UnigramFrequencyTypeWriter(self.info.get_absolute_output_dir("frequency_mapping")) as writer:
+            writer.write_model(UnigramModel(sink.token_counts), text_copy=text_copy)
+        with BigramModelTypeWriter(self.info.get_absolute_output_dir("bigram_model")) as writer:
+            writer.write_model(BigramModel(sink.bigram_counts), text_copy=text_copy)
+        with TrigramModelTypeWriter(self.info.get_absolute_output_dir("trigram_model")) as writer:
+            writer.write_model(TrigramModel(sink.trigram_counts), text_copy=text_copy)
+
+        if word_length:
+            lengths = sink.word_length_sink.lengths
+            output_dir = self.info.get_absolute_output_dir("word_length")
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.mkdir(output_dir)
+            with codecs.open(os.path.join(output_dir, 'word_length.txt'), 'w', encoding='utf-8') as f:
+                wl = sum(lengths) / float(len(lengths))
+                self.log.info(u'Word length: {}'.format(wl))
+                print(str(wl), file=f)
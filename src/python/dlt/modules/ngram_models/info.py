@@ -0,0 +1,56 @@
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+from pimlico.core.dependencies.python import numpy_dependency
+from pimlico.core.modules.base import BaseModuleInfo
+from pimlico.core.modules.options import str_to_bool
+from pimlico.datatypes.files import NamedFile
+
+from dlt.datatypes.ngram import UnigramFrequencyType, BigramModelType, TrigramModelType
+from dlt.datatypes.tokenized import TokenizedCorpusType
+
+
+class ModuleInfo(BaseModuleInfo):
+    module_type_name = "ngram_models"
+    module_inputs = [("tokens", TokenizedCorpusType)]
+    module_outputs = [("frequency_mapping", UnigramFrequencyType),
+                      ("bigram_model", BigramModelType),
+                      ("trigram_model", TrigramModelType),
+                      ("word_length", NamedFile("word_length.txt"))]
+    module_options = {
+        "count": {
+            "help": "How many tokens to process",
+            "required": True,
+            "type": int,
+        },
+        "word_length": {
+            "help": "Also compute the mean word length into the word_length output. Default: False",
+            "type": str_to_bool,
+            "default": False,
+        },
+        "text_copy": {
+            "help": "Also write the models as text next to the binary model files, like the unigram_model, "
+                    "bigram_model and trigram_model modules do. Default: True",
+            "type": str_to_bool,
+            "default": True,
+        },
+    }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
@@ -24,10 +24,12 @@ from operator import itemgetter
 
 from dlt import thresholded_phoneme_map
 from dlt.datatypes.ngram import TokenMappingTypeWriter
+from dlt.datatypes.tokenized import TokenizedCorpusType
 from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_tokenizer
 from dlt.utils import read_token_mapping
-from ngram.models import UnigramModel, BigramModel, BigramModelPerplexitySink, UnigramModelPerplexitySink, \
-    TrigramModelPerplexitySink, TrigramModel, DeletedInterpolationBigramModel, DeletedInterpolationTrigramModel
+from ngram.histogram import TransitionHistogram, HistogramPerplexityScorer
+from ngram.models import DeletedInterpolationBigramModel, DeletedInterpolationTrigramModel
+from ngram.packed import SymbolTable
 from pimlico.core.modules.base import BaseModuleExecutor
 from pimlico.datatypes import InvalidDocument
 
@@ -49,41 +51,38 @@ def find_missing_from_b(dist_a, dist_b, existing_mapping, logger, lang_a_name='A
     return result
 
 
+def _perplexity(model, sub_map, corpus):
+    # The corpus is a trigram histogram, scored at the order of the model
+    return corpus.marginal(model.order).perplexity(model, substitution_map=sub_map)
+
+
 def bigram_perplexity(bigram_model, sub_map, corpus):
-    sink = BigramModelPerplexitySink(bigram_model, substitution_map=sub_map)
-    for token in corpus:
-        sink.handle(token)
-    return sink.distance()
+    return _perplexity(bigram_model, sub_map, corpus)
 
 
 def unigram_perplexity(unigram_model, sub_map, corpus):
-    sink = UnigramModelPerplexitySink(unigram_model, substitution_map=sub_map)
-    for token in corpus:
-        sink.handle(token)
-    return sink.distance()
+    return _perplexity(unigram_model, sub_map, corpus)
 
 
 def trigram_perplexity(trigram_model, sub_map, corpus):
-    sink = TrigramModelPerplexitySink(trigram_model, substitution_map=sub_map)
-    for token in corpus:
-        sink.handle(token)
-    return sink.distance()
+    return _perplexity(trigram_model, sub_map, corpus)
 
 
 def find_best_candidate(original, bigram_model, trigram_model, corpus, phoneme_similarities, candidates,
                         substitution_map, logger):
     perplexity_with_candidate = {}
 
-    original_bigram_perplexity = bigram_perplexity(bigram_model, substitution_map, corpus)
-    original_trigram_perplexity = trigram_perplexity(trigram_model, substitution_map, corpus)
+    # Candidates only change the transitions they appear in; rescore just those
+    bigram_scorer = HistogramPerplexityScorer(corpus.marginal(2), bigram_model, substitution_map)
+    trigram_scorer = HistogramPerplexityScorer(corpus.marginal(3), trigram_model, substitution_map)
+    original_bigram_perplexity = bigram_scorer.perplexity()
+    original_trigram_perplexity = trigram_scorer.perplexity()
     logger.info(u'Original perplexity (bg / tg): {} / {}'.format(original_bigram_perplexity,
                                                                  original_trigram_perplexity))
 
     for candidate in candidates:
-        sub_map = substitution_map.copy()
-        sub_map[candidate] = original
-        bg_perplexity = bigram_perplexity(bigram_model, sub_map, corpus)
-        tg_perplexity = trigram_perplexity(trigram_model, sub_map, corpus)
+        bg_perplexity = bigram_scorer.perplexity_with(candidate, original)
+        tg_perplexity = trigram_scorer.perplexity_with(candidate, original)
         phoneme_similarity = phoneme_similarities[(original, candidate)]
         logger.info(u' {} => {}: bg: {} / tg: {}; impr. {} / {}; p-s: {}'
                     .format(original, candidate, bg_perplexity, tg_perplexity,
@@ -178,11 +177,22 @@ def _read_tokens(corpus, token_count, logger):
         if tokens_processed >= token_count:
             break
 
-    if len(result) < token_count:
+    _check_token_count(len(result), token_count)
+    return result
+
+
+def _check_token_count(tokens_read, token_count):
+    if tokens_read < token_count:
         raise Exception(u'Not enough tokens in input, expected at least {}, got {}'
-                        .format(token_count, len(result)))
+                        .format(token_count, tokens_read))
 
-    return result
+
+def _read_histogram(corpus, token_count, logger):
+    if isinstance(corpus, TokenizedCorpusType):
+        batch = corpus.read_batch(SymbolTable(), token_count)
+        _check_token_count(len(batch), token_count)
+        return TransitionHistogram.from_batch(batch, 3)
+    return TransitionHistogram.from_tokens(_read_tokens(corpus, token_count, logger), 3)
 
 
 class ModuleExecutor(BaseModuleExecutor):
@@ -198,18 +208,19 @@ class ModuleExecutor(BaseModuleExecutor):
         with codecs.open(self.info.get_input("previous_mappings").absolute_path, 'r', encoding='utf-8') as f:
             token_mapping = read_token_mapping(f)
 
+        symbols = SymbolTable()
         corpora = {}
         for corpora_input in corpora_inputs:
             language = corpora_input.module.module_variables["lang"]
             self.log.info(u'Reading corpus for {}...'.format(language))
-            corpora[language] = _read_tokens(corpora_input, token_count, self.log)
+            corpora[language] = _read_histogram(corpora_input, token_count, self.log)
         self.log.info(u'Corpora read.')
 
         unigram_models = {}
         for model_input in unigram_model_inputs:
             language = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                unigram_models[language] = UnigramModel.read_from_file(f, additive_smoothing=additive_smoothing)
+            unigram_models[language] = model_input.read_model(additive_smoothing=additive_smoothing,
+                                                              symbols=symbols)
 
         self.log.info(u'Read in {} unigram distributions, languages: {}'
                       .format(len(unigram_models.keys()), u', '.join(unigram_models.keys())))
@@ -217,8 +228,8 @@ class ModuleExecutor(BaseModuleExecutor):
         bigram_models = {}
         for model_input in bigram_model_inputs:
             language = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                bigram_models[language] = BigramModel.read_from_file(f, additive_smoothing=additive_smoothing)
+            bigram_models[language] = model_input.read_model(additive_smoothing=additive_smoothing,
+                                                             symbols=symbols)
 
         self.log.info(u'Read in {} bigram distributions, languages: {}'
                       .format(len(bigram_models.keys()), u', '.join(bigram_models.keys())))
@@ -226,8 +237,8 @@ class ModuleExecutor(BaseModuleExecutor):
         trigram_models = {}
         for model_input in trigram_model_inputs:
             language = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                trigram_models[language] = TrigramModel.read_from_file(f, additive_smoothing=additive_smoothing)
+            trigram_models[language] = model_input.read_model(additive_smoothing=additive_smoothing,
+                                                              symbols=symbols)
 
         self.log.info(u'Read in {} trigram distributions, languages: {}'
                       .format(len(bigram_models.keys()), u', '.join(bigram_models.keys())))
@@ -252,8 +263,8 @@ class ModuleExecutor(BaseModuleExecutor):
             ug_model = unigram_models[language]
             bg_model = bigram_models[language]
             if interpolation_method == "deleted":
-                eff_bg_models[language] = DeletedInterpolationBigramModel(bg_model, ug_model)
-                eff_tg_models[language] = DeletedInterpolationTrigramModel(tg_model, bg_model, ug_model)
+                eff_bg_models[language] = DeletedInterpolationBigramModel(bg_model, ug_model).compile()
+                eff_tg_models[language] = DeletedInterpolationTrigramModel(tg_model, bg_model, ug_model).compile()
             elif interpolation_method == "none":
                 eff_bg_models[language] = bg_model
                 eff_tg_models[language] = tg_model
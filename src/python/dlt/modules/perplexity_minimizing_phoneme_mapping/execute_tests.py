@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+#
+import logging
+import unittest
+from operator import itemgetter
+
+from dlt.modules.perplexity_minimizing_phoneme_mapping.execute import find_mappings, find_missing_from_b
+from ngram.histogram import TransitionHistogram
+from ngram.models import BigramModelPerplexitySink, TrigramModelPerplexitySink, DeletedInterpolationBigramModel, \
+    DeletedInterpolationTrigramModel
+from ngram.packed import SymbolTable
+from ngram.testing import Token, random_tokens, build_models
+
+
+def sink_perplexity(sink, tokens):
+    for token in tokens:
+        sink.handle(token)
+    return sink.distance()
+
+
+def reference_mappings(unigram_a, unigram_b, bigram_a, trigram_a, tokens_b, phoneme_similarities,
+                       min_phoneme_similarity):
+    """The mappings as chosen before histograms: rescoring the corpus tokens through the perplexity sinks.
+
+    Also gives the proportional improvements of the candidates for each
+    missing phoneme.
+
+    """
+    logger = logging.getLogger(__name__)
+    b_probs = sorted({k: v for k, v in unigram_b.token_probabilities.iteritems() if k != u'WB'}.items(),
+                     key=itemgetter(1), reverse=True)
+    result = []
+    all_improvements = []
+    substitution_map = {}
+    for m in find_missing_from_b(unigram_a, unigram_b, {}, logger):
+        candidates = [phoneme for phoneme, probability in b_probs
+                      if probability > 0.01 and phoneme_similarities.get((m, phoneme), 0) >= min_phoneme_similarity
+                      and phoneme not in substitution_map]
+        original_bigram_perplexity = sink_perplexity(BigramModelPerplexitySink(bigram_a, substitution_map), tokens_b)
+        original_trigram_perplexity = sink_perplexity(TrigramModelPerplexitySink(trigram_a, substitution_map),
+                                                      tokens_b)
+        improvements = {}
+        for candidate in candidates:
+            sub_map = substitution_map.copy()
+            sub_map[candidate] = m
+            bg_perplexity = sink_perplexity(BigramModelPerplexitySink(bigram_a, sub_map), tokens_b)
+            tg_perplexity = sink_perplexity(TrigramModelPerplexitySink(trigram_a, sub_map), tokens_b)
+            aggregate_improvement = (original_bigram_perplexity - bg_perplexity +
+                                     original_trigram_perplexity - tg_perplexity) / 2.0
+            improvements[candidate] = aggregate_improvement / ((bg_perplexity + tg_perplexity) / 2.0)
+        all_improvements.append(improvements)
+
+        best_candidate = None
+        for candidate, improvement in improvements.iteritems():
+            if best_candidate is None or improvements[best_candidate] < improvement:
+                best_candidate = candidate
+        if best_candidate is not None and improvements[best_candidate] > 0:
+            substitution_map[best_candidate] = m
+            result.append((m, best_candidate))
+    return result, all_improvements
+
+
+def swapped(tokens, a, b):
+    swap = {a: b, b: a}
+    return [Token(swap.get(token.letter, token.letter), token.is_beginning, token.is_ending) for token in tokens]
+
+
+class FindMappingsTest(unittest.TestCase):
+    def test_same_as_token_sinks(self):
+        symbols = SymbolTable()
+        vocabulary = set(u'abcdpqxyz') | {u'WB'}
+        similarities = {(original, candidate): 1.0 for original in vocabulary for candidate in vocabulary}
+        logger = logging.getLogger(__name__)
+        logger.addHandler(logging.NullHandler())
+        mappings = set()
+        for seed in xrange(8):
+            ug, bg, tg = build_models(random_tokens(u'aabcdpq', 3000, seed), symbols,
+                                      additional_vocabulary=vocabulary)
+            bigram_model = DeletedInterpolationBigramModel(bg, ug)
+            trigram_model = DeletedInterpolationTrigramModel(tg, bg, ug)
+            # x and y are interchangeable but for one word, so they come out nearly tied as candidates
+            half = random_tokens(u'abcdxyz', 1500, 100 + seed)
+            tokens = half + [Token(u'x', True, True)] + swapped(half, u'x', u'y')
+            corpus_ug = build_models(tokens, symbols, additional_vocabulary=vocabulary)[0]
+
+            expected, improvements = reference_mappings(ug, corpus_ug, bigram_model, trigram_model, tokens,
+                                                        similarities, 0.5)
+            self.assertAlmostEqual(improvements[0][u'x'], improvements[0][u'y'], delta=abs(improvements[0][u'x']) / 50)
+            self.assertEqual(expected, find_mappings(ug, corpus_ug, bigram_model.compile(), trigram_model.compile(),
+                                                     TransitionHistogram.from_tokens(tokens, 3), {}, similarities,
+                                                     0.5, logger))
+            mappings.add(tuple(expected))
+        # The near-ties go different ways with different seeds
+        self.assertGreater(len(mappings), 1)
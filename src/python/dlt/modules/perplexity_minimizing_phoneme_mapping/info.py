@@ -17,8 +17,11 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
+from pimlico.core.dependencies.python import numpy_dependency
+
 from dlt.datatypes.ngram import TokenMappingType, UnigramFrequencyType, BigramModelType, TrigramModelType
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
+from dlt.datatypes.tokenized import TokenizedCorpusType
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.core.modules.options import choose_from_list, str_to_bool
 from pimlico.datatypes.base import MultipleInputs
@@ -30,7 +33,7 @@ class ModuleInfo(BaseModuleInfo):
     module_inputs = [("unigram_models", MultipleInputs(UnigramFrequencyType)),
                      ("bigram_models", MultipleInputs(BigramModelType)),
                      ("trigram_models", MultipleInputs(TrigramModelType)),
-                     ("corpora", MultipleInputs(TarredCorpusType(RawTextLinesDocumentType))),
+                     ("corpora", MultipleInputs((TarredCorpusType(RawTextLinesDocumentType), TokenizedCorpusType))),
                      ("previous_mappings", TokenMappingType)]
     module_outputs = [("mappings", TokenMappingType)]
     module_options = {
@@ -69,3 +72,6 @@ class ModuleInfo(BaseModuleInfo):
             "default": 0.01
         }
     }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
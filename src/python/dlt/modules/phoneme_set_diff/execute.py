@@ -29,7 +29,6 @@ import codecs
 import math
 
 from dlt.utils import read_token_mapping
-from ngram.models import UnigramModel
 from pimlico.core.modules.base import BaseModuleExecutor
 from pimlico.datatypes.results import NumericResultWriter
 
@@ -39,10 +38,8 @@ class ModuleExecutor(BaseModuleExecutor):
         model_a_input = self.info.get_input("model_a")
         model_b_input = self.info.get_input("model_b")
 
-        with codecs.open(model_a_input.absolute_path, 'r', encoding='utf-8') as f:
-            model_a = UnigramModel.read_from_file(f)
-        with codecs.open(model_b_input.absolute_path, 'r', encoding='utf-8') as f:
-            model_b = UnigramModel.read_from_file(f)
+        model_a = model_a_input.read_model()
+        model_b = model_b_input.read_model()
 
         model_a_language = model_a_input.module.module_variables["lang"]
         model_b_language = model_b_input.module.module_variables["lang"]
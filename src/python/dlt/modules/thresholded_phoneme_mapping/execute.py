@@ -19,11 +19,8 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
-import codecs
-
 from dlt import thresholded_phoneme_map
 from dlt.datatypes.ngram import TokenMappingTypeWriter, TokenMappingMissingCandidatesTypeWriter
-from ngram.models import UnigramModel
 from pimlico.core.modules.base import BaseModuleExecutor
 
 
@@ -36,8 +33,7 @@ class ModuleExecutor(BaseModuleExecutor):
         for model_input in model_inputs:
             language = model_input.module.module_variables["lang_code"]
             lang_names[language] = model_input.module.module_variables["lang"]
-            with codecs.open(model_input.absolute_path, 'r', encoding='utf-8') as f:
-                models[language] = UnigramModel.read_from_file(f)
+            models[language] = model_input.read_model()
 
         self.log.info(u'Read in {} unigram distributions, languages: {}'
                       .format(len(models.keys()), u', '.join(models.keys())))
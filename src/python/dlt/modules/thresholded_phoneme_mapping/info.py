@@ -18,6 +18,7 @@
 # <http://www.gnu.org/licenses/>.
 #
 from dlt.datatypes.ngram import UnigramFrequencyType, TokenMappingType, TokenMappingMissingCandidatesType
+from pimlico.core.dependencies.python import numpy_dependency
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.datatypes.base import MultipleInputs
 
@@ -54,3 +55,6 @@ class ModuleInfo(BaseModuleInfo):
             "default": 0.01
         }
     }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
@@ -0,0 +1,49 @@
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+from pimlico.core.modules.base import BaseModuleExecutor
+from pimlico.datatypes.base import InvalidDocument
+
+from dlt.datatypes.tokenized import TokenizedCorpusTypeWriter
+from dlt.utils import tokenizer_module
+
+
+class ModuleExecutor(BaseModuleExecutor):
+    def execute(self):
+        corpus = self.info.get_input("corpus")
+        token_type = self.info.options["token_type"]
+        token_count = self.info.options["count"]
+        tokenizer = tokenizer_module(token_type).token_batch
+
+        docs_skipped = 0
+        with TokenizedCorpusTypeWriter(self.info.get_absolute_output_dir("tokens")) as writer:
+            for doc_name, doc_text in corpus:
+                if token_count is not None and len(writer.tokens) >= token_count:
+                    break
+                self.log.debug(u"Processing {}".format(doc_name))
+                if isinstance(doc_text, InvalidDocument):
+                    self.log.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
+                    docs_skipped += 1
+                    continue
+                writer.add_batch_document(doc_name, (tokenizer(line, writer.symbols) for line in doc_text))
+
+            self.log.info(u"{} documents skipped".format(docs_skipped))
+            self.log.info(u"{} documents, {} lines and {} tokens ({} distinct) written"
+                          .format(len(writer.document_names), len(writer.line_offsets) - 1, len(writer.tokens),
+                                  len(writer.vocabulary)))
@@ -22,9 +22,7 @@
 from pimlico.core.modules.base import BaseModuleExecutor
 
 from dlt.datatypes.ngram import SetSizeAndStatisticsTypeWriter
-from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_token_gen
-from dlt.text_tokenizer import token_gen as text_token_gen
-from dlt.utils import read_tokens, calculate_statistics_with_callable, random_range, next_size
+from dlt.utils import read_token_batch, corpus_tokenizer, calculate_statistics_with_callable, random_slice, next_size
 from ngram.models import TrigramModelBuilderTokenSink, TrigramModel, UnigramModelBuilderTokenSink, \
     BigramModelBuilderTokenSink, UnigramModel, BigramModel, \
     DeletedInterpolationTrigramModel, calculate_perplexity
@@ -34,10 +32,9 @@ def make_trigram_model(tokens, logger):
     ug_sink = UnigramModelBuilderTokenSink(logger)
     bg_sink = BigramModelBuilderTokenSink(logger)
     tg_sink = TrigramModelBuilderTokenSink(logger)
-    for token in tokens:
-        ug_sink.handle(token)
-        bg_sink.handle(token)
-        tg_sink.handle(token)
+    ug_sink.handle_batch(tokens)
+    bg_sink.handle_batch(tokens)
+    tg_sink.handle_batch(tokens)
 
     ug_model = UnigramModel(ug_sink.token_counts, additive_smoothing=True)
     bg_model = BigramModel(bg_sink.transition_counts)
@@ -49,16 +46,16 @@ def make_trigram_model(tokens, logger):
 def calculate_statistics_for_learning_set_size(expected_value, learning_tokens, learning_set_size,
                                                test_tokens, test_set_size, iterations, logger):
     def perplexity_calc():
-        learning_sample = random_range(learning_tokens, learning_set_size)
+        learning_sample = random_slice(learning_tokens, learning_set_size)
         language_model = make_trigram_model(learning_sample, logger)
-        test_sample = random_range(test_tokens, test_set_size)
+        test_sample = random_slice(test_tokens, test_set_size)
         return calculate_perplexity(language_model, test_sample)
     return calculate_statistics_with_callable(expected_value, perplexity_calc, iterations, logger)
 
 
 def calculate_statistics_for_test_set_size(desired_perplexity, language_model, test_tokens, size, sample_count, logger):
     def perplexity_calc():
-        test_sample = random_range(test_tokens, size)
+        test_sample = random_slice(test_tokens, size)
         return calculate_perplexity(language_model, test_sample)
     return calculate_statistics_with_callable(desired_perplexity, perplexity_calc, sample_count, logger)
 
@@ -201,12 +198,9 @@ class ModuleExecutor(BaseModuleExecutor):
         if start_test_token < 0:
             raise Exception("Start token is less than zero")
 
-        if token_type == "text":
-            tokenizer = text_token_gen
-        elif token_type == "phonemes":
-            tokenizer = phoneme_token_gen
+        tokenizer = corpus_tokenizer(corpus, token_type, batch=True)
 
-        tokens, tokens_processed = read_tokens(corpus, max_token_count, tokenizer, self.log)
+        tokens, tokens_processed = read_token_batch(corpus, max_token_count, tokenizer, self.log)
         self.log.info(u"{} tokens read".format(tokens_processed))
 
         held_out_tokens = tokens[0:held_out_set_size]
@@ -17,22 +17,23 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
+from pimlico.core.dependencies.python import numpy_dependency
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.datatypes.tar import TarredCorpusType
 from pimlico.core.modules.options import choose_from_list
 
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
 from dlt.datatypes.ngram import TrigramModelType
+from dlt.datatypes.tokenized import TokenizedCorpusType
 
 
 class ModuleInfo(BaseModuleInfo):
     module_type_name = "trigram_model"
-    module_inputs = [("corpus", TarredCorpusType(RawTextLinesDocumentType))]
+    module_inputs = [("corpus", (TarredCorpusType(RawTextLinesDocumentType), TokenizedCorpusType))]
     module_outputs = [("trigram_model", TrigramModelType)]
     module_options = {
         "token_type": {
-            "help": "Type of token: either 'text', 'phonemes' or 'kita'.",
-            "required": True,
+            "help": "Type of token: either 'text', 'phonemes' or 'kita'. Only needed for a raw text corpus.",
             "type": choose_from_list(["text", "phonemes", "kita"]),
         },
         "count": {
@@ -40,4 +41,12 @@ class ModuleInfo(BaseModuleInfo):
             "required": True,
             "type": int,
         },
+        "processes": {
+            "help": "Number of processes to count the corpus with, in shards of documents. Default: 1",
+            "type": int,
+            "default": 1,
+        },
     }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
@@ -26,23 +26,21 @@ import numpy as np
 
 from pimlico.datatypes.dictionary import DictionaryData
 from pimlico.core.modules.base import BaseModuleExecutor
-from pimlico.datatypes.base import InvalidDocument
 from pimlico.datatypes.results import NumericResultWriter
 from langsim.datatypes.confusion import ConfusionMatrixWriter
-from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_token_gen
-from dlt.text_tokenizer import token_gen as text_token_gen
-from dlt.kita_tokenizer import token_gen as kita_token_gen
-from dlt.utils import read_token_mapping
-from ngram.models import TrigramModel, TrigramModelPerplexitySink, BigramModel, UnigramModel, \
-    DeletedInterpolationTrigramModel, TrigramModelKitaDistanceSink
+from dlt.ngram_counting import read_batch
+from dlt.utils import read_token_mapping, corpus_tokenizer
+from ngram.batch import BatchPerplexityScorer, BatchKitaDistanceScorer
+from ngram.models import DeletedInterpolationTrigramModel
+from ngram.packed import SymbolTable
 
 
 _is_pypy = '__pypy__' in sys.builtin_module_names
 
 
-def model_pimlico_vocabulary(model):
+def model_pimlico_vocabulary(vocabulary):
     token2id = {}
-    for index, item in enumerate(sorted(model.vocabulary)):
+    for index, item in enumerate(sorted(vocabulary)):
         token2id[item] = index
     result = DictionaryData()
     result.token2id = token2id
@@ -66,34 +64,32 @@ class ModuleExecutor(BaseModuleExecutor):
         additive_smoothing_a = self.info.options["additive_smoothing_a"]
         distance_measure = self.info.options["distance_measure"]
 
-        with codecs.open(corpus_ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_vocabulary = UnigramModel.read_from_file(f).vocabulary
-        with codecs.open(ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            original_unigram_model = UnigramModel.read_from_file(f)
-            model_vocabulary = original_unigram_model.vocabulary
+        corpus_vocabulary = corpus_ug_model.read_vocabulary()
+        model_vocabulary = ug_model.read_vocabulary()
         shared_vocabulary = corpus_vocabulary | model_vocabulary
+        symbols = SymbolTable(sorted(shared_vocabulary))
 
-        with codecs.open(ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            unigram_model = UnigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary,
-                                                        additive_smoothing=additive_smoothing,
-                                                        additive_smoothing_a=additive_smoothing_a)
+        unigram_model = ug_model.read_model(additional_vocabulary=shared_vocabulary,
+                                            additive_smoothing=additive_smoothing,
+                                            additive_smoothing_a=additive_smoothing_a,
+                                            symbols=symbols)
 
-        with codecs.open(corpus_ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_unigram_model = UnigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary,
-                                                               additive_smoothing=additive_smoothing,
-                                                               additive_smoothing_a=additive_smoothing_a)
+        corpus_unigram_model = corpus_ug_model.read_model(additional_vocabulary=shared_vocabulary,
+                                                          additive_smoothing=additive_smoothing,
+                                                          additive_smoothing_a=additive_smoothing_a,
+                                                          symbols=symbols)
 
-        with codecs.open(bg_model.absolute_path, 'r', encoding='utf-8') as f:
-            bigram_model = BigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary)
+        bigram_model = bg_model.read_model(additional_vocabulary=shared_vocabulary,
+                                           symbols=symbols)
 
-        with codecs.open(corpus_bg_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_bigram_model = BigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary)
+        corpus_bigram_model = corpus_bg_model.read_model(additional_vocabulary=shared_vocabulary,
+                                                         symbols=symbols)
 
-        with codecs.open(tg_model.absolute_path, 'r', encoding='utf-8') as f:
-            trigram_model = TrigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary)
+        trigram_model = tg_model.read_model(additional_vocabulary=shared_vocabulary,
+                                            symbols=symbols)
 
-        with codecs.open(corpus_tg_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_trigram_model = TrigramModel.read_from_file(f, additional_vocabulary=shared_vocabulary)
+        corpus_trigram_model = corpus_tg_model.read_model(additional_vocabulary=shared_vocabulary,
+                                                          symbols=symbols)
 
         model_language = tg_model.module.module_variables["lang_code"]
 
@@ -102,60 +98,32 @@ class ModuleExecutor(BaseModuleExecutor):
             token_map = {v: k
                          for k, v in read_token_mapping(f).get((model_language, corpus_language), {}).iteritems()}
 
-        if token_type == "text":
-            tokenizer = text_token_gen
-        elif token_type == "phonemes":
-            tokenizer = phoneme_token_gen
-        elif token_type == "kita":
-            tokenizer = kita_token_gen
-        else:
-            raise Exception("Unknown token type: {}".format(token_type))
+        tokenizer = corpus_tokenizer(corpus, token_type)
 
         if interpolation_method == "deleted":
-            eff_tg_model = DeletedInterpolationTrigramModel(trigram_model, bigram_model, unigram_model)
+            eff_tg_model = DeletedInterpolationTrigramModel(trigram_model, bigram_model, unigram_model).compile()
             eff_corpus_tg_model = DeletedInterpolationTrigramModel(corpus_trigram_model, corpus_bigram_model,
-                                                                   corpus_unigram_model)
+                                                                   corpus_unigram_model).compile()
         else:
             eff_tg_model = trigram_model
             eff_corpus_tg_model = corpus_trigram_model
 
         if distance_measure == "perplexity":
-            sink = TrigramModelPerplexitySink(eff_tg_model, substitution_map=token_map)
+            scorer = BatchPerplexityScorer(eff_tg_model, substitution_map=token_map)
         elif distance_measure == "kita":
-            sink = TrigramModelKitaDistanceSink(eff_tg_model, eff_corpus_tg_model, substitution_map=token_map)
-
-        docs_processed = 0
-        lines_processed = 0
-        tokens_processed = 0
-        docs_skipped = 0
-        for doc_name, doc_text in corpus:
-            self.log.debug(u"Processing {}".format(doc_name))
-            if isinstance(doc_text, InvalidDocument):
-                self.log.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
-                docs_skipped += 1
-                continue
-
-            for line in doc_text:
-                for token in tokenizer(line):
-                    sink.handle(token)
-                    tokens_processed += 1
-                    if tokens_processed >= token_count:
-                        break
-                if tokens_processed >= token_count:
-                    break
-                lines_processed += 1
-            if tokens_processed >= token_count:
-                break
-            docs_processed += 1
-
-        self.log.info(u"{} documents skipped".format(docs_skipped))
+            scorer = BatchKitaDistanceScorer(eff_tg_model, eff_corpus_tg_model, substitution_map=token_map)
+
+        batch, statistics = read_batch(corpus, tokenizer, symbols, token_count, self.log)
+
+        self.log.info(u"{} documents skipped".format(statistics.docs_skipped))
         self.log.info(u"{} documents, {} lines and {} tokens processed"
-                      .format(docs_processed, lines_processed, tokens_processed))
+                      .format(statistics.docs_processed, statistics.lines_processed, statistics.tokens_processed))
 
-        if tokens_processed < token_count:
+        if statistics.tokens_processed < token_count:
             raise Exception("Not enough tokens found")
 
-        distance = sink.distance()
+        scorer.score(batch)
+        distance = scorer.distance()
         self.log.info(u"Distance ({}): {}".format(distance_measure, distance))
 
         with NumericResultWriter(self.info.get_absolute_output_dir("distance")) as writer:
@@ -164,7 +132,7 @@ class ModuleExecutor(BaseModuleExecutor):
 
         # Confusion matrix
         with ConfusionMatrixWriter(self.info.get_absolute_output_dir("confusion_matrix")) as writer:
-            model_vocab = model_pimlico_vocabulary(original_unigram_model)
+            model_vocab = model_pimlico_vocabulary(model_vocabulary)
             writer.store_vocab(model_vocab)
 
             # Initialize a regular Python list of lists for PyPy, numpy array for CPython. Numpy array access is
@@ -183,7 +151,7 @@ class ModuleExecutor(BaseModuleExecutor):
                 conf_mat = np.zeros((rows, cols), dtype=np.float32)
             oov = len(model_vocab)
 
-            for transition, count in sink.transition_count.iteritems():
+            for transition, count in scorer.transition_count.iteritems():
                 ctx1, ctx2, target = transition
                 ctx1 = token_map.get(ctx1, ctx1)
                 ctx2 = token_map.get(ctx2, ctx2)
@@ -23,6 +23,7 @@ from langsim.datatypes.confusion import ConfusionMatrix
 from dlt.datatypes.ngram import TokenMappingType, TrigramModelType, BigramModelType, \
     UnigramFrequencyType
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
+from dlt.datatypes.tokenized import TokenizedCorpusType
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.core.modules.options import choose_from_list, str_to_bool
 from pimlico.datatypes.results import NumericResult
@@ -34,7 +35,7 @@ class ModuleInfo(BaseModuleInfo):
     module_inputs = [("unigram_model", UnigramFrequencyType),
                      ("bigram_model", BigramModelType),
                      ("trigram_model", TrigramModelType),
-                     ("corpus", TarredCorpusType(RawTextLinesDocumentType)),
+                     ("corpus", (TarredCorpusType(RawTextLinesDocumentType), TokenizedCorpusType)),
                      ("corpus_unigram_model", UnigramFrequencyType),
                      ("corpus_bigram_model", BigramModelType),
                      ("corpus_trigram_model", TrigramModelType),
@@ -43,8 +44,7 @@ class ModuleInfo(BaseModuleInfo):
                       ("confusion_matrix", ConfusionMatrix)]
     module_options = {
         "token_type": {
-            "help": "Type of token: either 'text', 'phonemes' or 'kita'.",
-            "required": True,
+            "help": "Type of token: either 'text', 'phonemes' or 'kita'. Only needed for a raw text corpus.",
             "type": choose_from_list(["text", "phonemes", "kita"]),
         },
         "count": {
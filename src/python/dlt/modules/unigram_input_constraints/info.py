@@ -17,23 +17,24 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
+from pimlico.core.dependencies.python import numpy_dependency
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.datatypes.tar import TarredCorpusType
 from pimlico.core.modules.options import choose_from_list, comma_separated_list
 
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
 from dlt.datatypes.ngram import SetSizeAndStatistics
+from dlt.datatypes.tokenized import TokenizedCorpusType
 
 
 class ModuleInfo(BaseModuleInfo):
     module_type_name = "unigram_input_constraints"
-    module_inputs = [("corpus", TarredCorpusType(RawTextLinesDocumentType))]
+    module_inputs = [("corpus", (TarredCorpusType(RawTextLinesDocumentType), TokenizedCorpusType))]
     module_outputs = [("test_set_size_and_statistics", SetSizeAndStatistics),
                       ("learning_set_size_and_statistics", SetSizeAndStatistics)]
     module_options = {
         "token_type": {
-            "help": "Type of token: either 'text' or 'phonemes'.",
-            "required": True,
+            "help": "Type of token: either 'text' or 'phonemes'. Only needed for a raw text corpus.",
             "type": choose_from_list(["text", "phonemes"]),
         },
         "max_token_count": {
@@ -78,3 +79,6 @@ class ModuleInfo(BaseModuleInfo):
             "type": int,
         },
     }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
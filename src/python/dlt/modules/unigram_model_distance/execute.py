@@ -21,15 +21,12 @@
 #
 import codecs
 
-from ngram.models import UnigramModel, UnigramModelPerplexitySink
-from pimlico.datatypes.base import InvalidDocument
+from ngram.models import UnigramModelPerplexitySink
 from pimlico.datatypes.results import NumericResultWriter
 from pimlico.core.modules.base import BaseModuleExecutor
 
-from dlt.utils import read_token_mapping
-from dlt.text_tokenizer import token_gen as text_token_gen
-from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_token_gen
-from dlt.kita_tokenizer import token_gen as kita_token_gen
+from dlt.ngram_counting import count_tokens
+from dlt.utils import read_token_mapping, corpus_tokenizer
 
 
 class ModuleExecutor(BaseModuleExecutor):
@@ -44,13 +41,11 @@ class ModuleExecutor(BaseModuleExecutor):
         additive_smoothing_a = self.info.options["additive_smoothing_a"]
         distance_measure = self.info.options["distance_measure"]
 
-        with codecs.open(corpus_ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            corpus_unigram_model = UnigramModel.read_from_file(f)
+        corpus_unigram_model = corpus_ug_model.read_model()
 
-        with codecs.open(ug_model.absolute_path, 'r', encoding='utf-8') as f:
-            unigram_model = UnigramModel.read_from_file(f, additive_smoothing=additive_smoothing,
-                                                        additive_smoothing_a=additive_smoothing_a,
-                                                        additional_vocabulary=corpus_unigram_model.vocabulary)
+        unigram_model = ug_model.read_model(additive_smoothing=additive_smoothing,
+                                            additive_smoothing_a=additive_smoothing_a,
+                                            additional_vocabulary=corpus_unigram_model.vocabulary)
 
         model_language = ug_model.module.module_variables["lang_code"]
         corpus_language = corpus.module.module_variables["lang_code"]
@@ -58,48 +53,19 @@ class ModuleExecutor(BaseModuleExecutor):
             token_map = {v: k
                          for k, v in read_token_mapping(f).get((model_language, corpus_language), {}).iteritems()}
 
-        if token_type == "text":
-            tokenizer = text_token_gen
-        elif token_type == "phonemes":
-            tokenizer = phoneme_token_gen
-        elif token_type == "kita":
-            tokenizer = kita_token_gen
-        else:
-            raise Exception("Unknown token type: {}".format(token_type))
+        tokenizer = corpus_tokenizer(corpus, token_type)
 
         if distance_measure == "perplexity":
             sink = UnigramModelPerplexitySink(unigram_model, substitution_map=token_map)
         elif distance_measure == "kita":
             raise Exception("kita measure and unigrams not implemented")
-        docs_processed = 0
-        lines_processed = 0
-        tokens_processed = 0
-        docs_skipped = 0
-        for doc_name, doc_text in corpus:
-            self.log.debug(u"Processing {}".format(doc_name))
-            if isinstance(doc_text, InvalidDocument):
-                self.log.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
-                docs_skipped += 1
-                continue
+        statistics = count_tokens(corpus, tokenizer, sink, token_count, self.log)
 
-            for line in doc_text:
-                for token in tokenizer(line):
-                    sink.handle(token)
-                    tokens_processed += 1
-                    if tokens_processed >= token_count:
-                        break
-                if tokens_processed >= token_count:
-                    break
-                lines_processed += 1
-            if tokens_processed >= token_count:
-                break
-            docs_processed += 1
-
-        self.log.info(u"{} documents skipped".format(docs_skipped))
+        self.log.info(u"{} documents skipped".format(statistics.docs_skipped))
         self.log.info(u"{} documents, {} lines and {} tokens processed"
-                      .format(docs_processed, lines_processed, tokens_processed))
+                      .format(statistics.docs_processed, statistics.lines_processed, statistics.tokens_processed))
 
-        if tokens_processed < token_count:
+        if statistics.tokens_processed < token_count:
             raise Exception("Not enough tokens found")
 
         distance = sink.distance()
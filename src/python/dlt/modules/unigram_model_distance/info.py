@@ -17,6 +17,7 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+from pimlico.core.dependencies.python import numpy_dependency
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.core.modules.options import choose_from_list, str_to_bool
 from pimlico.datatypes.results import NumericResult
@@ -24,19 +25,19 @@ from pimlico.datatypes.tar import TarredCorpusType
 
 from dlt.datatypes.ngram import UnigramFrequencyType, TokenMappingType
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
+from dlt.datatypes.tokenized import TokenizedCorpusType
 
 
 class ModuleInfo(BaseModuleInfo):
     module_type_name = "unigram_model_distance"
     module_inputs = [("unigram_model", UnigramFrequencyType),
-                     ("corpus", TarredCorpusType(RawTextLinesDocumentType)),
+                     ("corpus", (TarredCorpusType(RawTextLinesDocumentType), TokenizedCorpusType)),
                      ("corpus_unigram_model", UnigramFrequencyType),
                      ("token_mapping", TokenMappingType)]
     module_outputs = [("distance", NumericResult)]
     module_options = {
         "token_type": {
-            "help": "Type of token: either 'text', 'phonemes' or 'kita'.",
-            "required": True,
+            "help": "Type of token: either 'text', 'phonemes' or 'kita'. Only needed for a raw text corpus.",
             "type": choose_from_list(["text", "phonemes", "kita"]),
         },
         "count": {
@@ -63,3 +64,6 @@ class ModuleInfo(BaseModuleInfo):
             "default": "perplexity"
         }
     }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
@@ -28,7 +28,6 @@ import os
 from pimlico.core.modules.base import BaseModuleExecutor
 
 from dlt.utils import working_directory
-from ngram.models import UnigramModel
 
 
 def log_linear_fit_plot_r_output(stream, item_frequencies):
@@ -124,8 +123,7 @@ class ModuleExecutor(BaseModuleExecutor):
         # https://stat.ethz.ch/pipermail/r-help/2010-October/256608.html
         model = self.info.get_input("model")
 
-        with codecs.open(model.absolute_path, 'r', encoding='utf-8') as f:
-            unigram_model = UnigramModel.read_from_file(f)
+        unigram_model = model.read_model()
 
         model_language = model.module.module_variables["lang_code"]
 
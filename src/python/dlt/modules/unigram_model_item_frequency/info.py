@@ -17,6 +17,7 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+from pimlico.core.dependencies.python import numpy_dependency
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.datatypes import PimlicoDatatype
 
@@ -29,3 +30,6 @@ class ModuleInfo(BaseModuleInfo):
     module_outputs = [("plot", PimlicoDatatype)]
     module_options = {
     }
+
+    def get_software_dependencies(self):
+        return super(ModuleInfo, self).get_software_dependencies() + [numpy_dependency]
@@ -0,0 +1,37 @@
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+from pimlico.core.modules.base import BaseModuleExecutor
+
+from dlt.datatypes.ngram import VocabularyTypeWriter
+
+
+class ModuleExecutor(BaseModuleExecutor):
+    def execute(self):
+        vocabulary = {u"WB"}
+        for model_input in self.info.get_input("unigram_models"):
+            language_vocabulary = model_input.read_vocabulary()
+            self.log.info(u'{} tokens in {}'.format(len(language_vocabulary),
+                                                      model_input.module.module_variables["lang"]))
+            vocabulary |= language_vocabulary
+        self.log.info(u'{} tokens in all'.format(len(vocabulary)))
+
+        with VocabularyTypeWriter(self.info.get_absolute_output_dir("vocabulary")) as writer:
+            # Sorted, so that the ids only depend on the tokens
+            writer.tokens = sorted(vocabulary)
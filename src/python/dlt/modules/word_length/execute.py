@@ -25,12 +25,12 @@ import shutil
 
 import codecs
 import os
+
+import numpy as np
 from pimlico.core.modules.base import BaseModuleExecutor
-from pimlico.datatypes.base import InvalidDocument
 
-from dlt.kita_tokenizer import token_gen as kita_token_gen
-from dlt.phonetic_transcript_tokenizer import token_gen as phoneme_token_gen
-from dlt.text_tokenizer import token_gen as text_token_gen
+from dlt.ngram_counting import count_tokens
+from dlt.utils import corpus_tokenizer
 from ngram.models import TokenHandlingProgressReporter
 
 
@@ -41,27 +41,50 @@ class WordLengthSink(object):
         self.lengths = []
         self.current_word = []
 
-    def handle(self, token):
-        # print(token.letter, token.is_beginning, token.is_ending, sep='\t')
-        self.progress_reporter.token_handled()
-
+    def _handle(self, letter, is_beginning, is_ending):
         appended = False
-        if token.is_beginning:
+        if is_beginning:
             self.current_word = []
-            if token.letter != u'WB':
-                self.current_word.append(token.letter)
+            if letter != u'WB':
+                self.current_word.append(letter)
                 appended = True
-        if token.is_ending:
-            if token.letter != u"WB":
-                self.current_word.append(token.letter)
+        if is_ending:
+            if letter != u"WB":
+                self.current_word.append(letter)
                 appended = True
             self.lengths.append(len(self.current_word))
             #self.logger.info(u"Using {}".format(self.current_word))
 
         if not appended:
-            self.current_word.append(token.letter)
+            self.current_word.append(letter)
         #self.logger.info(repr(self.current_word))
 
+    def handle(self, token):
+        # print(token.letter, token.is_beginning, token.is_ending, sep='\t')
+        self.progress_reporter.token_handled()
+        self._handle(token.letter, token.is_beginning, token.is_ending)
+
+    def handle_batch(self, batch):
+        """Like handle() for each token, with the lengths of all but the last word taken from the columns."""
+        self.progress_reporter.tokens_handled(len(batch))
+        beginnings = np.flatnonzero(batch.is_beginning)
+        head = beginnings[-1] if len(beginnings) > 0 else 0
+        if head > 0:
+            # Each token adds itself to the word, except that a single letter word gets its letter twice and a
+            # word boundary ending a word is only added after its length is taken
+            ids = batch.ids[:head]
+            is_beginning = batch.is_beginning[:head]
+            is_ending = batch.is_ending[:head]
+            is_boundary = ids == batch.symbols.get(u'WB', -1)
+            added = 1 + (is_beginning & is_ending & ~is_boundary)
+            total = np.cumsum(added)
+            last_beginning = np.maximum.accumulate(np.where(is_beginning, np.arange(head), -1))
+            word_start = np.where(last_beginning >= 0, (total - added)[last_beginning], -len(self.current_word))
+            lengths = (total - word_start - is_boundary)[is_ending]
+            self.lengths.extend(lengths.tolist())
+        for letter, is_beginning, is_ending in batch[head:].rows():
+            self._handle(letter, is_beginning, is_ending)
+
 
 class ModuleExecutor(BaseModuleExecutor):
     def execute(self):
@@ -69,45 +92,16 @@ class ModuleExecutor(BaseModuleExecutor):
         token_type = self.info.options["token_type"]
         token_count = self.info.options["count"]
 
-        if token_type == "text":
-            tokenizer = text_token_gen
-        elif token_type == "phonemes":
-            tokenizer = phoneme_token_gen
-        elif token_type == "kita":
-            tokenizer = kita_token_gen
-        else:
-            raise Exception("Unknown token type: {}".format(token_type))
+        tokenizer = corpus_tokenizer(corpus, token_type)
 
         sink = WordLengthSink(self.log)
-        docs_processed = 0
-        lines_processed = 0
-        tokens_processed = 0
-        docs_skipped = 0
-        for doc_name, doc_text in corpus:
-            self.log.debug(u"Processing {}".format(doc_name))
-            if isinstance(doc_text, InvalidDocument):
-                self.log.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
-                docs_skipped += 1
-                continue
-
-            for line in doc_text:
-                for token in tokenizer(line):
-                    sink.handle(token)
-                    tokens_processed += 1
-                    if tokens_processed >= token_count:
-                        break
-                if tokens_processed >= token_count:
-                    break
-                lines_processed += 1
-            if tokens_processed >= token_count:
-                break
-            docs_processed += 1
-
-        self.log.info(u"{} documents skipped".format(docs_skipped))
+        statistics = count_tokens(corpus, tokenizer, sink, token_count, self.log)
+
+        self.log.info(u"{} documents skipped".format(statistics.docs_skipped))
         self.log.info(u"{} documents, {} lines and {} tokens processed"
-                      .format(docs_processed, lines_processed, tokens_processed))
+                      .format(statistics.docs_processed, statistics.lines_processed, statistics.tokens_processed))
 
-        if tokens_processed < token_count:
+        if statistics.tokens_processed < token_count:
             raise Exception("Not enough tokens found")
 
         output_dir = self.info.get_absolute_output_dir("word_length")
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import collections
+import logging
+import multiprocessing
+
+from pimlico.datatypes import InvalidDocument
+
+from dlt.datatypes.tokenized import TokenizedCorpusType
+from ngram.batch import TokenBatch
+from ngram.packed import SymbolTable
+
+
+CountingStatistics = collections.namedtuple(
+    'CountingStatistics', ['docs_processed', 'lines_processed', 'tokens_processed', 'docs_skipped'])
+
+
+def _add_statistics(a, b):
+    return CountingStatistics(*[x + y for x, y in zip(a, b)])
+
+
+def count_tokens(documents, tokenizer, sink, token_count, logger):
+    """Feeds the tokens of (doc_name, doc_text) pairs to the sink until token_count tokens have been handled.
+
+    A tokenized corpus is fed to the sink in a single batch, and needs no
+    tokenizer.
+
+    """
+    if isinstance(documents, TokenizedCorpusType):
+        batch = documents.read_batch(SymbolTable(), token_count)
+        sink.handle_batch(batch)
+        lines_processed, docs_processed = documents.complete_lines_and_documents(len(batch))
+        return CountingStatistics(docs_processed, lines_processed, len(batch), 0)
+
+    docs_processed = 0
+    lines_processed = 0
+    tokens_processed = 0
+    docs_skipped = 0
+    for doc_name, doc_text in documents:
+        logger.debug(u"Processing {}".format(doc_name))
+        if isinstance(doc_text, InvalidDocument):
+            logger.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
+            docs_skipped += 1
+            continue
+
+        for line in doc_text:
+            for token in tokenizer(line):
+                sink.handle(token)
+                tokens_processed += 1
+                if tokens_processed >= token_count:
+                    break
+            if tokens_processed >= token_count:
+                break
+            lines_processed += 1
+        if tokens_processed >= token_count:
+            break
+        docs_processed += 1
+
+    return CountingStatistics(docs_processed, lines_processed, tokens_processed, docs_skipped)
+
+
+class _BatchSink(object):
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.tokens = []
+        self.batches = []
+
+    def handle(self, token):
+        self.tokens.append(token)
+
+    def handle_batch(self, batch):
+        self.batches.append(batch.recode(self.symbols))
+
+
+def read_batch(documents, tokenizer, symbols, token_count, logger):
+    """The tokens count_tokens() would handle as a TokenBatch over symbols, and the CountingStatistics."""
+    sink = _BatchSink(symbols)
+    statistics = count_tokens(documents, tokenizer, sink, token_count, logger)
+    # Only one of the two is used for a corpus
+    if len(sink.tokens) > 0:
+        return TokenBatch.from_tokens(sink.tokens, symbols), statistics
+    return TokenBatch.concatenate(sink.batches, symbols), statistics
+
+
+def _count_shard(args):
+    documents, tokenizer, sink_class, token_count, logger_name = args
+    logger = logging.getLogger(logger_name)
+    sink = sink_class(logger)
+    return sink, count_tokens(documents, tokenizer, sink, token_count, logger)
+
+
+def _shards(documents, shard_size):
+    shard = []
+    for document in documents:
+        shard.append(document)
+        if len(shard) == shard_size:
+            yield shard
+            shard = []
+    if len(shard) > 0:
+        yield shard
+
+
+def build_counts(documents, tokenizer, sink_class, token_count, logger, processes=1, shard_size=10):
+    """Counts tokens like count_tokens() into a new sink_class(logger), which must support merge().
+
+    With more than one process, runs of shard_size documents are counted in a
+    process pool and the partial sinks are merged in corpus order, giving the
+    same counts as a single pass.  Shards always end at a document, and so at
+    a word boundary.  A tokenized corpus is counted in a single pass.
+    Returns the sink and the CountingStatistics.
+
+    """
+    sink = sink_class(logger)
+    if processes <= 1 or isinstance(documents, TokenizedCorpusType):
+        return sink, count_tokens(documents, tokenizer, sink, token_count, logger)
+
+    statistics = CountingStatistics(0, 0, 0, 0)
+    shards = _shards(documents, shard_size)
+    pending = collections.deque()
+    pool = multiprocessing.Pool(processes)
+    try:
+        while True:
+            # Only read ahead a few shards per process
+            while len(pending) < 2 * processes:
+                shard = next(shards, None)
+                if shard is None:
+                    break
+                pending.append((shard, pool.apply_async(
+                    _count_shard, ((shard, tokenizer, sink_class, token_count, logger.name),))))
+            if len(pending) == 0:
+                break
+
+            shard, result = pending.popleft()
+            shard_sink, shard_statistics = result.get()
+            remaining = token_count - statistics.tokens_processed
+            if shard_statistics.tokens_processed >= remaining:
+                # The budget runs out within this shard; count it again, stopping where a single pass would
+                shard_sink = sink_class(logger)
+                shard_statistics = count_tokens(shard, tokenizer, shard_sink, remaining, logger)
+                sink.merge(shard_sink)
+                statistics = _add_statistics(statistics, shard_statistics)
+                break
+
+            sink.merge(shard_sink)
+            statistics = _add_statistics(statistics, shard_statistics)
+    finally:
+        # Shards still in flight are past the budget
+        pool.terminate()
+        pool.join()
+
+    return sink, statistics
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import logging
+import shutil
+import tempfile
+import unittest
+
+from dlt.datatypes.tokenized import TokenizedCorpusType, TokenizedCorpusTypeWriter
+from dlt.ngram_counting import count_tokens, read_batch
+from dlt.text_tokenizer import token_gen
+from ngram.packed import SymbolTable
+
+
+DOCUMENTS = [(u"empty", []), (u"one", [u"Ab c", u"de"]), (u"two", [u"", u"f ghi"]), (u"three", [u"jk l ä"])]
+
+
+class _RowSink(object):
+    def __init__(self):
+        self.rows = []
+
+    def handle(self, token):
+        self.rows.append((token.letter, token.is_beginning, token.is_ending))
+
+    def handle_batch(self, batch):
+        self.rows.extend(batch.rows())
+
+
+class TokenizedCountingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with TokenizedCorpusTypeWriter(self.directory) as writer:
+            for name, lines in DOCUMENTS:
+                writer.add_document(name, [token_gen(line) for line in lines])
+        self.tokenized = TokenizedCorpusType(self.directory, None)
+        self.logger = logging.getLogger("ngram_counting_tests")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_as_raw(self):
+        # Windows ending inside a line, at the end of a line and of a document, and past the corpus
+        for token_count in [0, 1, 3, 5, 6, 11, 20]:
+            raw_sink = _RowSink()
+            raw_statistics = count_tokens(DOCUMENTS, token_gen, raw_sink, token_count, self.logger)
+            tokenized_sink = _RowSink()
+            statistics = count_tokens(self.tokenized, None, tokenized_sink, token_count, self.logger)
+            self.assertEqual(tokenized_sink.rows, raw_sink.rows)
+            self.assertEqual(statistics.tokens_processed, raw_statistics.tokens_processed)
+
+    def test_complete_lines_and_documents(self):
+        # The empty line after the fifth token is complete with it
+        self.assertEqual(self.tokenized.complete_lines_and_documents(0), (0, 1))
+        self.assertEqual(self.tokenized.complete_lines_and_documents(3), (1, 1))
+        self.assertEqual(self.tokenized.complete_lines_and_documents(5), (3, 2))
+        self.assertEqual(self.tokenized.complete_lines_and_documents(9), (4, 3))
+        self.assertEqual(self.tokenized.complete_lines_and_documents(13), (5, 4))
+
+    def test_read_batch(self):
+        raw_batch, _ = read_batch(DOCUMENTS, token_gen, SymbolTable(), 7, self.logger)
+        batch, statistics = read_batch(self.tokenized, None, SymbolTable(), 7, self.logger)
+        self.assertEqual(batch.rows(), raw_batch.rows())
+        self.assertEqual(statistics.tokens_processed, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
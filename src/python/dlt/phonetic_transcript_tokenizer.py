@@ -19,7 +19,11 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
-from text_tokenizer import token_gen as _tg, Token
+from ngram.batch import TokenBatch
+from text_tokenizer import letter_gen as _lg, Token, _NUMBER
+
+
+_STRESS_MARKS = (u'ˈ', u'ˌ')
 
 
 def _retain_token(token):
@@ -29,21 +33,62 @@ def _retain_token(token):
     return True
 
 
-def token_gen(text):
-    for token in _tg(text, token_delimiter=u"_", retain_token=_retain_token):
-        if token.letter.startswith(u'ˈ') or token.letter.startswith(u'ˌ'):
-            token.letter = token.letter[1:]
+def letter_gen(text):
+    """Like token_gen(), but yields (letter, is_beginning, is_ending) tuples."""
+    for letter, is_beginning, is_ending in _lg(text, token_delimiter=u"_", retain_token=_retain_token):
+        if letter.startswith(u'ˈ') or letter.startswith(u'ˌ'):
+            letter = letter[1:]
 
         # Glottal stop compound phoneme handling
         #  This handles cases like ʔe where the glottal stop is placed together
         #  with the following vowel sound by eSpeak.
-        if token.letter.startswith(u'ʔ') and len(token.letter) > 1:
-            glottal_stop_token = Token(token.letter[0], token.is_beginning, False)
-            yield glottal_stop_token
-            next_token = Token(token.letter[1:], False, token.is_ending)
-            token = next_token
+        if letter.startswith(u'ʔ') and len(letter) > 1:
+            yield letter[0], is_beginning, False
+            letter = letter[1:]
+            is_beginning = False
+
+        yield letter, is_beginning, is_ending
+
+
+def token_gen(text):
+    for letter, is_beginning, is_ending in letter_gen(text):
+        yield Token(letter, is_beginning, is_ending)
+
+
+def token_batch(text, symbols):
+    """The tokens of text as a TokenBatch over symbols, exactly as token_gen() gives them.
+
+    The whole line is lowercased at once, and tokens are interned straight to
+    symbol ids instead of going through letter_gen().
+
+    """
+    token2id = symbols.token2id
+    ids = []
+    beginnings = []
+    endings = []
+    for word in unicode(text).lower().split():
+        if _NUMBER.match(word) or word == u'-' or word == u'"':
+            continue
+
+        parts = [part for part in word.split(u'_') if part != u'' and _retain_token(part)]
+        last = len(parts) - 1
+        for index, part in enumerate(parts):
+            is_beginning = index == 0
+            if part[0] in _STRESS_MARKS:
+                part = part[1:]
+            if len(part) > 1 and part[0] == u'ʔ':
+                id_ = token2id.get(u'ʔ')
+                ids.append(symbols.add(u'ʔ') if id_ is None else id_)
+                beginnings.append(is_beginning)
+                endings.append(False)
+                part = part[1:]
+                is_beginning = False
 
-        yield token
+            id_ = token2id.get(part)
+            ids.append(symbols.add(part) if id_ is None else id_)
+            beginnings.append(is_beginning)
+            endings.append(index == last)
+    return TokenBatch(ids, beginnings, endings, symbols)
 
 
 if __name__ == '__main__':
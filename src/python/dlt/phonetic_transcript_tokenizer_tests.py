@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import random
+import unittest
+
+from dlt.phonetic_transcript_tokenizer import token_gen, token_batch
+from ngram.batch import TokenBatch
+from ngram.packed import SymbolTable
+
+
+LINES = [
+    u"",
+    u"h_ə_l_ˈoʊ w_ˈɜː_l_d",
+    u"ˌa_ʔe_ʔ ʔo_ˈʔa ʔ ˈʔ",
+    u"(en)_ð_ə (el)_ˈa (e)_x () ( )",
+    u"2009_x 12 x_12 - \" -_a \"_b",
+    u"__a___b_ _ ˈ_ˌ a_ˈ",
+    u"X_Y_ˈÖ İ_Σ_ς",
+    u"  tab\tseparated words\n",
+]
+
+ALPHABET = [u"a", u"B", u"ə", u"ˈ", u"ˌ", u"ʔ", u"(", u")", u"_", u"_", u" ", u"1", u"-", u"\"", u"İ", u"Σ"]
+
+
+class TokenBatchTest(unittest.TestCase):
+    def assert_same_as_token_gen(self, line):
+        symbols = SymbolTable()
+        expected = TokenBatch.from_tokens(token_gen(line), SymbolTable())
+        batch = token_batch(line, symbols)
+
+        letters = batch.letters()
+        self.assertEqual(expected.letters(), letters, line)
+        self.assertEqual([type(letter) for letter in expected.letters()], [type(letter) for letter in letters])
+        self.assertEqual(expected.is_beginning.tolist(), batch.is_beginning.tolist(), line)
+        self.assertEqual(expected.is_ending.tolist(), batch.is_ending.tolist(), line)
+        self.assertEqual(symbols.encode(letters).tolist(), batch.ids.tolist())
+
+    def test_lines(self):
+        for line in LINES:
+            self.assert_same_as_token_gen(line)
+
+    def test_random_lines(self):
+        rnd = random.Random(1)
+        for _ in xrange(2000):
+            self.assert_same_as_token_gen(u"".join(rnd.choice(ALPHABET) for _ in xrange(rnd.randint(0, 30))))
+
+    def test_shared_symbols(self):
+        symbols = SymbolTable([u"WB", u"ə"])
+        batch = token_batch(LINES[1] + u" " + LINES[2], symbols)
+        self.assertEqual(symbols.get(u"ə"), 1)
+        self.assertEqual(batch.letters(), [token.letter for token in token_gen(LINES[1] + u" " + LINES[2])])
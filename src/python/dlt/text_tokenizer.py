@@ -23,6 +23,11 @@ from __future__ import print_function
 
 import re
 
+from ngram.batch import TokenBatch
+
+
+_NUMBER = re.compile(ur"\d+")
+
 
 class Token(object):
     def __init__(self, letter, is_beginning, is_ending):
@@ -34,11 +39,12 @@ class Token(object):
         return self.letter
 
 
-def token_gen(text, token_delimiter=None, retain_token=None):
+def letter_gen(text, token_delimiter=None, retain_token=None):
+    """Like token_gen(), but yields (letter, is_beginning, is_ending) tuples."""
     words = text.split()
 
     for word in words:
-        if len(word) == 0 or re.match(ur"\d+", word) or word in [u'-', '"']:
+        if len(word) == 0 or _NUMBER.match(word) or word in [u'-', '"']:
             continue
 
         if token_delimiter is None:
@@ -46,7 +52,7 @@ def token_gen(text, token_delimiter=None, retain_token=None):
                 is_beginning = index == 0
                 is_ending = index == len(word) - 1
 
-                yield Token(unicode(letter.lower()), is_beginning, is_ending)
+                yield unicode(letter.lower()), is_beginning, is_ending
         else:
             # Prune out empty tokens
             parts = [part
@@ -62,7 +68,17 @@ def token_gen(text, token_delimiter=None, retain_token=None):
                 is_beginning = index == 0
                 is_ending = index == len(parts) - 1
 
-                yield Token(unicode(letter.lower()), is_beginning, is_ending)
+                yield unicode(letter.lower()), is_beginning, is_ending
+
+
+def token_gen(text, token_delimiter=None, retain_token=None):
+    for letter, is_beginning, is_ending in letter_gen(text, token_delimiter, retain_token):
+        yield Token(letter, is_beginning, is_ending)
+
+
+def token_batch(text, symbols, token_delimiter=None, retain_token=None):
+    """The tokens of text as a TokenBatch over symbols, without creating Token objects."""
+    return TokenBatch.from_rows(letter_gen(text, token_delimiter, retain_token), symbols)
 
 
 if __name__ == '__main__':
@@ -27,6 +27,12 @@ import os
 
 from pimlico.datatypes import InvalidDocument
 
+from dlt import kita_tokenizer, phonetic_transcript_tokenizer, text_tokenizer
+from dlt.datatypes.ngram import LanguageDistancesType
+from dlt.datatypes.tokenized import TokenizedCorpusType
+from ngram.batch import TokenBatch
+from ngram.packed import SymbolTable
+
 
 @contextlib.contextmanager
 def working_directory(path):
@@ -53,6 +59,30 @@ def read_token_mapping(stream):
     return result
 
 
+def tokenizer_module(token_type):
+    """The tokenizer module for a token_type option, with its token_gen() and token_batch()."""
+    if token_type == "text":
+        return text_tokenizer
+    elif token_type == "phonemes":
+        return phonetic_transcript_tokenizer
+    elif token_type == "kita":
+        return kita_tokenizer
+    else:
+        raise Exception("Unknown token type: {}".format(token_type))
+
+
+def corpus_tokenizer(corpus, token_type, batch=False):
+    """The token_gen(), or with batch token_batch(), for a token_type option.
+
+    None for a tokenized corpus, which needs no tokenizer.
+
+    """
+    if isinstance(corpus, TokenizedCorpusType):
+        return None
+    module = tokenizer_module(token_type)
+    return module.token_batch if batch else module.token_gen
+
+
 def read_tokens(corpus, max_token_count, tokenizer, logger):
     all_tokens = []
     tokens_processed = 0
@@ -76,6 +106,38 @@ def read_tokens(corpus, max_token_count, tokenizer, logger):
     return all_tokens, tokens_processed
 
 
+def read_token_batch(corpus, max_token_count, batch_tokenizer, logger, symbols=None):
+    """Like read_tokens(), but reads the tokens into a single TokenBatch.
+
+    batch_tokenizer is a tokenizer module's token_batch(); a tokenized
+    corpus is read as it is.
+
+    """
+    if symbols is None:
+        symbols = SymbolTable()
+    if isinstance(corpus, TokenizedCorpusType):
+        batch = corpus.read_batch(symbols, max_token_count)
+        return batch, len(batch)
+    batches = []
+    tokens_processed = 0
+    for doc_name, doc_text in corpus:
+        logger.debug(u"Processing {}".format(doc_name))
+        if isinstance(doc_text, InvalidDocument):
+            logger.debug(u"Skipping document {}: {}".format(doc_name, doc_text))
+            continue
+
+        for line in doc_text:
+            batch = batch_tokenizer(line, symbols)[:max_token_count - tokens_processed]
+            batches.append(batch)
+            tokens_processed += len(batch)
+            if tokens_processed >= max_token_count:
+                break
+        if tokens_processed >= max_token_count:
+            break
+
+    return TokenBatch.concatenate(batches, symbols), tokens_processed
+
+
 Statistics = collections.namedtuple('Statistics', ['expected_value', 'min', 'median', 'max', 'mean',
                                                    'std_dev', 'variance', 'measurements'])
 
@@ -103,23 +165,33 @@ def calculate_statistics_with_callable(expected_value, callable_, iterations, lo
 
 def random_range(sequence, range_length, random_int_generator=random.randint):
     """Takes a random range from a sequence given range length. Returns an iterator."""
+    for item in random_slice(sequence, range_length, random_int_generator):
+        yield item
+
+
+def random_slice(sequence, range_length, random_int_generator=random.randint):
+    """Like random_range(), but returns the range as a slice of the sequence, e.g. a TokenBatch."""
     seq_len = len(sequence)
     if range_length == seq_len:
-        for item in sequence:
-            yield item
+        return sequence
     elif range_length > seq_len:
         raise ValueError("sample size is greater than sequence length: {} vs {}".format(range_length, seq_len))
     else:
         start_index = random_int_generator(0, seq_len - range_length)
         end_index = start_index + range_length
-        for item in sequence[start_index:end_index]:
-            yield item
+        return sequence[start_index:end_index]
 
 
 def collect_distances_names(input_distances):
     distances = {}
     lang_names = {}
     for d in input_distances:
+        if isinstance(d, LanguageDistancesType):
+            pair_distances, pair_lang_names = d.read_distances()
+            distances.update(pair_distances)
+            lang_names.update(pair_lang_names)
+            continue
+
         model_lang = d.module.module_variables["model_lang_code"]
         corpus_lang = d.module.module_variables["corpus_lang_code"]
 
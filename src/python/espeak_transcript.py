@@ -21,11 +21,17 @@ from __future__ import print_function
 
 import argparse
 import codecs
+import collections
 import datetime
 import os
+import Queue
+import select
 import subprocess
 import sys
 import tempfile
+import threading
+from distutils.spawn import find_executable
+from multiprocessing.pool import ThreadPool
 
 
 stdin8 = codecs.getwriter('utf-8')(sys.stdin)
@@ -35,12 +41,224 @@ stderr8 = codecs.getwriter('utf-8')(sys.stderr)
 
 BATCH_LINES = 1000
 
+ESPEAK_COMMAND = "espeak"
+# Sent on a line of its own after each batch; its transcription marks the end of the batch's output
+END_OF_BATCH = u"qxqxq"
+# Seconds to wait for eSpeak to output anything before giving up on it
+READ_TIMEOUT = 60
+# eSpeak reads stdin with fgets() into a buffer of about 1000 bytes, and breaks longer lines wherever it fills up
+MAX_LINE_BYTES = 900
 
-def espeak_transcribe(language, line_buffer, output):
+
+def _set_library_path():
     # Hack to pass in DYLD_LIBRARY_PATH environment variable on Mac (equivalent to LD_LIBRARY_PATH on Linux).
     if "USE_DYLD_LIBRARY_PATH" in os.environ:
         os.environ["DYLD_LIBRARY_PATH"] = os.environ["USE_DYLD_LIBRARY_PATH"]
 
+
+def _encode(line):
+    """The line as lines of eSpeak input, broken at spaces so that none is longer than MAX_LINE_BYTES."""
+    if isinstance(line, unicode):
+        line = line.encode('utf-8')
+    line = line.rstrip('\n').replace('\n', ' ')
+    pieces = []
+    while len(line) > MAX_LINE_BYTES:
+        end = line.rfind(' ', 0, MAX_LINE_BYTES + 1)
+        if end <= 0:
+            # A single word too long for the buffer is broken between characters
+            end = MAX_LINE_BYTES
+            while (ord(line[end]) & 0xC0) == 0x80:
+                end -= 1
+        pieces.append(line[:end])
+        line = line[end:].lstrip(' ')
+    if len(line) > 0 or len(pieces) == 0:
+        pieces.append(line)
+    return ''.join(piece + '\n' for piece in pieces)
+
+
+class EspeakTimeout(Exception):
+    pass
+
+
+class EspeakWorker(object):
+    """A long-lived eSpeak process, transcribing batches of lines fed to it over stdin.
+
+    Given neither -f nor --stdin, eSpeak reads stdin a line at a time, so
+    each line of a batch is transcribed on its own, as if it ended in a full
+    stop; with -f a clause could go on from one line to the next, and with
+    --stdin nothing is spoken until stdin is closed.  Lines too long for
+    eSpeak's buffer are broken at spaces.
+
+    This only works if eSpeak's output is line buffered, which it is made
+    with stdbuf.  A worker whose eSpeak outputs nothing for timeout seconds
+    is killed and EspeakTimeout raised; if that happens when it's started,
+    eSpeak is taken to be block buffering its output.
+
+    """
+    def __init__(self, language, command=ESPEAK_COMMAND, timeout=READ_TIMEOUT):
+        _set_library_path()
+        cmd = [command, "-v", language, "--ipa=3", "-q"]
+        stdbuf = find_executable("stdbuf")
+        if stdbuf is not None:
+            cmd = [stdbuf, "-oL"] + cmd
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.timeout = timeout
+        self._lines = collections.deque()
+        self._partial = ''
+
+        self.process.stdin.write(_encode(END_OF_BATCH))
+        self.process.stdin.flush()
+        self.end_of_batch = ''
+        try:
+            while self.end_of_batch == '':
+                line = self._readline()
+                if line == '':
+                    raise Exception(u"eSpeak exited before transcribing anything")
+                self.end_of_batch = line.strip()
+        except EspeakTimeout:
+            raise EspeakTimeout(u"eSpeak gave no output in {} seconds; it has to read stdin a line at a time "
+                                u"(given neither -f nor --stdin) and its output has to be line buffered, "
+                                u"for which stdbuf (from GNU coreutils) {}"
+                                .format(timeout, u"didn't work" if stdbuf is not None else u"must be on PATH"))
+
+    def _readline(self):
+        """A line of output, or '' at the end of it; kills eSpeak if it doesn't output anything in time."""
+        stdout = self.process.stdout.fileno()
+        while len(self._lines) == 0:
+            if len(select.select([stdout], [], [], self.timeout)[0]) == 0:
+                self.kill()
+                raise EspeakTimeout(u"eSpeak gave no output in {} seconds".format(self.timeout))
+            data = os.read(stdout, 65536)
+            if data == '':
+                line, self._partial = self._partial, ''
+                return line
+            lines = (self._partial + data).split('\n')
+            self._partial = lines.pop()
+            self._lines.extend(line + '\n' for line in lines)
+        return self._lines.popleft()
+
+    def _write(self, lines, per_line):
+        try:
+            for line in lines:
+                self.process.stdin.write(_encode(line))
+                if per_line:
+                    self.process.stdin.write(_encode(END_OF_BATCH))
+            if not per_line:
+                self.process.stdin.write(_encode(END_OF_BATCH))
+            self.process.stdin.flush()
+        except IOError:
+            # eSpeak died; the reading side reports it
+            pass
+
+    def _read_transcript(self):
+        output = []
+        while True:
+            line = self._readline()
+            if line == '':
+                raise Exception(u"eSpeak exited in the middle of a batch")
+            if line.strip() == self.end_of_batch:
+                return unicode(''.join(output), 'utf-8')
+            output.append(line)
+
+    def transcribe(self, lines, per_line=False):
+        """Transcribes a batch of lines; per_line gives a list with the transcript of each line.
+
+        With per_line, each line is followed by the end of batch marker, so
+        the transcripts stay aligned with the lines however many lines of
+        output eSpeak makes of each.
+
+        """
+        lines = list(lines)
+        # Written from another thread, so that eSpeak never blocks on a full output pipe
+        writer = threading.Thread(target=self._write, args=(lines, per_line))
+        writer.start()
+        if per_line:
+            transcript = [self._read_transcript() for _ in lines]
+        else:
+            transcript = self._read_transcript()
+        writer.join()
+        return transcript
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class EspeakPool(object):
+    """A number of EspeakWorkers for a language, transcribing batches in parallel.
+
+    A worker whose eSpeak dies or hangs in the middle of a batch is
+    replaced, and only that batch is transcribed again.
+
+    """
+    def __init__(self, language, workers=1, command=ESPEAK_COMMAND, timeout=READ_TIMEOUT):
+        self.language = language
+        self.command = command
+        self.timeout = timeout
+        self.workers = [EspeakWorker(language, command=command, timeout=timeout) for _ in xrange(workers)]
+        self._idle = Queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        self._threads = ThreadPool(workers)
+
+    def transcribe(self, lines, per_line=False):
+        lines = list(lines)
+        worker = self._idle.get()
+        try:
+            try:
+                return worker.transcribe(lines, per_line=per_line)
+            except Exception:
+                worker = self._replace(worker)
+                return worker.transcribe(lines, per_line=per_line)
+        finally:
+            self._idle.put(worker)
+
+    def _replace(self, worker):
+        worker.kill()
+        new_worker = EspeakWorker(self.language, command=self.command, timeout=self.timeout)
+        self.workers[self.workers.index(worker)] = new_worker
+        return new_worker
+
+    def transcribe_batches(self, batches, per_line=False):
+        """Transcribes an iterable of line batches, yielding the transcripts in input order."""
+        batches = iter(batches)
+        pending = collections.deque()
+        while True:
+            # Only read ahead a few batches per worker
+            while len(pending) < 2 * len(self.workers):
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.append(self._threads.apply_async(self.transcribe, (batch, per_line)))
+            if len(pending) == 0:
+                break
+            yield pending.popleft().get()
+
+    def close(self):
+        self._threads.close()
+        self._threads.join()
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def espeak_transcribe(language, line_buffer, output, pool=None):
+    """Transcribes the lines into output, with the pool's workers if one is given."""
+    if pool is not None:
+        output.write(pool.transcribe(line_buffer))
+        return
+
+    _set_library_path()
     with tempfile.NamedTemporaryFile(prefix=__file__.replace(".py", ""), delete=True) as i_f:
         utf8_i_f = codecs.getwriter('utf-8')(i_f)
         for line in line_buffer:
@@ -59,7 +277,24 @@ def espeak_transcribe(language, line_buffer, output):
         output.write(espeak_output)
 
 
-def main(input_file, output_file, language):
+def single_line(transcript):
+    """The transcript of a line on one line, for output aligned with the input."""
+    return u" ".join(transcript.split()) + u"\n"
+
+
+def batches(lines, batch_lines=BATCH_LINES):
+    """Splits an iterable of lines into lists of batch_lines lines."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_lines:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def main(input_file, output_file, language, workers=1, aligned=False, command=ESPEAK_COMMAND):
     reading_from_stdin = 'stdin' in repr(input_file)
 
     line_count = None
@@ -69,18 +304,14 @@ def main(input_file, output_file, language):
             line_count += 1
         input_file.seek(0)
 
-    line_buffer = []
-    lines_done = 0
     lines_done_total = 0
     first_started = datetime.datetime.now()
     started = first_started
-    handled_lines = 0
-    for line in input_file:
-        if lines_done < BATCH_LINES:
-            line_buffer.append(line)
-            lines_done += 1
-        elif lines_done == BATCH_LINES:
-            espeak_transcribe(language, line_buffer, output_file)
+    with EspeakPool(language, workers=workers, command=command) as pool:
+        for transcript in pool.transcribe_batches(batches(input_file), per_line=aligned):
+            if aligned:
+                transcript = u"".join(single_line(line_transcript) for line_transcript in transcript)
+            output_file.write(transcript)
             took_secs = (datetime.datetime.now() - started).total_seconds()
             print("# {} lines per sec".format(BATCH_LINES / took_secs),
                   file=stderr8)
@@ -94,12 +325,7 @@ def main(input_file, output_file, language):
                       .format(lines_done_total / float(line_count),
                               hours_to_go), file=stderr8)
             started = datetime.datetime.now()
-            lines_done_total += lines_done
-            lines_done = 0
-            line_buffer = []
-
-    if len(line_buffer) > 0:
-        espeak_transcribe(language, line_buffer, output_file)
+            lines_done_total += BATCH_LINES
 
 
 if __name__ == '__main__':
@@ -111,5 +337,10 @@ if __name__ == '__main__':
     parser.add_argument('output', nargs='?', type=argparse.FileType('w'),
                         default=stdout8)
     parser.add_argument('--language', type=str, required=True)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of eSpeak processes transcribing in parallel')
+    parser.add_argument('--aligned', action='store_true',
+                        help='Write the transcript of each input line on the same line of output, so that '
+                             'pieces of a file can be transcribed separately and put back together')
     args = parser.parse_args()
-    main(args.input, args.output, args.language)
+    main(args.input, args.output, args.language, workers=args.workers, aligned=args.aligned)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import io
+import os
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from espeak_transcript import EspeakPool, EspeakTimeout, EspeakWorker, MAX_LINE_BYTES, batches, \
+    espeak_transcribe, main, _encode
+
+
+# Transcribes each line of stdin to its lowercased letters, like eSpeak does to phonemes.  Like eSpeak, it
+# handles one line at a time, unless given --stdin, when it reads all of stdin before transcribing any of it.
+# The first time it sees "crash", it exits, and the first time it sees "hang", it hangs.  With a file called
+# block_buffered next to it, it only outputs anything when it exits.
+FAKE_ESPEAK = u"""#!{python}
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+
+directory = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(directory, "started"), "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+language = sys.argv[sys.argv.index("-v") + 1]
+if "--stdin" in sys.argv:
+    lines = sys.stdin.read().splitlines(True)
+else:
+    lines = iter(sys.stdin.readline, "")
+output = []
+for line in lines:
+    for trigger, flag in [("crash", "crashed"), ("hang", "hung")]:
+        if trigger in line and not os.path.exists(os.path.join(directory, flag)):
+            open(os.path.join(directory, flag), "w").close()
+            if trigger == "crash":
+                sys.exit(1)
+            time.sleep(60)
+    words = unicode(line, "utf-8").split()
+    transcript = u" ".join(u"_".join(word.lower()) for word in words)
+    output.append((u"{{}}: {{}}\\n".format(language, transcript)).encode("utf-8"))
+    if not os.path.exists(os.path.join(directory, "block_buffered")):
+        sys.stdout.write("".join(output))
+        sys.stdout.flush()
+        output = []
+sys.stdout.write("".join(output))
+"""
+
+
+def fake_transcript(language, lines):
+    return u"".join(u"{}: {}\n".format(language, u" ".join(u"_".join(word.lower()) for word in line.split()))
+                    for line in lines)
+
+
+class EspeakPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.command = os.path.join(self.directory, "espeak")
+        with io.open(self.command, "w", encoding="utf-8") as f:
+            f.write(FAKE_ESPEAK.format(python=sys.executable))
+        os.chmod(self.command, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def started(self):
+        with open(os.path.join(self.directory, "started")) as f:
+            return f.read().splitlines()
+
+    def test_transcribe_batches(self):
+        rnd = random.Random(1)
+        lines = [u" ".join(u"".join(rnd.choice(u"abcÄÖß") for _ in xrange(rnd.randint(1, 6)))
+                           for _ in xrange(rnd.randint(0, 8)))
+                 for _ in xrange(500)]
+        with EspeakPool("fi", workers=3, command=self.command) as pool:
+            transcripts = list(pool.transcribe_batches(batches(lines, 7)))
+            self.assertEqual(len(transcripts), 72)
+            self.assertEqual(fake_transcript("fi", lines), u"".join(transcripts))
+
+            # The workers are reused from one call to the next
+            self.assertEqual(list(pool.transcribe_batches([[u"Hyvää päivää\n"]])), [u"fi: h_y_v_ä_ä p_ä_i_v_ä_ä\n"])
+        self.assertEqual(self.started(), ["-v fi --ipa=3 -q"] * 3)
+
+    def test_espeak_transcribe(self):
+        output = io.StringIO()
+        with EspeakPool("de", command=self.command) as pool:
+            espeak_transcribe("de", [u"Guten Tag\n", u"Straße", "ascii line\n"], output, pool=pool)
+        self.assertEqual(output.getvalue(), u"de: g_u_t_e_n t_a_g\nde: s_t_r_a_ß_e\nde: a_s_c_i_i l_i_n_e\n")
+
+    def test_per_line(self):
+        lines = [u"Yksi kaksi", u"", u"  kolme  ", "four"]
+        with EspeakPool("fi", workers=2, command=self.command) as pool:
+            transcripts = list(pool.transcribe_batches(batches(lines * 3, 5), per_line=True))
+        self.assertEqual([len(batch) for batch in transcripts], [5, 5, 2])
+        self.assertEqual(sum(transcripts, []), [fake_transcript("fi", [line]) for line in lines * 3])
+
+    def test_crash(self):
+        lines = [u"a b", u"c", u"crash d", u"e f"]
+        with EspeakPool("fi", command=self.command) as pool:
+            transcripts = list(pool.transcribe_batches(batches(lines, 2), per_line=True))
+        self.assertEqual(sum(transcripts, []), [fake_transcript("fi", [line]) for line in lines])
+        # Only the batch that was being transcribed was sent to the new eSpeak
+        self.assertEqual(len(self.started()), 2)
+
+    def test_aligned(self):
+        output = io.StringIO()
+        main(io.BytesIO(b"Yksi\n\nkaksi kolme\n"), output, "fi", aligned=True, command=self.command)
+        self.assertEqual(output.getvalue(), u"fi: y_k_s_i\nfi:\nfi: k_a_k_s_i k_o_l_m_e\n")
+
+    def test_hang(self):
+        lines = [u"a b", u"hang c", u"d"]
+        with EspeakPool("fi", command=self.command, timeout=1) as pool:
+            transcripts = list(pool.transcribe_batches(batches(lines, 2), per_line=True))
+        self.assertEqual(sum(transcripts, []), [fake_transcript("fi", [line]) for line in lines])
+        self.assertEqual(len(self.started()), 2)
+
+    def test_block_buffered(self):
+        open(os.path.join(self.directory, "block_buffered"), "w").close()
+        with self.assertRaises(EspeakTimeout):
+            EspeakWorker("fi", command=self.command, timeout=1)
+
+    def test_long_lines(self):
+        rnd = random.Random(2)
+        line = u" ".join(u"".join(rnd.choice(u"abcÄÖß") for _ in xrange(rnd.randint(1, 12))) for _ in xrange(1000))
+        pieces = [unicode(piece, "utf-8") for piece in _encode(line).split("\n")[:-1]]
+        self.assertTrue(len(pieces) > 1)
+        self.assertTrue(all(0 < len(piece.encode("utf-8")) <= MAX_LINE_BYTES for piece in pieces))
+        self.assertEqual(u" ".join(pieces), line)
+        # A word longer than the buffer is broken between characters
+        word = u"ä" * 1000
+        self.assertEqual(u"".join(unicode(piece, "utf-8") for piece in _encode(word).split("\n")), word)
+
+        with EspeakPool("fi", command=self.command) as pool:
+            transcripts = pool.transcribe([line, u"b"], per_line=True)
+        self.assertEqual(transcripts, [fake_transcript("fi", pieces), u"fi: b\n"])
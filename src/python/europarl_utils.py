@@ -23,10 +23,23 @@
 Contents of this module are from Mark's europarl.py. These are intended to be used for the phonetic transcription
 'pipeline' so that documents that are dropped by the text pipeline are likewise dropped without transcribing them."""
 import codecs
+import gzip
+import io
 import re
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
 language_indicator_re = re.compile(r"\([A-Z]{2}\) ")
 
+# File name extensions of compressed transcripts
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "xz": ".xz"}
+
 
 def filter_document(lines):
     lines = [filter_line(line) for line in lines]
@@ -71,3 +84,58 @@ def is_empty_doc(absolute_path):
         lines = i_f.read().split('\n')
         filtered = filter_document(lines)
     return filtered is None or len(filtered) == 0
+
+
+def compression_of(path):
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def strip_compression_extension(path):
+    compression = compression_of(path)
+    if compression is None:
+        return path
+    return path[:-len(COMPRESSION_EXTENSIONS[compression])]
+
+
+def check_unique_documents(paths):
+    """Raises if a document is there both uncompressed and compressed, or compressed in two ways."""
+    documents = {}
+    for path in paths:
+        document = strip_compression_extension(path)
+        if document in documents:
+            raise Exception(u"{} and {} are the same document".format(documents[document], path))
+        documents[document] = path
+
+
+def open_text(path, mode='r', encoding='utf-8', errors='strict'):
+    """Opens a text file, (de)compressing it on the fly if its name ends in .gz or .xz.
+
+    Lines are only split at newlines, like in the uncompressed files.  errors
+    is handled as in unicode.decode().
+
+    """
+    compression = compression_of(path)
+    if compression == "gzip":
+        f = gzip.GzipFile(path, mode + 'b')
+    elif compression == "xz":
+        if lzma is None:
+            raise Exception(u"Reading and writing xz files requires the lzma module (backports.lzma on Python 2)")
+        f = lzma.LZMAFile(path, mode + 'b')
+    else:
+        f = io.open(path, mode + 'b')
+    if compression is not None and mode == 'r':
+        # GzipFile has no read1 on Python 2, which TextIOWrapper needs
+        f = io.BufferedReader(f)
+    return io.TextIOWrapper(f, encoding=encoding, errors=errors, newline='\n')
+
+
+def read_lines(f):
+    """Lines of a text file without their newlines, as split('\\n') would give them."""
+    line = u''
+    for line in f:
+        yield line.rstrip(u'\n')
+    if line == u'' or line.endswith(u'\n'):
+        yield u''
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from europarl_utils import open_text, read_lines, lzma, check_unique_documents
+
+
+class OpenTextTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_round_trip(self, name):
+        path = os.path.join(self.directory, name)
+        for text in [u"", u"\n", u"yksi\r\nkaksi kolme", u"<CHAPTER>\nä_ö ß\n\n"]:
+            with open_text(path, 'w') as f:
+                f.write(text)
+            with open_text(path) as f:
+                self.assertEqual(list(read_lines(f)), text.split(u"\n"))
+
+    def test_plain(self):
+        self.check_round_trip("ep-00-01-17.txt")
+        with open(os.path.join(self.directory, "ep-00-01-17.txt"), "rb") as f:
+            self.assertEqual(f.read(), u"<CHAPTER>\nä_ö ß\n\n".encode("utf-8"))
+
+    def test_gzip(self):
+        self.check_round_trip("ep-00-01-17.txt.gz")
+        with open(os.path.join(self.directory, "ep-00-01-17.txt.gz"), "rb") as f:
+            self.assertEqual(f.read(2), b"\x1f\x8b")
+
+    def test_xz(self):
+        if lzma is None:
+            self.skipTest("no lzma module")
+        self.check_round_trip("ep-00-01-17.txt.xz")
+
+    def test_encoding_errors(self):
+        path = os.path.join(self.directory, "ep-00-01-17.txt.gz")
+        with open_text(path, 'w', encoding='latin-1') as f:
+            f.write(u"ä\n")
+        with open_text(path) as f:
+            self.assertRaises(UnicodeDecodeError, f.read)
+        with open_text(path, errors='replace') as f:
+            self.assertEqual(f.read(), u"\ufffd\n")
+
+    def test_unique_documents(self):
+        check_unique_documents(["fi/ep-00-01-17.txt", "fi/ep-00-01-18.txt.gz", "sv/ep-00-01-17.txt.xz"])
+        self.assertRaises(Exception, check_unique_documents, ["fi/ep-00-01-17.txt", "fi/ep-00-01-17.txt.gz"])
+        self.assertRaises(Exception, check_unique_documents, ["fi/ep-00-01-17.txt.xz", "fi/ep-00-01-17.txt.gz"])
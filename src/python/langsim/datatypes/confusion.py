@@ -136,3 +136,45 @@ class ConfusionMatrixWriter(PimlicoDatatypeWriter):
         with open(os.path.join(self.data_dir, "dictionary"), "w") as f:
             pickle.dump(vocab, f, -1)
         self.task_complete("vocab")
+
+
+class ConfusionMatrices(PimlicoDatatype):
+    """Confusion matrices of many (model language, corpus language) pairs.
+
+    Each matrix is stored as a ConfusionMatrix in a directory of its own;
+    the pairs file lists the directories and the language names.
+
+    """
+    def data_ready(self):
+        return super(ConfusionMatrices, self).data_ready() and os.path.exists(os.path.join(self.data_dir, "pairs"))
+
+    def get_software_dependencies(self):
+        return super(ConfusionMatrices, self).get_software_dependencies() + [numpy_dependency]
+
+    def read_pairs(self):
+        """(model language, corpus language, ConfusionMatrix) triples."""
+        pairs = []
+        with open(os.path.join(self.data_dir, "pairs"), "r") as f:
+            for line in f:
+                directory, model_lang, corpus_lang = line.decode("utf-8").rstrip(u"\n").split(u"\t")
+                pairs.append((model_lang, corpus_lang,
+                              ConfusionMatrix(os.path.join(self.data_dir, directory), self.pipeline)))
+        return pairs
+
+
+class ConfusionMatricesWriter(PimlicoDatatypeWriter):
+    def __init__(self, base_dir, **kwargs):
+        super(ConfusionMatricesWriter, self).__init__(base_dir, **kwargs)
+        self.pairs = []
+
+    def store_matrix(self, directory, model_lang, corpus_lang, vocab, matrix):
+        with ConfusionMatrixWriter(os.path.join(self.data_dir, directory)) as writer:
+            writer.store_vocab(vocab)
+            writer.store_matrix(matrix)
+        self.pairs.append((directory, model_lang, corpus_lang))
+
+    def __exit__(self, *args, **kwargs):
+        with open(os.path.join(self.data_dir, "pairs"), "w") as f:
+            for pair in self.pairs:
+                f.write((u"\t".join(pair) + u"\n").encode("utf-8"))
+        super(ConfusionMatricesWriter, self).__exit__(*args, **kwargs)
@@ -17,8 +17,10 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import os
 import re
 
+from europarl_utils import open_text, read_lines, strip_compression_extension, check_unique_documents
 from langsim.datatypes.raw_lines import RawTextLinesDocumentType
 from pimlico.datatypes.base import InvalidDocument
 from pimlico.datatypes.files import RawTextDirectory
@@ -28,10 +30,24 @@ class EuroparlText(RawTextDirectory):
     """
     Read raw text from Europarl documents in a directory, filtering out the XML info.
 
+    Documents compressed with gzip or xz (.gz or .xz) are decompressed as they are read.  The base class
+    reads files with codecs.open(), so they're read here instead, with the same encoding options.
+
     """
     data_point_type = RawTextLinesDocumentType
     datatype_name = "europarl_raw_text"
 
+    def __iter__(self):
+        encoding = self.options.get("encoding", "utf8")
+        encoding_errors = self.options.get("encoding_errors", "strict")
+        paths = list(self.walk())
+        # A document and its compressed copy would otherwise both be read, under the same name
+        check_unique_documents(paths)
+        for path in paths:
+            with open_text(path, encoding=encoding, errors=encoding_errors) as f:
+                doc = self.filter_document(read_lines(f))
+            yield os.path.basename(strip_compression_extension(path)), doc
+
     def filter_document(self, doc):
         lines = [self.filter_line(line) for line in doc]
         lines = [line for line in lines if line is not None]
@@ -27,6 +27,7 @@ import numpy
 import os
 from pimlico.core.modules.base import BaseModuleExecutor
 from pimlico.datatypes.files import NamedFileWriter
+from langsim.datatypes.confusion import ConfusionMatrices
 
 DOC_TEMPLATE = u"""\
 \\documentclass{article}
@@ -67,14 +68,18 @@ MIN_RELEVANT_FREQ = 0.02
 class ModuleExecutor(BaseModuleExecutor):
     def execute(self):
         # We've got lots of confusion matrices and accompanying vocabularies, which we need to understand them
-        matrices = self.info.get_input("matrix")
+        matrices = []
+        for matrix_input in self.info.get_input("matrix"):
+            if isinstance(matrix_input, ConfusionMatrices):
+                matrices.extend(matrix_input.read_pairs())
+            else:
+                # Get the language names from modvars
+                matrices.append((matrix_input.module.module_variables["model_lang"],
+                                 matrix_input.module.module_variables["corpus_lang"], matrix_input))
 
         # Produce a section for every language pair
         sections = {}
-        for conf_mat in matrices:
-            # Get the language names from modvars
-            model_lang = conf_mat.module.module_variables["model_lang"]
-            corpus_lang = conf_mat.module.module_variables["corpus_lang"]
+        for model_lang, corpus_lang, conf_mat in matrices:
             # Find the most consistently confused target-prediction pairs
             top_confs = conf_mat.top_confusions(min_target_freq=MIN_RELEVANT_FREQ)
             conf_dist = conf_mat.matrix / conf_mat.matrix.sum(axis=1)[:, None]
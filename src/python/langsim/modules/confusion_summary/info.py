@@ -17,7 +17,7 @@
 # along with data-driven-language-typology.  If not, see
 # <http://www.gnu.org/licenses/>.
 #
-from langsim.datatypes.confusion import ConfusionMatrix
+from langsim.datatypes.confusion import ConfusionMatrix, ConfusionMatrices
 from pimlico.core.modules.base import BaseModuleInfo
 from pimlico.datatypes.base import MultipleInputs
 from pimlico.datatypes.files import NamedFile
@@ -26,5 +26,6 @@ from pimlico.datatypes.files import NamedFile
 class ModuleInfo(BaseModuleInfo):
     module_type_name = "confusion_summary"
     module_readable_name = "Collect confusion matrices and output a big summary into one document"
-    module_inputs = [("matrix", MultipleInputs(ConfusionMatrix))]
+    # Either one matrix per language pair or all of them from all_pairs_distance
+    module_inputs = [("matrix", MultipleInputs((ConfusionMatrix, ConfusionMatrices)))]
     module_outputs = [("latex", NamedFile("perplexities.tex"))]
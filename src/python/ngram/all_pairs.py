@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import math
+
+import numpy as np
+
+from ngram.batch import model_symbols, batch_log_probability
+from ngram.packed import pack_ids, unpack_ids
+
+
+class AllPairsHistograms(object):
+    """Histograms of all (model, corpus) pairs stacked into one sparse count matrix over shared n-gram keys.
+
+    Each corpus histogram is substituted with the substitution map of each
+    model it is paired with.  Pairs with the same corpus and map share a row,
+    so without substitution maps there is a row per corpus.  The columns are
+    the distinct substituted n-grams of all rows, packed over the symbol table.
+    Rows are stored in compressed sparse row form: the columns and counts of
+    row i are columns[indptr[i]:indptr[i + 1]] and counts[indptr[i]:indptr[i + 1]].
+
+    """
+    def __init__(self, histograms, model_labels, substitution_maps, symbols):
+        self.symbols = symbols
+        self.order = None
+        self.pair_rows = {}
+
+        row_index = {}
+        row_ids = []
+        row_counts = []
+        for corpus_label, histogram in sorted(histograms.iteritems()):
+            if self.order is None:
+                self.order = histogram.order
+            elif histogram.order != self.order:
+                raise Exception(u'Histograms of different orders: {} and {}'.format(self.order, histogram.order))
+
+            for model_label in model_labels:
+                substitution_map = substitution_maps.get((model_label, corpus_label), {})
+                row_key = (corpus_label, frozenset(substitution_map.iteritems()))
+                if row_key not in row_index:
+                    ids, counts = histogram.substituted_ids(symbols, substitution_map)
+                    row_index[row_key] = len(row_ids)
+                    row_ids.append(ids)
+                    row_counts.append(counts)
+                self.pair_rows[(model_label, corpus_label)] = row_index[row_key]
+
+        # Substitution may have added symbols, so pack only once all rows are done
+        self.radix = len(symbols)
+        packed = [pack_ids(tuple(ids[:, i] for i in xrange(self.order)), self.radix) for ids in row_ids]
+        self.keys, columns = np.unique(np.concatenate(packed), return_inverse=True)
+
+        # A substitution can merge keys within a row, so sum their counts
+        self.indptr = np.zeros(len(packed) + 1, dtype=np.int64)
+        row_columns = []
+        merged_counts = []
+        start = 0
+        for index, (keys, counts) in enumerate(zip(packed, row_counts)):
+            unique_columns, inverse = np.unique(columns[start:start + len(keys)], return_inverse=True)
+            start += len(keys)
+            row_columns.append(unique_columns)
+            merged_counts.append(np.bincount(inverse, weights=counts, minlength=len(unique_columns)))
+            self.indptr[index + 1] = self.indptr[index] + len(unique_columns)
+        self.columns = np.concatenate(row_columns)
+        self.counts = np.concatenate(merged_counts)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row(self, index):
+        """Columns and counts of a row."""
+        start, end = self.indptr[index], self.indptr[index + 1]
+        return self.columns[start:end], self.counts[start:end]
+
+    def row_pairs(self):
+        """The (model label, corpus label) pairs of each row, as row => list of pairs."""
+        row_pairs = {}
+        for pair, row in self.pair_rows.iteritems():
+            row_pairs.setdefault(row, []).append(pair)
+        return row_pairs
+
+    def pair_dot(self, values, model_labels):
+        """Products of each row with the rows of values of the models it is paired with, as pair => product.
+
+        values has a row per label in model_labels.  With a substitution map per
+        pair, a row belongs to a single model, so only that product is computed.
+
+        """
+        model_index = {label: index for index, label in enumerate(model_labels)}
+        result = {}
+        for row, pairs in self.row_pairs().iteritems():
+            columns, counts = self.row(row)
+            products = values[np.ix_([model_index[model_label] for model_label, _ in pairs], columns)].dot(counts)
+            for pair, product in zip(pairs, products):
+                result[pair] = float(product)
+        return result
+
+    def log_probabilities(self, models):
+        """Matrix of log2 probabilities of the keys, a row per model, and a matrix of which of them are known."""
+        id_columns = unpack_ids(self.keys, self.radix, self.order)
+        log_probabilities = np.empty((len(models), len(self.keys)), dtype=np.float64)
+        for index, model in enumerate(models):
+            if model_symbols(model) is not self.symbols:
+                raise Exception(u'Model {} is not over the shared symbol table'.format(type(model)))
+            log_probabilities[index] = batch_log_probability(model, id_columns)
+        known = ~np.isnan(log_probabilities)
+        log_probabilities[~known] = 0.0
+        return log_probabilities, known
+
+
+def _check_handled(transitions_handled, model_label, corpus_label):
+    if transitions_handled == 0:
+        raise Exception(u'Model {} handled no transitions of corpus {}, which may be empty'
+                        .format(model_label, corpus_label))
+
+
+def perplexity_matrix(histograms, models, substitution_maps, symbols):
+    """Perplexities of all models on all corpus histograms as (model label, corpus label) => perplexity.
+
+    The log probability sums and the numbers of handled transitions of all
+    pairs are products of the stacked histograms with the models' log
+    probabilities, each row only with the models it is paired with.  Models
+    must be over the given symbol table; substitution_maps holds the map of
+    each (model label, corpus label) pair that has one.
+
+    """
+    model_labels = sorted(models)
+    stacked = AllPairsHistograms(histograms, model_labels, substitution_maps, symbols)
+    log_probabilities, known = stacked.log_probabilities([models[label] for label in model_labels])
+
+    log_sums = stacked.pair_dot(log_probabilities, model_labels)
+    handled = stacked.pair_dot(known.astype(np.float64), model_labels)
+
+    result = {}
+    for (model_label, corpus_label), log_sum in log_sums.iteritems():
+        _check_handled(handled[(model_label, corpus_label)], model_label, corpus_label)
+        result[(model_label, corpus_label)] = \
+            math.pow(2, - 1 * log_sum / handled[(model_label, corpus_label)])
+    return result
+
+
+def kita_matrix(histograms, models, corpus_models, substitution_maps, symbols):
+    """Kita distances of all models on all corpus histograms as (model label, corpus label) => distance.
+
+    corpus_models holds the model of each corpus label.  The distances of a
+    row of the stacked histograms to the models it is paired with are a single
+    matrix-vector product over the row's keys.
+
+    """
+    model_labels = sorted(models)
+    model_index = {label: index for index, label in enumerate(model_labels)}
+    stacked = AllPairsHistograms(histograms, model_labels, substitution_maps, symbols)
+    log_probabilities, known = stacked.log_probabilities([models[label] for label in model_labels])
+    corpus_labels = sorted(histograms)
+    corpus_log_probabilities, corpus_known = stacked.log_probabilities([corpus_models[label]
+                                                                        for label in corpus_labels])
+
+    result = {}
+    for row, pairs in stacked.row_pairs().iteritems():
+        corpus_index = corpus_labels.index(pairs[0][1])
+        columns, counts = stacked.row(row)
+        cells = np.ix_([model_index[model_label] for model_label, _ in pairs], columns)
+        handled = known[cells] & corpus_known[corpus_index, columns]
+        contributions = np.abs(corpus_log_probabilities[corpus_index, columns] - log_probabilities[cells]) * handled
+        log_sums = contributions.dot(counts)
+        transitions_handled = handled.astype(np.float64).dot(counts)
+        for (model_label, corpus_label), log_sum, pair_handled in zip(pairs, log_sums, transitions_handled):
+            _check_handled(pair_handled, model_label, corpus_label)
+            result[(model_label, corpus_label)] = float(log_sum) / float(pair_handled)
+    return result
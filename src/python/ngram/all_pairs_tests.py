@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import unittest
+
+import numpy as np
+
+from ngram.all_pairs import AllPairsHistograms, perplexity_matrix, kita_matrix
+from ngram.testing import random_tokens, build_models
+from ngram.histogram import TransitionHistogram
+from ngram.models import DeletedInterpolationTrigramModel
+from ngram.packed import SymbolTable
+
+
+class AllPairsTest(unittest.TestCase):
+    def setUp(self):
+        self.symbols = SymbolTable()
+        alphabets = {'a': u'abcde', 'b': u'abcdx', 'c': u'bcdyz'}
+        vocabulary = set(u'abcdexyz') | {u'WB'}
+        self.models = {}
+        self.histograms = {}
+        for seed, (label, alphabet) in enumerate(sorted(alphabets.iteritems())):
+            ug, bg, tg = build_models(random_tokens(alphabet, 2000, seed), self.symbols,
+                                      additional_vocabulary=vocabulary)
+            self.models[label] = DeletedInterpolationTrigramModel(tg, bg, ug)
+            self.histograms[label] = TransitionHistogram.from_tokens(random_tokens(alphabet, 1000, 10 + seed), 3)
+        self.substitution_maps = {('a', 'b'): {u'x': u'e'}, ('c', 'b'): {u'x': u'y'}, ('c', 'a'): {u'x': u'y'},
+                                  ('a', 'c'): {u'y': u'a', u'z': u'e'}}
+
+    def test_perplexity(self):
+        result = perplexity_matrix(self.histograms, self.models, self.substitution_maps, self.symbols)
+        self.assertEqual(9, len(result))
+        for (model_label, corpus_label), distance in result.iteritems():
+            expected = self.histograms[corpus_label].perplexity(
+                self.models[model_label], self.substitution_maps.get((model_label, corpus_label)))
+            self.assertAlmostEqual(expected, distance, 10)
+
+    def test_kita(self):
+        result = kita_matrix(self.histograms, self.models, self.models, self.substitution_maps, self.symbols)
+        self.assertEqual(9, len(result))
+        for (model_label, corpus_label), distance in result.iteritems():
+            expected = self.histograms[corpus_label].kita_distance(
+                self.models[model_label], self.models[corpus_label],
+                self.substitution_maps.get((model_label, corpus_label)))
+            self.assertAlmostEqual(expected, distance, 10)
+
+    def test_sparse_rows(self):
+        stacked = AllPairsHistograms(self.histograms, sorted(self.models), self.substitution_maps, self.symbols)
+        for (model_label, corpus_label), row in stacked.pair_rows.iteritems():
+            columns, counts = stacked.row(row)
+            self.assertEqual(len(set(columns)), len(columns))
+            self.assertEqual(sum(self.histograms[corpus_label].transition_count.values()), counts.sum())
+
+    def test_pair_dot(self):
+        # A map for every pair gives a row per pair, each of which is only multiplied with its own model
+        maps = {(model_label, corpus_label): {u'x': u'e'} if model_label == corpus_label else {u'z': model_label}
+                for model_label in self.models for corpus_label in self.histograms}
+        model_labels = sorted(self.models)
+        stacked = AllPairsHistograms(self.histograms, model_labels, maps, self.symbols)
+        self.assertEqual(9, len(stacked))
+        values = np.random.RandomState(0).rand(len(model_labels), len(stacked.keys))
+        products = stacked.pair_dot(values, model_labels)
+        self.assertEqual(set(stacked.pair_rows), set(products))
+        for (model_label, corpus_label), product in products.iteritems():
+            columns, counts = stacked.row(stacked.pair_rows[(model_label, corpus_label)])
+            self.assertAlmostEqual(values[model_labels.index(model_label), columns].dot(counts), product, 10)
+
+    def test_empty_corpus(self):
+        self.histograms['b'] = TransitionHistogram(3)
+        with self.assertRaisesRegexp(Exception, u'handled no transitions of corpus b'):
+            perplexity_matrix(self.histograms, self.models, self.substitution_maps, self.symbols)
+        with self.assertRaisesRegexp(Exception, u'handled no transitions of corpus b'):
+            kita_matrix(self.histograms, self.models, self.models, self.substitution_maps, self.symbols)
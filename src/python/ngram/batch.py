@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import collections
+import math
+
+import numpy as np
+
+from ngram.models import DeletedInterpolationBigramModel, DeletedInterpolationTrigramModel
+from ngram.packed import LOG_2, pack_ids, unpack_ids
+
+
+WORD_BOUNDARY = u"WB"
+
+
+class TokenBatch(object):
+    """A run of tokens as columns: symbol ids and word boundary flags."""
+    def __init__(self, ids, is_beginning, is_ending, symbols):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.is_beginning = np.asarray(is_beginning, dtype=bool)
+        self.is_ending = np.asarray(is_ending, dtype=bool)
+        self.symbols = symbols
+
+    @classmethod
+    def from_tokens(cls, tokens, symbols):
+        """Encodes Token objects, interning letters not yet in the symbol table."""
+        ids = []
+        beginnings = []
+        endings = []
+        for token in tokens:
+            ids.append(symbols.add(token.letter))
+            beginnings.append(token.is_beginning)
+            endings.append(token.is_ending)
+        return cls(ids, beginnings, endings, symbols)
+
+    @classmethod
+    def from_rows(cls, rows, symbols):
+        """Encodes (letter, is_beginning, is_ending) tuples, as yielded by the tokenizers' letter_gen."""
+        ids = []
+        beginnings = []
+        endings = []
+        for letter, is_beginning, is_ending in rows:
+            ids.append(symbols.add(letter))
+            beginnings.append(is_beginning)
+            endings.append(is_ending)
+        return cls(ids, beginnings, endings, symbols)
+
+    @classmethod
+    def concatenate(cls, batches, symbols):
+        """Joins batches encoded with the same symbol table."""
+        batches = list(batches)
+        if not batches:
+            return cls([], [], [], symbols)
+        return cls(np.concatenate([batch.ids for batch in batches]),
+                   np.concatenate([batch.is_beginning for batch in batches]),
+                   np.concatenate([batch.is_ending for batch in batches]),
+                   symbols)
+
+    def recode(self, symbols):
+        """The same tokens with ids of another symbol table, interning letters it lacks."""
+        if symbols is self.symbols:
+            return self
+        mapping = np.array([symbols.add(letter) for letter in self.symbols], dtype=np.int64)
+        return TokenBatch(mapping[self.ids], self.is_beginning, self.is_ending, symbols)
+
+    def letters(self):
+        return self.symbols.decode(self.ids)
+
+    def rows(self):
+        """(letter, is_beginning, is_ending) tuples, for code without a columnar path."""
+        return zip(self.letters(), self.is_beginning.tolist(), self.is_ending.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("TokenBatch only supports slicing")
+        return TokenBatch(self.ids[index], self.is_beginning[index], self.is_ending[index], self.symbols)
+
+
+def expand_word_boundaries(batch, word_boundary_id, context):
+    """Symbol stream as the sinks see it: the context, then the tokens with a
+    word boundary inserted after every word ending."""
+    endings_before = np.cumsum(batch.is_ending) - batch.is_ending
+    stream = np.empty(len(context) + len(batch) + int(batch.is_ending.sum()), dtype=np.int64)
+    stream.fill(word_boundary_id)
+    stream[:len(context)] = context
+    stream[len(context) + np.arange(len(batch)) + endings_before] = batch.ids
+    return stream
+
+
+def ngram_columns(stream, order):
+    length = len(stream) - order + 1
+    return tuple(stream[i:i + length] for i in xrange(order))
+
+
+def count_ids(id_columns, symbols):
+    """Counts of the n-grams in id_columns, keyed by token tuples (tokens for unigrams)."""
+    result = {}
+    if len(id_columns[0]) == 0:
+        return result
+    radix = len(symbols)
+    packed, counts = np.unique(pack_ids(id_columns, radix), return_counts=True)
+    for key, count in zip(packed, counts):
+        key = tuple(symbols.decode(unpack_ids(int(key), radix, len(id_columns))))
+        result[key if len(key) > 1 else key[0]] = int(count)
+    return result
+
+
+def count_ngrams(batch, context, order):
+    """Counts the n-grams the builder sinks would count for the tokens in batch.
+
+    Returns the counts and the stream of symbol ids they were taken over: the
+    context followed by the tokens, with word boundaries after word endings.
+
+    """
+    symbols = batch.symbols
+    context_ids = np.array([symbols.add(item) for item in context], dtype=np.int64)
+    stream = expand_word_boundaries(batch, symbols.add(WORD_BOUNDARY), context_ids)
+    return count_ids(ngram_columns(stream, order), symbols), stream
+
+
+def model_symbols(model):
+    """Symbol table of a model, or None if the model can't be scored in batches."""
+    components = interpolation_components(model)
+    if components is not None:
+        symbols = getattr(components[0][0], 'symbols', None)
+        for component, _ in components:
+            if getattr(component, 'symbols', None) is not symbols:
+                return None
+        return symbols
+    return getattr(model, 'symbols', None)
+
+
+def interpolation_components(model):
+    """(model, weight) pairs of an interpolated model, highest order first."""
+    if isinstance(model, DeletedInterpolationTrigramModel):
+        return [(model.trigram_model, model.trigram_model_weight),
+                (model.bigram_model, model.bigram_model_weight),
+                (model.unigram_model, model.unigram_model_weight)]
+    elif isinstance(model, DeletedInterpolationBigramModel):
+        return [(model.bigram_model, model.bigram_model_weight),
+                (model.unigram_model, model.unigram_model_weight)]
+    return None
+
+
+def interpolate(probabilities, weights):
+    """Weighted sum of component probabilities, with missing (NaN) ones counting as zero.
+
+    The sum is NaN where all components are missing.  Terms are added in the
+    same order as in the interpolated models' probability().
+
+    """
+    missing = np.isnan(probabilities[0])
+    result = np.nan_to_num(probabilities[0]) * weights[0]
+    for component_probabilities, weight in zip(probabilities[1:], weights[1:]):
+        missing &= np.isnan(component_probabilities)
+        result = result + np.nan_to_num(component_probabilities) * weight
+    result[missing] = np.nan
+    return result
+
+
+def batch_probability(model, id_columns):
+    """Probabilities of the n-grams in id_columns; NaN where the model gives none."""
+    components = interpolation_components(model)
+    if components is not None:
+        return interpolate([component.batch_probability(id_columns[index:])
+                            for index, (component, _) in enumerate(components)],
+                           [weight for _, weight in components])
+    return model.batch_probability(id_columns)
+
+
+def batch_log_probability(model, id_columns):
+    """log2 probabilities of the n-grams in id_columns; NaN where the model gives none."""
+    if interpolation_components(model) is not None:
+        return np.log(batch_probability(model, id_columns)) / LOG_2
+    return model.batch_log_probability(id_columns)
+
+
+def _sequential_sum(start, values):
+    # Adds values one at a time like the sinks do, so the float result is identical
+    return float(np.add.accumulate(np.r_[start, values])[-1])
+
+
+class BatchScorer(object):
+    """Common n-gram context handling of the batch scorers.
+
+    Like the per-token sinks, the context carries over from one scored batch to
+    the next, and transition_count holds the substituted transitions seen.
+
+    """
+    def __init__(self, model, substitution_map=None):
+        self.model = model
+        self.order = model.order
+        self.symbols = model_symbols(model)
+        if self.symbols is None:
+            raise Exception(u'No batch scoring for {}'.format(type(model)))
+
+        self.word_boundary_id = self.symbols.add(WORD_BOUNDARY)
+        self.context = np.array([self.word_boundary_id] * (self.order - 1), dtype=np.int64)
+
+        pairs = [(self.symbols.add(k), self.symbols.add(v))
+                 for k, v in (substitution_map or {}).iteritems()]
+        self._substitution = np.arange(len(self.symbols), dtype=np.int64)
+        for k, v in pairs:
+            self._substitution[k] = v
+
+        self.log_sum = 0
+        self.transitions_handled = 0
+        self.transition_count = collections.defaultdict(int)
+
+    def substitute(self, ids):
+        if len(ids) > 0 and ids.max() >= len(self._substitution):
+            self._substitution = np.r_[self._substitution,
+                                       np.arange(len(self._substitution), len(self.symbols), dtype=np.int64)]
+        return self._substitution[ids]
+
+    def _count_transitions(self, id_columns):
+        for key, count in count_ids(id_columns, self.symbols).iteritems():
+            self.transition_count[key] += count
+
+    def columns(self, batch):
+        if self.order == 1:
+            return (self.substitute(batch.ids),)
+        stream = expand_word_boundaries(batch, self.word_boundary_id, self.context)
+        self.context = stream[len(stream) - self.order + 1:]
+        return ngram_columns(self.substitute(stream), self.order)
+
+
+class BatchPerplexityScorer(BatchScorer):
+    """Batch counterpart of the *ModelPerplexitySink classes."""
+    def score(self, batch):
+        id_columns = self.columns(batch)
+        log_probabilities = batch_log_probability(self.model, id_columns)
+        handled = ~np.isnan(log_probabilities)
+
+        self.log_sum = _sequential_sum(self.log_sum, log_probabilities[handled])
+        self.transitions_handled += int(handled.sum())
+        if self.order == 1:
+            # The unigram sink counts the original letters of handled tokens only
+            self._count_transitions((batch.ids[handled],))
+        else:
+            self._count_transitions(id_columns)
+
+    def distance(self):
+        return math.pow(2, - 1 * self.log_sum / float(self.transitions_handled))
+
+
+class BatchKitaDistanceScorer(BatchScorer):
+    """Batch counterpart of the *ModelKitaDistanceSink classes."""
+    def __init__(self, model, corpus_model, substitution_map=None):
+        super(BatchKitaDistanceScorer, self).__init__(model, substitution_map=substitution_map)
+        if model_symbols(corpus_model) is not self.symbols:
+            raise Exception(u'Model and corpus model must share a symbol table')
+        self.corpus_model = corpus_model
+
+    def score(self, batch):
+        id_columns = self.columns(batch)
+        log_probabilities = batch_log_probability(self.model, id_columns)
+        corpus_log_probabilities = batch_log_probability(self.corpus_model, id_columns)
+        handled = ~(np.isnan(log_probabilities) | np.isnan(corpus_log_probabilities))
+
+        contributions = np.abs(corpus_log_probabilities[handled] - log_probabilities[handled])
+        self.log_sum = _sequential_sum(self.log_sum, contributions)
+        self.transitions_handled += int(handled.sum())
+        self._count_transitions(id_columns)
+
+    def distance(self):
+        return self.log_sum / float(self.transitions_handled)
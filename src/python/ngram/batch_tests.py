@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import unittest
+
+from ngram.batch import TokenBatch, BatchPerplexityScorer, BatchKitaDistanceScorer
+from ngram.models import UnigramModelBuilderTokenSink, BigramModelBuilderTokenSink, TrigramModelBuilderTokenSink, \
+    UnigramModelPerplexitySink, BigramModelPerplexitySink, TrigramModelPerplexitySink, TrigramModelKitaDistanceSink, \
+    BigramModelKitaDistanceSink, DeletedInterpolationBigramModel, DeletedInterpolationTrigramModel, \
+    UnigramModel, BigramModel, TrigramModel, MultiOrderModelBuilderTokenSink, calculate_perplexity
+from ngram.histogram import TransitionHistogram
+from ngram.packed import SymbolTable
+from ngram.testing import random_tokens, build_models, NullLogger
+
+
+class BatchScorerTest(unittest.TestCase):
+    def setUp(self):
+        self.symbols = SymbolTable()
+        vocabulary = [u'a', u'b', u'c', u'd', u'e', u'WB']
+        self.ug, self.bg, self.tg = build_models(random_tokens(u'abcde', 2000, 1), self.symbols,
+                                                 additional_vocabulary=vocabulary + [u'x'])
+        self.corpus_ug, self.corpus_bg, self.corpus_tg = build_models(random_tokens(u'abcdx', 2000, 2), self.symbols,
+                                                                      additional_vocabulary=vocabulary + [u'x'])
+        self.test_tokens = random_tokens(u'abcdxy', 3000, 3)
+        self.substitution_map = {u'x': u'e'}
+
+    def assert_same_as_sink(self, sink, scorer, batch_count=3):
+        for token in self.test_tokens:
+            sink.handle(token)
+        step = len(self.test_tokens) // batch_count + 1
+        for start in xrange(0, len(self.test_tokens), step):
+            scorer.score(TokenBatch.from_tokens(self.test_tokens[start:start + step], self.symbols))
+
+        self.assertEqual(sink.transitions_handled, scorer.transitions_handled)
+        self.assertEqual(sink.log_sum, scorer.log_sum)
+        self.assertEqual(sink.distance(), scorer.distance())
+        self.assertEqual(dict(sink.transition_count), dict(scorer.transition_count))
+
+    def test_perplexity(self):
+        for sink_class, model in [(UnigramModelPerplexitySink, self.ug), (BigramModelPerplexitySink, self.bg),
+                                  (TrigramModelPerplexitySink, self.tg)]:
+            for substitution_map in [None, self.substitution_map]:
+                self.assert_same_as_sink(sink_class(model, substitution_map=substitution_map),
+                                         BatchPerplexityScorer(model, substitution_map=substitution_map))
+
+    def test_interpolated_perplexity(self):
+        bg_model = DeletedInterpolationBigramModel(self.bg, self.ug)
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        self.assert_same_as_sink(BigramModelPerplexitySink(bg_model, substitution_map=self.substitution_map),
+                                 BatchPerplexityScorer(bg_model, substitution_map=self.substitution_map))
+        self.assert_same_as_sink(TrigramModelPerplexitySink(tg_model, substitution_map=self.substitution_map),
+                                 BatchPerplexityScorer(tg_model, substitution_map=self.substitution_map))
+
+    def test_kita(self):
+        self.assert_same_as_sink(BigramModelKitaDistanceSink(self.bg, self.corpus_bg),
+                                 BatchKitaDistanceScorer(self.bg, self.corpus_bg))
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        corpus_tg_model = DeletedInterpolationTrigramModel(self.corpus_tg, self.corpus_bg, self.corpus_ug)
+        self.assert_same_as_sink(TrigramModelKitaDistanceSink(tg_model, corpus_tg_model),
+                                 BatchKitaDistanceScorer(tg_model, corpus_tg_model))
+
+    def test_calculate_perplexity(self):
+        sink = TrigramModelPerplexitySink(self.tg)
+        for token in self.test_tokens:
+            sink.handle(token)
+        self.assertEqual(sink.distance(), calculate_perplexity(self.tg, self.test_tokens))
+
+
+class HandleBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.symbols = SymbolTable()
+        self.ug, self.bg, self.tg = build_models(random_tokens(u'abcde', 2000, 1), self.symbols,
+                                                 additional_vocabulary=[u'WB', u'x'])
+        # Literal WB letters exercise the unigram builder's word boundary handling
+        self.tokens = random_tokens([u'a', u'b', u'c', u'x', u'y', u'WB'], 3000, 4)
+
+    def batches(self, symbols, sizes=(1, 7, 500, 0, 1000)):
+        start = 0
+        for size in sizes:
+            yield TokenBatch.from_tokens(self.tokens[start:start + size], symbols)
+            start += size
+        yield TokenBatch.from_tokens(self.tokens[start:], symbols)
+
+    def feed(self, token_sink, batch_sink, symbols):
+        for token in self.tokens:
+            token_sink.handle(token)
+        for batch in self.batches(symbols):
+            batch_sink.handle_batch(batch)
+
+    def test_builders(self):
+        for sink_class in [BigramModelBuilderTokenSink, TrigramModelBuilderTokenSink]:
+            token_sink, batch_sink = sink_class(NullLogger()), sink_class(NullLogger())
+            self.feed(token_sink, batch_sink, SymbolTable())
+            self.assertEqual(dict(token_sink.transition_counts), dict(batch_sink.transition_counts))
+            self.assertEqual(token_sink.head, batch_sink.head)
+            self.assertEqual(token_sink.context, batch_sink.context)
+
+        token_sink, batch_sink = UnigramModelBuilderTokenSink(NullLogger()), UnigramModelBuilderTokenSink(NullLogger())
+        self.feed(token_sink, batch_sink, SymbolTable())
+        self.assertEqual(dict(token_sink.token_counts), dict(batch_sink.token_counts))
+        self.assertEqual(token_sink.previous, batch_sink.previous)
+        self.assertEqual(token_sink.leading_word_boundaries, batch_sink.leading_word_boundaries)
+
+        token_sink, batch_sink = MultiOrderModelBuilderTokenSink(NullLogger()), \
+            MultiOrderModelBuilderTokenSink(NullLogger())
+        self.feed(token_sink, batch_sink, SymbolTable())
+        self.assertEqual(dict(token_sink.bigram_counts), dict(batch_sink.bigram_counts))
+
+    def test_histograms(self):
+        for order in [1, 3]:
+            token_histogram, batch_histogram = TransitionHistogram(order), TransitionHistogram(order)
+            self.feed(token_histogram, batch_histogram, SymbolTable())
+            self.assertEqual(dict(token_histogram.transition_count), dict(batch_histogram.transition_count))
+
+    def test_scoring_sinks(self):
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        substitution_map = {u'y': u'e'}
+        for make_sink in [lambda: UnigramModelPerplexitySink(self.ug, substitution_map=substitution_map),
+                          lambda: BigramModelPerplexitySink(self.bg),
+                          lambda: TrigramModelPerplexitySink(tg_model, substitution_map=substitution_map),
+                          lambda: TrigramModelKitaDistanceSink(self.tg, tg_model)]:
+            # Shared symbol table, scored in batches, and a separate one, scored token by token
+            for symbols in [self.symbols, SymbolTable()]:
+                token_sink, batch_sink = make_sink(), make_sink()
+                self.feed(token_sink, batch_sink, symbols)
+                self.assertEqual(token_sink.log_sum, batch_sink.log_sum)
+                self.assertEqual(token_sink.transitions_handled, batch_sink.transitions_handled)
+                self.assertEqual(dict(token_sink.transition_count), dict(batch_sink.transition_count))
+
+    def test_calculate_perplexity(self):
+        batch = TokenBatch.from_tokens(self.tokens, SymbolTable())
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        self.assertEqual(calculate_perplexity(self.tg, self.tokens), calculate_perplexity(self.tg, batch))
+        self.assertEqual(calculate_perplexity(tg_model, self.tokens), calculate_perplexity(tg_model, batch))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import numpy as np
+
+from ngram import packed
+from ngram.batch import interpolation_components, interpolate
+from ngram.packed import LOG_2, PackedTable, pack_ids, unpack_ids
+
+
+# Dense tables are filled this many entries at a time to bound peak memory
+_COMPILE_CHUNK_SIZE = 1 << 18
+
+
+class CompiledInterpolationModel(object):
+    """A deleted interpolation model flattened into one log2 probability table.
+
+    The table covers every n-gram over the shared symbol table when that fits
+    in packed.DENSE_TABLE_LIMIT entries.  Otherwise only the n-grams seen by
+    the highest-order component are stored, and unseen ones back off to a
+    table over the lower orders (or, if the highest-order component is
+    smoothed, are interpolated on demand).  The weights are read once, so the
+    model has to be compiled again if they change.
+
+    """
+    def __init__(self, model, dense=None):
+        self.model = model
+        self.components = interpolation_components(model)
+        if self.components is None:
+            raise Exception(u"Not an interpolated model: {}".format(model))
+
+        self.symbols = self.components[0][0].symbols
+        for component, _ in self.components:
+            if getattr(component, 'symbols', None) is not self.symbols:
+                raise Exception(u"Components of an interpolated model must share a symbol table")
+
+        self.order = len(self.components)
+        self.weights = [weight for _, weight in self.components]
+        self.radix = len(self.symbols)
+        # Per-key lookups are answered from a plain dict once seen
+        self._log_probabilities = {}
+
+        if dense is None:
+            dense = self.radix ** self.order <= packed.DENSE_TABLE_LIMIT
+
+        self.backoff = None
+        if dense:
+            size = self.radix ** self.order
+            values = np.empty(size, dtype=np.float64)
+            for start in xrange(0, size, _COMPILE_CHUNK_SIZE):
+                keys = np.arange(start, min(start + _COMPILE_CHUNK_SIZE, size), dtype=np.int64)
+                values[start:start + len(keys)] = \
+                    self._interpolated_log_probability(unpack_ids(keys, self.radix, self.order))
+            self.table = PackedTable(self.order, self.radix, np.arange(size, dtype=np.int64), values, dense=True)
+        else:
+            top = self.components[0][0]
+            id_columns = unpack_ids(top.counts.keys, top.radix, self.order)
+            self.table = PackedTable(self.order, self.radix, pack_ids(id_columns, self.radix),
+                                     self._interpolated_log_probability(id_columns), dense=False)
+
+            if top.log_fallback is None:
+                if self.radix ** (self.order - 1) > packed.DENSE_TABLE_LIMIT:
+                    raise Exception(u"Vocabulary of {} symbols too large to compile".format(self.radix))
+                size = self.radix ** (self.order - 1)
+                keys = np.arange(size, dtype=np.int64)
+                id_columns = unpack_ids(keys, self.radix, self.order - 1)
+                missing = np.empty(size, dtype=np.float64)
+                missing.fill(np.nan)
+                probabilities = [missing] + \
+                                [component.batch_probability(id_columns[index:])
+                                 for index, (component, _) in enumerate(self.components[1:])]
+                self.backoff = PackedTable(self.order - 1, self.radix, keys,
+                                           np.log(interpolate(probabilities, self.weights)) / LOG_2,
+                                           dense=True)
+
+    def _interpolated_log_probability(self, id_columns):
+        probabilities = [component.batch_probability(id_columns[index:])
+                         for index, (component, _) in enumerate(self.components)]
+        return np.log(interpolate(probabilities, self.weights)) / LOG_2
+
+    def batch_probability(self, id_columns):
+        return interpolate([component.batch_probability(id_columns[index:])
+                            for index, (component, _) in enumerate(self.components)],
+                           self.weights)
+
+    def batch_log_probability(self, id_columns):
+        """Vectorized log_probability() over columns of symbol ids; missing values are NaN."""
+        known = np.ones(len(id_columns[0]), dtype=bool)
+        for column in id_columns:
+            known &= column < self.radix
+        packed_keys = pack_ids([np.where(known, column, 0) for column in id_columns], self.radix)
+        result = self.table.lookup(packed_keys)
+
+        if not self.table.is_dense:
+            unseen = np.isnan(result) & known
+            if self.backoff is not None:
+                result[unseen] = self.backoff.lookup(packed_keys[unseen] % self.backoff.radix ** self.backoff.order)
+            else:
+                result[unseen] = self._interpolated_log_probability([column[unseen] for column in id_columns])
+
+        # Symbols interned after compiling are left to the components
+        if not known.all():
+            result[~known] = self._interpolated_log_probability([column[~known] for column in id_columns])
+        return result
+
+    def log_probability(self, key, missing_value=None):
+        tmp = self._log_probabilities.get(key, None)
+        if tmp is None:
+            tmp = self._log_probability(key)
+            if tmp is None:
+                return missing_value
+            self._log_probabilities[key] = tmp
+        return tmp
+
+    def _log_probability(self, key):
+        packed_key = 0
+        for token in key:
+            id_ = self.symbols.token2id.get(token, None)
+            if id_ is None or id_ >= self.radix:
+                return self.model.log_probability(key, None)
+            packed_key = packed_key * self.radix + id_
+
+        result = self.table.get(packed_key)
+        if result != result and not self.table.is_dense:
+            if self.backoff is None:
+                return self.model.log_probability(key, None)
+            result = self.backoff.get(packed_key % self.backoff.radix ** self.backoff.order)
+        if result != result:
+            return None
+        return float(result)
+
+    def probability(self, key, missing_value=None):
+        return self.model.probability(key, missing_value)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import itertools
+import unittest
+
+import numpy as np
+
+from ngram.batch import TokenBatch, BatchPerplexityScorer
+from ngram.testing import random_tokens, build_models
+from ngram.compiled import CompiledInterpolationModel
+from ngram.models import TrigramModel, TrigramModelPerplexitySink, DeletedInterpolationBigramModel, \
+    DeletedInterpolationTrigramModel
+from ngram.packed import SymbolTable
+
+
+class CompiledInterpolationModelTest(unittest.TestCase):
+    def setUp(self):
+        self.symbols = SymbolTable()
+        self.vocabulary = [u'a', u'b', u'c', u'd', u'e', u'x', u'WB']
+        self.ug, self.bg, self.tg = build_models(random_tokens(u'abcde', 2000, 1), self.symbols,
+                                                 additional_vocabulary=self.vocabulary)
+        self.smoothed_tg = TrigramModel(self.tg.transition_counts, additional_vocabulary=self.vocabulary,
+                                        additive_smoothing=True, symbols=self.symbols)
+
+    def assert_same_log_probabilities(self, model, compiled):
+        keys = list(itertools.product(self.vocabulary + [u'y'], repeat=compiled.order))
+        id_columns = [np.array([self.symbols.token2id.get(key[index], len(self.symbols)) for key in keys])
+                      for index in xrange(compiled.order)]
+        batch = compiled.batch_log_probability(id_columns)
+        for key, batch_value in zip(keys, batch):
+            expected = model.log_probability(key)
+            self.assertEqual(expected, compiled.log_probability(key))
+            if expected is None:
+                self.assertTrue(np.isnan(batch_value))
+            else:
+                self.assertEqual(expected, batch_value)
+
+    def test_trigram(self):
+        for tg in [self.tg, self.smoothed_tg]:
+            model = DeletedInterpolationTrigramModel(tg, self.bg, self.ug)
+            for dense in [True, False]:
+                self.assert_same_log_probabilities(model, CompiledInterpolationModel(model, dense=dense))
+
+    def test_bigram(self):
+        model = DeletedInterpolationBigramModel(self.bg, self.ug)
+        self.assert_same_log_probabilities(model, model.compile())
+
+    def test_perplexity(self):
+        model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        compiled = model.compile()
+        tokens = random_tokens(u'abcdxy', 3000, 3)
+        sink = TrigramModelPerplexitySink(model)
+        for token in tokens:
+            sink.handle(token)
+        scorer = BatchPerplexityScorer(compiled)
+        scorer.score(TokenBatch.from_tokens(tokens, self.symbols))
+        self.assertEqual(sink.distance(), scorer.distance())
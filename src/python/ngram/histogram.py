@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import collections
+import math
+
+import numpy as np
+
+from ngram.batch import WORD_BOUNDARY, model_symbols, batch_log_probability, count_ids, count_ngrams
+
+
+class TransitionHistogram(object):
+    """Counts of the transitions in a token stream, for scoring against any number of models.
+
+    Perplexity and Kita distance are sums over the transitions, so weighting
+    the log probabilities of the distinct transitions by their counts gives
+    the distances of the *ModelPerplexitySink and *ModelKitaDistanceSink
+    classes, up to float rounding, without another pass over the tokens.
+    Like UnigramModelPerplexitySink, an order 1 histogram counts letters
+    only, not word boundaries.
+
+    """
+    def __init__(self, order):
+        self.order = order
+        self.context = (WORD_BOUNDARY,) * (order - 1)
+        self.transition_count = collections.defaultdict(int)
+        # Marginals and interned keys, dropped when more tokens are counted
+        self._cache = {}
+
+    @classmethod
+    def from_tokens(cls, tokens, order):
+        histogram = cls(order)
+        for token in tokens:
+            histogram.handle(token)
+        return histogram
+
+    @classmethod
+    def from_batch(cls, batch, order):
+        histogram = cls(order)
+        histogram.handle_batch(batch)
+        return histogram
+
+    def push_context(self, item):
+        self.context = (self.context + (item,))[1:]
+
+    def _count(self, state):
+        if self.order == 1:
+            self.transition_count[state] += 1
+        else:
+            self.transition_count[self.context + (state,)] += 1
+            self.push_context(state)
+
+    def handle(self, token):
+        if self._cache:
+            self._cache = {}
+        self._count(token.letter)
+        if token.is_ending and self.order > 1:
+            self._count(WORD_BOUNDARY)
+
+    def handle_batch(self, batch):
+        """Counts a TokenBatch as if its tokens were handled one by one."""
+        if self._cache:
+            self._cache = {}
+        if self.order == 1:
+            counts = count_ids((batch.ids,), batch.symbols)
+        else:
+            counts, stream = count_ngrams(batch, self.context, self.order)
+            self.context = tuple(batch.symbols.decode(stream[len(stream) - (self.order - 1):]))
+        for key, count in counts.iteritems():
+            self.transition_count[key] += count
+
+    def marginal(self, order):
+        """Histogram of the given lower order, summing counts over the leading tokens."""
+        if order == self.order:
+            return self
+        if order > self.order:
+            raise Exception(u'Can not derive order {} histogram from order {}'.format(order, self.order))
+
+        if order not in self._cache:
+            histogram = TransitionHistogram(order)
+            for key, count in self.transition_count.iteritems():
+                if order == 1:
+                    if key[-1] != WORD_BOUNDARY:
+                        histogram.transition_count[key[-1]] += count
+                else:
+                    histogram.transition_count[key[len(key) - order:]] += count
+            self._cache[order] = histogram
+        return self._cache[order]
+
+    def containing(self, symbol):
+        """Mask of the transitions that have symbol in them."""
+        if self.order == 1:
+            return np.array([key == symbol for key in self.transition_count.iterkeys()], dtype=bool)
+        return np.array([symbol in key for key in self.transition_count.iterkeys()], dtype=bool)
+
+    def substituted_ids(self, symbols, substitution_map=None):
+        """Symbol ids of the substituted transitions, a row each, and the transition counts."""
+        # Keys are interned once per symbol table; substituting is then a lookup
+        if 'ids' not in self._cache or self._cache['ids'][0] is not symbols:
+            keys = self.transition_count.keys()
+            if self.order == 1:
+                keys = [(key,) for key in keys]
+            ids = np.array([[symbols.add(item) for item in key] for key in keys], dtype=np.int64)
+            counts = np.array(self.transition_count.values(), dtype=np.int64)
+            self._cache['ids'] = (symbols, ids.reshape(len(keys), self.order), counts)
+        _, ids, counts = self._cache['ids']
+
+        pairs = [(symbols.add(k), symbols.add(v)) for k, v in (substitution_map or {}).iteritems()]
+        substitution = np.arange(len(symbols), dtype=np.int64)
+        for k, v in pairs:
+            substitution[k] = v
+        return substitution[ids], counts
+
+    def log_probabilities(self, model, substitution_map=None, rows=None):
+        """log2 probabilities of the substituted transitions, NaN where the model gives none, and their counts.
+
+        With a boolean mask in rows, only the selected transitions are scored.
+
+        """
+        symbols = model_symbols(model)
+        if symbols is not None:
+            ids, counts = self.substituted_ids(symbols, substitution_map)
+            if rows is not None:
+                ids, counts = ids[rows], counts[rows]
+            return batch_log_probability(model, tuple(ids[:, i] for i in xrange(self.order))), counts
+
+        substitution_map = substitution_map or {}
+        keys = self.transition_count.keys()
+        counts = np.array(self.transition_count.values(), dtype=np.int64)
+        if rows is not None:
+            keys = [key for key, selected in zip(keys, rows) if selected]
+            counts = counts[rows]
+        log_probabilities = []
+        for key in keys:
+            if self.order == 1:
+                key = substitution_map.get(key, key)
+            else:
+                key = tuple(substitution_map.get(item, item) for item in key)
+            log_probability = model.log_probability(key, None)
+            log_probabilities.append(np.nan if log_probability is None else log_probability)
+        return np.array(log_probabilities, dtype=np.float64), counts
+
+    def perplexity(self, model, substitution_map=None):
+        return _perplexity(*self.log_probabilities(model, substitution_map))
+
+    def kita_distance(self, model, corpus_model, substitution_map=None):
+        log_probabilities, counts = self.log_probabilities(model, substitution_map)
+        corpus_log_probabilities, _ = self.log_probabilities(corpus_model, substitution_map)
+        handled = ~(np.isnan(log_probabilities) | np.isnan(corpus_log_probabilities))
+        contributions = np.abs(corpus_log_probabilities[handled] - log_probabilities[handled])
+        return float(np.dot(counts[handled], contributions)) / float(counts[handled].sum())
+
+
+def _perplexity(log_probabilities, counts):
+    handled = ~np.isnan(log_probabilities)
+    log_sum = float(np.dot(counts[handled], log_probabilities[handled]))
+    return math.pow(2, - 1 * log_sum / float(counts[handled].sum()))
+
+
+class HistogramPerplexityScorer(object):
+    """Perplexity of a model on a histogram, and its perplexity when one more symbol is substituted.
+
+    The log probabilities under the base substitution map are kept, so a
+    candidate substitution only rescores the transitions with that symbol in
+    them.  The sum is then taken over all transitions as in perplexity(), so
+    the result is identical to rescoring the whole histogram.
+
+    """
+    def __init__(self, histogram, model, substitution_map=None):
+        self.histogram = histogram
+        self.model = model
+        self.substitution_map = dict(substitution_map or {})
+        self.log_probabilities, self.counts = histogram.log_probabilities(model, self.substitution_map)
+
+    def perplexity(self):
+        return _perplexity(self.log_probabilities, self.counts)
+
+    def perplexity_with(self, symbol, replacement):
+        """Perplexity with symbol also substituted by replacement."""
+        rows = self.histogram.containing(symbol)
+        substitution_map = dict(self.substitution_map)
+        substitution_map[symbol] = replacement
+        log_probabilities = self.log_probabilities.copy()
+        log_probabilities[rows], _ = self.histogram.log_probabilities(self.model, substitution_map, rows=rows)
+        return _perplexity(log_probabilities, self.counts)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import unittest
+
+from ngram.testing import random_tokens, build_models
+from ngram.histogram import TransitionHistogram, HistogramPerplexityScorer
+from ngram.models import UnigramModelPerplexitySink, BigramModelPerplexitySink, TrigramModelPerplexitySink, \
+    TrigramModelKitaDistanceSink, DeletedInterpolationTrigramModel, UnigramModel, BigramModel, TrigramModel
+from ngram.packed import SymbolTable
+
+
+class TransitionHistogramTest(unittest.TestCase):
+    def setUp(self):
+        self.symbols = SymbolTable()
+        vocabulary = [u'a', u'b', u'c', u'd', u'e', u'x', u'WB']
+        self.ug, self.bg, self.tg = build_models(random_tokens(u'abcde', 2000, 1), self.symbols,
+                                                 additional_vocabulary=vocabulary)
+        self.corpus_ug, self.corpus_bg, self.corpus_tg = build_models(random_tokens(u'abcdx', 2000, 2), self.symbols,
+                                                                      additional_vocabulary=vocabulary)
+        self.test_tokens = random_tokens(u'abcdxy', 3000, 3)
+        self.histogram = TransitionHistogram.from_tokens(self.test_tokens, 3)
+
+    def sink_distance(self, sink):
+        for token in self.test_tokens:
+            sink.handle(token)
+        return sink.distance()
+
+    def test_perplexity(self):
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        for sink_class, model in [(UnigramModelPerplexitySink, self.ug), (BigramModelPerplexitySink, self.bg),
+                                  (TrigramModelPerplexitySink, self.tg), (TrigramModelPerplexitySink, tg_model),
+                                  (TrigramModelPerplexitySink, tg_model.compile())]:
+            for substitution_map in [None, {u'x': u'e'}, {u'x': u'e', u'a': u'b'}]:
+                histogram = self.histogram.marginal(model.order)
+                self.assertAlmostEqual(self.sink_distance(sink_class(model, substitution_map=substitution_map)),
+                                       histogram.perplexity(model, substitution_map=substitution_map), 10)
+
+    def test_kita(self):
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug)
+        corpus_tg_model = DeletedInterpolationTrigramModel(self.corpus_tg, self.corpus_bg, self.corpus_ug)
+        self.assertAlmostEqual(self.sink_distance(TrigramModelKitaDistanceSink(tg_model, corpus_tg_model)),
+                               self.histogram.kita_distance(tg_model, corpus_tg_model), 10)
+
+    def test_marginal(self):
+        for order in [1, 2]:
+            self.assertEqual(dict(TransitionHistogram.from_tokens(self.test_tokens, order).transition_count),
+                             dict(self.histogram.marginal(order).transition_count))
+
+    def test_separate_symbol_tables(self):
+        # Components over different symbol tables are scored transition by transition
+        tg_model = DeletedInterpolationTrigramModel(TrigramModel(self.tg.transition_counts),
+                                                    BigramModel(self.bg.transition_counts),
+                                                    UnigramModel(self.ug.transition_counts, additive_smoothing=True))
+        self.assertAlmostEqual(self.sink_distance(TrigramModelPerplexitySink(tg_model, substitution_map={u'x': u'e'})),
+                               self.histogram.perplexity(tg_model, substitution_map={u'x': u'e'}), 10)
+
+    def test_substitution_delta(self):
+        tg_model = DeletedInterpolationTrigramModel(self.tg, self.bg, self.ug).compile()
+        for model in [self.bg, tg_model]:
+            histogram = self.histogram.marginal(model.order)
+            scorer = HistogramPerplexityScorer(histogram, model, {u'y': u'a'})
+            self.assertEqual(histogram.perplexity(model, {u'y': u'a'}), scorer.perplexity())
+            for symbol, replacement in [(u'x', u'e'), (u'a', u'x'), (u'WB', u'a'), (u'z', u'a')]:
+                self.assertEqual(histogram.perplexity(model, {u'y': u'a', symbol: replacement}),
+                                 scorer.perplexity_with(symbol, replacement))
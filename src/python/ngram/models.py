@@ -20,11 +20,16 @@
 # <http://www.gnu.org/licenses/>.
 #
 import collections
+import logging
 import math
 
 from datetime import datetime
 from operator import itemgetter
 
+import numpy as np
+
+from ngram.packed import NGramModel
+
 
 class TokenHandlingProgressReporter(object):
     def __init__(self, logger):
@@ -43,490 +48,433 @@ class TokenHandlingProgressReporter(object):
                               .format(self.total_transitions, transitions_per_sec))
             self.last_print = now
 
+    def tokens_handled(self, count):
+        every_nth = 1000000
+        previous = self.total_transitions
+        self.total_transitions += count
+        if self.total_transitions // every_nth > previous // every_nth:
+            now = datetime.now()
+            secs_between = max((now - self.last_print).total_seconds(), 1e-6)
+            self.logger.debug(u"{:,} tokens handled; {:,} t/s"
+                              .format(self.total_transitions, int(count / secs_between)))
+            self.last_print = now
 
-class UnigramModelBuilderTokenSink(object):
-    def __init__(self, logger):
-        self.progress_reporter = TokenHandlingProgressReporter(logger)
-        self.previous = None
-        self.token_counts = collections.defaultdict(int)
-
-    def handle(self, token):
-        # print(token.letter, token.is_beginning, token.is_ending, sep='\t')
-        self.progress_reporter.token_handled()
-
-        if self.previous != u"WB":
-            if token.is_beginning:
-                self.token_counts[u"WB"] += 1
-            if token.is_ending:
-                self.token_counts[u"WB"] += 1
-
-        self.token_counts[token.letter] += 1
-
-        if not token.is_ending:
-            self.previous = token.letter
-        else:
-            self.previous = u"WB"
-
-
-class UnigramModel(object):
-    def __init__(self, token_counts, additional_vocabulary=None, additive_smoothing=False, additive_smoothing_a=0.1):
-        self.token_counts = token_counts
-        total_count = float(sum(token_counts.itervalues()))
-
-        # Prepare vocabulary
-        self.vocabulary = set(token_counts.keys())
-        if additional_vocabulary is not None:
-            self.vocabulary.update(additional_vocabulary)
-
-        # Finish with populating transition_probabilities
-        if additive_smoothing:
-            # https://en.wikipedia.org/wiki/Additive_smoothing
-            vocabulary_size = len(self.vocabulary)
-            vocab_times_a = vocabulary_size * float(additive_smoothing_a)
-
-            self.token_probabilities = {k: (token_counts[k] + additive_smoothing_a) / (total_count + vocab_times_a)
-                                        for k, v in token_counts.iteritems()}
-            self.additive_default = additive_smoothing_a / (total_count + vocab_times_a)
-        else:
-            self.additive_default = None
-            self.token_probabilities = {k: token_counts[k] / total_count
-                                        for k, v in token_counts.iteritems()}
-
-    def probability(self, key, missing_value=None, log_fn=None):
-        tmp = self.token_probabilities.get(key, None)
-        if tmp is None and self.additive_default is not None:
-            if key not in self.vocabulary and log_fn is not None:
-                log_fn(u"Token {} not part of model's vocabulary".format(key))
-            return self.additive_default
-        elif tmp is None:
-            return missing_value
-        else:
-            return tmp
+    def __getstate__(self):
+        # Loggers can't be pickled; sinks are sent between processes by name
+        state = dict(self.__dict__)
+        state['logger'] = self.logger.name
+        return state
 
-    def top_n(self, key, n):
-        return sorted(self.token_probabilities.items(), key=itemgetter(1), reverse=True)[:n]
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(state['logger'])
 
-    @classmethod
-    def _read_frequency_dist(cls, stream):
-        probability = {}
-        for line in stream:
-            line = line.replace('\n', '')
-            state, tmp = line.split('\t')
-            probability[state] = int(tmp)
-        return probability
 
-    @classmethod
-    def read_from_file(cls, file, *args, **kwargs):
-        return UnigramModel(UnigramModel._read_frequency_dist(file), *args, **kwargs)
+class NGramModelBuilderTokenSink(object):
+    """Counts n-grams of any order over the tokens with u"WB" after each word.
 
-    def write_to_file(self, file):
-        for k, v in self.token_counts.iteritems():
-            file.write(u"{}\t{}\n".format(k, v))
+    The context carries over word and document boundaries and starts out as
+    order - 1 word boundaries.
 
+    """
+    def __init__(self, order, logger):
+        self.order = order
+        self.progress_reporter = TokenHandlingProgressReporter(logger)
+        self.context = (u"WB",) * (order - 1)
+        self.transition_counts = collections.defaultdict(int)
+        # The first order - 1 states, whose n-grams depend on the initial context
+        self.head = []
 
-class UnigramModelPerplexitySink(object):
-    def __init__(self, model, substitution_map=None):
-        assert isinstance(model, UnigramModel)
-        self.model = model
+    def push_context(self, item):
+        self.context = (self.context + (item,))[1:]
 
-        if substitution_map is None:
-            self.substitution_map = {}
+    def _count(self, state):
+        if self.order == 1:
+            self.transition_counts[state] += 1
         else:
-            assert isinstance(substitution_map, dict)
-            self.substitution_map = substitution_map
-
-        self.log_sum = 0
-
-        self.transitions_handled = 0
-        self.transition_count = collections.defaultdict(int)
-
-        if substitution_map is None:
-            self.substitution_map = {}
+            self.transition_counts[self.context + (state,)] += 1
+        self.push_context(state)
+        if len(self.head) < self.order - 1:
+            self.head.append(state)
+
+    def merge(self, other):
+        """Adds in the counts of a sink that was fed the tokens following this one's.
+
+        The other sink started from the initial context, so its first n-grams
+        are recounted with this sink's final context.
+
+        """
+        assumed = (u"WB",) * (self.order - 1) + tuple(other.head)
+        actual = self.context + tuple(other.head)
+
+        for key, count in other.transition_counts.iteritems():
+            self.transition_counts[key] += count
+        for index in xrange(len(other.head)):
+            wrong_key = assumed[index:index + self.order]
+            right_key = actual[index:index + self.order]
+            if wrong_key != right_key:
+                self.transition_counts[wrong_key] -= 1
+                if self.transition_counts[wrong_key] == 0:
+                    del self.transition_counts[wrong_key]
+                self.transition_counts[right_key] += 1
+
+        if len(other.head) < self.order - 1:
+            self.context = actual[len(actual) - (self.order - 1):]
         else:
-            self.substitution_map = substitution_map
-
-    def handle(self, token):
-        substituted_letter = self.substitution_map.get(token.letter, token.letter)
-        probability = self.model.probability(substituted_letter, None)
-        if probability is not None:
-            contribution = math.log(probability, 2)
-            self.log_sum += contribution
-            self.transitions_handled += 1
-            self.transition_count[token.letter] += 1
-
-    def distance(self):
-        return math.pow(2, - 1 * self.log_sum / float(self.transitions_handled))
-
-
-class BigramModelBuilderTokenSink(object):
-    def __init__(self, logger):
-        self.progress_reporter = TokenHandlingProgressReporter(logger)
-        self.previous = u"WB"
-        self.transition_counts = collections.defaultdict(int)
+            self.context = other.context
+        self.head = (self.head + other.head)[:self.order - 1]
+        self.progress_reporter.total_transitions += other.progress_reporter.total_transitions
 
     def handle(self, token):
         self.progress_reporter.token_handled()
 
-        self.transition_counts[(self.previous, token.letter)] += 1
-        self.previous = token.letter
-
+        self._count(token.letter)
         if token.is_ending:
-            self.transition_counts[(token.letter, u"WB")] += 1
-            self.previous = u"WB"
-
+            self._count(u"WB")
 
-class BigramModel(object):
-    def __init__(self, transition_counts, additional_vocabulary=None,
-                 additive_smoothing=False, additive_smoothing_a=0.1):
-        self.transition_counts = transition_counts
-
-        self._per_from_transition_count = collections.defaultdict(int)
-        for key, count in transition_counts.iteritems():
-            self._per_from_transition_count[key[0]] += count
-
-        # Prepare vocabulary
-        self.vocabulary = set()
-        for key in transition_counts.iterkeys():
-            a, b = key
-            self.vocabulary.add(a)
-            self.vocabulary.add(b)
-        if additional_vocabulary is not None:
-            self.vocabulary.update(additional_vocabulary)
-
-        # Finish with populating transition_probabilities
-        if additive_smoothing:
-            # https://en.wikipedia.org/wiki/Additive_smoothing
-            vocabulary_size = len(self.vocabulary)
-            vocab_times_a = vocabulary_size * float(additive_smoothing_a)
-
-            self.transition_probabilities =\
-                {k: (v + additive_smoothing_a) / (float(self._per_from_transition_count[k[0]]) + vocab_times_a)
-                 for k, v in transition_counts.iteritems()}
-            self._additive_smoothing_a = additive_smoothing_a
-            self._vocab_times_a = vocab_times_a
-        else:
-            self._vocab_times_a = None
-            self.transition_probabilities =\
-                {k: v / float(self._per_from_transition_count[k[0]])
-                 for k, v in transition_counts.iteritems()}
-
-    def probability(self, key, missing_value=None, log_fn=None):
-        tmp = self.transition_probabilities.get(key, None)
-        if tmp is None and self._vocab_times_a is not None:
-            if key[0] not in self.vocabulary and log_fn is not None:
-                log_fn(u"Token {} not part of model's vocabulary".format(key[0]))
-            elif key[1] not in self.vocabulary and log_fn is not None:
-                log_fn(u"Token {} not part of model's vocabulary".format(key[1]))
-            return self._additive_smoothing_a / \
-                   float(self._per_from_transition_count[key[0]] + self._vocab_times_a)
-        elif tmp is None:
-            return missing_value
-        else:
-            return tmp
+    def handle_batch(self, batch):
+        """Counts a TokenBatch as if its tokens were handled one by one."""
+        from ngram.batch import count_ngrams
+        self.progress_reporter.tokens_handled(len(batch))
 
-    @classmethod
-    def _read_transition_counts(cls, stream):
-        probability = {}
-        for line in stream:
-            line = line.replace('\n', '')
-            frm, to, tmp = line.split('\t')
-            probability[(frm, to)] = int(tmp)
-        return probability
+        counts, stream = count_ngrams(batch, self.context, self.order)
+        for key, count in counts.iteritems():
+            self.transition_counts[key] += count
 
-    @classmethod
-    def read_from_file(cls, file, *args, **kwargs):
-        return BigramModel(BigramModel._read_transition_counts(file), *args, **kwargs)
+        missing = self.order - 1 - len(self.head)
+        if missing > 0:
+            self.head.extend(batch.symbols.decode(stream[len(self.context):len(self.context) + missing]))
+        self.context = tuple(batch.symbols.decode(stream[len(stream) - (self.order - 1):]))
 
-    def write_to_file(self, file):
-        for k, v in self.transition_counts.iteritems():
-            file.write(u"{}\t{}\t{}\n".format(k[0], k[1], v))
 
+class NGramModelPerplexitySink(object):
+    """Scores tokens, and the word boundaries after them, against a model of any order."""
+    order = None
 
-class BigramModelPerplexitySink(object):
-    def __init__(self, bigram_model, substitution_map=None):
-        self.model = bigram_model
+    def __init__(self, model, substitution_map=None):
+        self.model = model
+        if self.order is None:
+            self.order = model.order
 
         if substitution_map is not None:
             self.substitution_map = substitution_map
         else:
             self.substitution_map = {}
 
-        self.previous = None
+        self.context = (u"WB",) * (self.order - 1)
 
         self.log_sum = 0
         self.transitions_handled = 0
 
         self.transition_count = collections.defaultdict(int)
 
-    def _handle_transition(self, context, token):
-        substituted_context = self.substitution_map.get(context, context)
-        substituted_token = self.substitution_map.get(token, token)
+    def push_context(self, item):
+        self.context = (self.context + (item,))[1:]
+
+    def _key(self, context, state):
+        substituted_state = self.substitution_map.get(state, state)
+        if self.order == 1:
+            return substituted_state
+        return tuple(self.substitution_map.get(item, item) for item in context) + (substituted_state,)
 
-        key = (substituted_context, substituted_token)
-        probability = self.model.probability(key, None)
+    def _handle_transition(self, context, state):
+        key = self._key(context, state)
+        log_probability = self.model.log_probability(key, None)
 
         self.transition_count[key] += 1
-        if probability is None:
+        if log_probability is None:
             pass
         else:
-            contribution = math.log(probability, 2)
-            self.log_sum += contribution
+            self.log_sum += log_probability
             self.transitions_handled += 1
 
-    def handle(self, token):
-        if self.previous is None:
-            previous = u"WB"
-        else:
-            previous = self.previous.letter
+    def _handle(self, letter, is_ending):
+        self._handle_transition(self.context, letter)
+        self.push_context(letter)
 
-        self._handle_transition(previous, token.letter)
-        self.previous = token
+        if is_ending:
+            self._handle_transition(self.context, u"WB")
+            self.push_context(u"WB")
 
-        if token.is_ending:
-            self._handle_transition(token.letter, u"WB")
-            self.previous = None
+    def handle(self, token):
+        self._handle(token.letter, token.is_ending)
+
+    def _batch_scorer(self, batch):
+        from ngram.batch import model_symbols, BatchPerplexityScorer
+        if self.order == 1 or model_symbols(self.model) is not batch.symbols:
+            return None
+        return BatchPerplexityScorer(self.model, self.substitution_map)
+
+    def handle_batch(self, batch):
+        """Scores a TokenBatch; in one go if the model shares the batch's symbol table."""
+        scorer = self._batch_scorer(batch)
+        if scorer is None:
+            for letter, _, is_ending in batch.rows():
+                self._handle(letter, is_ending)
+            return
+
+        scorer.context = np.array([batch.symbols.add(item) for item in self.context], dtype=np.int64)
+        scorer.log_sum = self.log_sum
+        scorer.transitions_handled = self.transitions_handled
+        scorer.transition_count = self.transition_count
+        scorer.score(batch)
+        self.context = tuple(batch.symbols.decode(scorer.context))
+        self.log_sum = scorer.log_sum
+        self.transitions_handled = scorer.transitions_handled
 
     def distance(self):
         return math.pow(2, - 1 * self.log_sum / float(self.transitions_handled))
 
 
-class BigramModelKitaDistanceSink(object):
-    def __init__(self, bigram_model, corpus_bigram_model, substitution_map=None):
-        self.model = bigram_model
-        self.corpus_model = corpus_bigram_model
-
-        if substitution_map is not None:
-            self.substitution_map = substitution_map
-        else:
-            self.substitution_map = {}
-
-        self.previous = None
-
-        self.log_sum = 0
-        self.transitions_handled = 0
-
-        self.transition_count = collections.defaultdict(int)
-
-    def _handle_transition(self, context, token):
-        substituted_context = self.substitution_map.get(context, context)
-        substituted_token = self.substitution_map.get(token, token)
+class NGramModelKitaDistanceSink(NGramModelPerplexitySink):
+    def __init__(self, model, corpus_model, substitution_map=None):
+        super(NGramModelKitaDistanceSink, self).__init__(model, substitution_map=substitution_map)
+        self.corpus_model = corpus_model
 
-        key = (substituted_context, substituted_token)
-        corpus_probability = self.corpus_model.probability(key, None)
-        probability = self.model.probability(key, None)
+    def _handle_transition(self, context, state):
+        key = self._key(context, state)
+        log_probability = self.model.log_probability(key, None)
+        corpus_log_probability = self.corpus_model.log_probability(key, None)
 
         self.transition_count[key] += 1
-        if corpus_probability is None or probability is None:
+        if corpus_log_probability is None or log_probability is None:
             pass
         else:
-            contribution = abs(math.log(corpus_probability, 2) - math.log(probability, 2))
+            contribution = abs(corpus_log_probability - log_probability)
             self.log_sum += contribution
             self.transitions_handled += 1
 
-    def handle(self, token):
-        if self.previous is None:
-            previous = u"WB"
-        else:
-            previous = self.previous.letter
-
-        self._handle_transition(previous, token.letter)
-        self.previous = token
-
-        if token.is_ending:
-            self._handle_transition(token.letter, u"WB")
-            self.previous = None
+    def _batch_scorer(self, batch):
+        from ngram.batch import model_symbols, BatchKitaDistanceScorer
+        if self.order == 1 or model_symbols(self.model) is not batch.symbols or \
+                model_symbols(self.corpus_model) is not batch.symbols:
+            return None
+        return BatchKitaDistanceScorer(self.model, self.corpus_model, self.substitution_map)
 
     def distance(self):
         return self.log_sum / float(self.transitions_handled)
 
 
-class TrigramModelBuilderTokenSink(object):
+class UnigramModelBuilderTokenSink(object):
     def __init__(self, logger):
         self.progress_reporter = TokenHandlingProgressReporter(logger)
-        self.context = (u"WB", u"WB")
-        self.transition_counts = collections.defaultdict(int)
-
-    def push_context(self, item):
-        self.context = (self.context[-1], item)
+        self.previous = None
+        self.token_counts = collections.defaultdict(int)
+        # Word boundaries counted for the first token, which depend on the preceding tokens
+        self.leading_word_boundaries = 0
 
     def handle(self, token):
+        # print(token.letter, token.is_beginning, token.is_ending, sep='\t')
         self.progress_reporter.token_handled()
 
-        self.transition_counts[(self.context[0], self.context[1], token.letter)] += 1
-        self.push_context(token.letter)
-
-        if token.is_ending:
-            self.transition_counts[(self.context[0], self.context[1], u"WB")] += 1
-            self.push_context(u"WB")
+        if self.previous != u"WB":
+            if token.is_beginning:
+                self.token_counts[u"WB"] += 1
+            if token.is_ending:
+                self.token_counts[u"WB"] += 1
+            if self.previous is None:
+                self.leading_word_boundaries = int(token.is_beginning) + int(token.is_ending)
 
+        self.token_counts[token.letter] += 1
 
-class TrigramModel(object):
-    def __init__(self, transition_counts, additional_vocabulary=None,
-                 additive_smoothing=False, additive_smoothing_a=0.1):
-        self.transition_counts = transition_counts
-
-        self._per_from_transition_count = collections.defaultdict(int)
-        for key, count in transition_counts.iteritems():
-            self._per_from_transition_count[(key[0], key[1])] += count
-
-        # Prepare vocabulary
-        self.vocabulary = set()
-        for key in transition_counts.iterkeys():
-            a, b, c = key
-            self.vocabulary.add(a)
-            self.vocabulary.add(b)
-            self.vocabulary.add(c)
-        if additional_vocabulary is not None:
-            self.vocabulary.update(additional_vocabulary)
-
-        # Finish with populating transition_probabilities
-        if additive_smoothing:
-            # https://en.wikipedia.org/wiki/Additive_smoothing
-            vocabulary_size = len(self.vocabulary)
-            self._vocab_times_a = vocabulary_size * float(additive_smoothing_a)
-            self._additive_smoothing_a = additive_smoothing_a
-
-            self.transition_probabilities =\
-                {k: (v + additive_smoothing_a) /
-                    (float(self._per_from_transition_count[(k[0], k[1])]) + self._vocab_times_a)
-                 for k, v in transition_counts.iteritems()}
+        if not token.is_ending:
+            self.previous = token.letter
         else:
-            self._vocab_times_a = None
-            self.transition_probabilities =\
-                {k: v / float(self._per_from_transition_count[(k[0], k[1])])
-                 for k, v in transition_counts.iteritems()}
-
-    def probability(self, key, missing_value=None, log_fn=None):
-        tmp = self.transition_probabilities.get(key, None)
-        if tmp is None and self._vocab_times_a is not None:
-            if key[0] not in self.vocabulary and log_fn is not None:
-                log_fn(u"Token {} not part of model's vocabulary".format(key[0]))
-            elif key[1] not in self.vocabulary and log_fn is not None:
-                log_fn(u"Token {} not part of model's vocabulary".format(key[1]))
-            elif key[2] not in self.vocabulary and log_fn is not None:
-                log_fn(u"Token {} not part of model's vocabulary".format(key[2]))
-            return self._additive_smoothing_a /\
-                   float(self._per_from_transition_count[(key[0], key[1])] + self._vocab_times_a)
-        elif tmp is None:
-            return missing_value
+            self.previous = u"WB"
+
+    def handle_batch(self, batch):
+        """Counts a TokenBatch as if its tokens were handled one by one."""
+        if len(batch) == 0:
+            return
+        self.progress_reporter.tokens_handled(len(batch))
+
+        word_boundary_id = batch.symbols.add(u"WB")
+        # Whether each token's previous state is a word boundary
+        after_word_boundary = np.empty(len(batch), dtype=bool)
+        after_word_boundary[0] = self.previous == u"WB"
+        after_word_boundary[1:] = batch.is_ending[:-1] | (batch.ids[:-1] == word_boundary_id)
+
+        word_boundaries = int(batch.is_beginning[~after_word_boundary].sum() +
+                              batch.is_ending[~after_word_boundary].sum())
+        if word_boundaries > 0:
+            self.token_counts[u"WB"] += word_boundaries
+        if self.previous is None:
+            self.leading_word_boundaries = int(batch.is_beginning[0]) + int(batch.is_ending[0])
+
+        ids, counts = np.unique(batch.ids, return_counts=True)
+        for letter, count in zip(batch.symbols.decode(ids), counts):
+            self.token_counts[letter] += int(count)
+
+        if not batch.is_ending[-1]:
+            self.previous = batch.symbols.id2token[batch.ids[-1]]
         else:
-            return tmp
+            self.previous = u"WB"
+
+    def merge(self, other):
+        """Adds in the counts of a sink that was fed the tokens following this one's."""
+        for key, count in other.token_counts.iteritems():
+            self.token_counts[key] += count
+        if self.previous == u"WB" and other.leading_word_boundaries > 0:
+            self.token_counts[u"WB"] -= other.leading_word_boundaries
+            if self.token_counts[u"WB"] == 0:
+                del self.token_counts[u"WB"]
+
+        if self.previous is None:
+            self.leading_word_boundaries = other.leading_word_boundaries
+        if other.previous is not None:
+            self.previous = other.previous
+        self.progress_reporter.total_transitions += other.progress_reporter.total_transitions
+
 
-    @classmethod
-    def _read_transition_counts(cls, stream):
-        probability = {}
-        for line in stream:
-            line = line.replace('\n', '')
-            frm1, frm2, to, tmp = line.split('\t')
-            probability[(frm1, frm2, to)] = int(tmp)
-        return probability
+class UnigramModel(NGramModel):
+    order = 1
 
-    @classmethod
-    def read_from_file(cls, file, *args, **kwargs):
-        return TrigramModel(TrigramModel._read_transition_counts(file), *args, **kwargs)
+    @property
+    def token_counts(self):
+        return self.transition_counts
 
-    def write_to_file(self, file):
-        for k, v in self.transition_counts.iteritems():
-            file.write(u"{}\t{}\t{}\t{}\n".format(k[0], k[1], k[2], v))
+    @property
+    def token_probabilities(self):
+        return self.transition_probabilities
 
+    @property
+    def additive_default(self):
+        if self._vocab_times_a is None:
+            return None
+        return self._additive_smoothing_a / (self.total_count + self._vocab_times_a)
 
-class TrigramModelPerplexitySink(object):
+    def top_n(self, key, n):
+        return sorted(self.token_probabilities.items(), key=itemgetter(1), reverse=True)[:n]
+
+
+class UnigramModelPerplexitySink(object):
     def __init__(self, model, substitution_map=None):
+        assert model.order == 1
         self.model = model
 
-        if substitution_map is not None:
-            self.substitution_map = substitution_map
-        else:
+        if substitution_map is None:
             self.substitution_map = {}
-
-        self.context = (u"WB", u"WB")
+        else:
+            assert isinstance(substitution_map, dict)
+            self.substitution_map = substitution_map
 
         self.log_sum = 0
-        self.transitions_handled = 0
 
+        self.transitions_handled = 0
         self.transition_count = collections.defaultdict(int)
 
-    def push_context(self, item):
-        self.context = (self.context[-1], item)
-
-    def _handle_transition(self, context, state):
-        ctx1 = self.substitution_map.get(context[0], context[0])
-        ctx2 = self.substitution_map.get(context[1], context[1])
-        substituted_state = self.substitution_map.get(state, state)
-
-        key = (ctx1, ctx2, substituted_state)
-        probability = self.model.probability(key, None)
-
-        self.transition_count[key] += 1
-        if probability is None:
-            pass
+        if substitution_map is None:
+            self.substitution_map = {}
         else:
-            contribution = math.log(probability, 2)
-            self.log_sum += contribution
+            self.substitution_map = substitution_map
+
+    def _handle(self, letter):
+        substituted_letter = self.substitution_map.get(letter, letter)
+        log_probability = self.model.log_probability(substituted_letter, None)
+        if log_probability is not None:
+            self.log_sum += log_probability
             self.transitions_handled += 1
+            self.transition_count[letter] += 1
 
     def handle(self, token):
-        self._handle_transition(self.context, token.letter)
-        self.push_context(token.letter)
-
-        if token.is_ending:
-            self._handle_transition(self.context, u"WB")
-            self.push_context(u"WB")
+        self._handle(token.letter)
+
+    def handle_batch(self, batch):
+        """Scores a TokenBatch; in one go if the model shares the batch's symbol table."""
+        from ngram.batch import model_symbols, BatchPerplexityScorer
+        if model_symbols(self.model) is not batch.symbols:
+            for letter in batch.letters():
+                self._handle(letter)
+            return
+
+        scorer = BatchPerplexityScorer(self.model, self.substitution_map)
+        scorer.log_sum = self.log_sum
+        scorer.transitions_handled = self.transitions_handled
+        scorer.transition_count = self.transition_count
+        scorer.score(batch)
+        self.log_sum = scorer.log_sum
+        self.transitions_handled = scorer.transitions_handled
 
     def distance(self):
         return math.pow(2, - 1 * self.log_sum / float(self.transitions_handled))
 
 
-class TrigramModelKitaDistanceSink(object):
-    def __init__(self, model, corpus_model, substitution_map=None):
-        self.model = model
-        self.corpus_model = corpus_model
+class BigramModelBuilderTokenSink(NGramModelBuilderTokenSink):
+    def __init__(self, logger):
+        super(BigramModelBuilderTokenSink, self).__init__(2, logger)
 
-        if substitution_map is not None:
-            self.substitution_map = substitution_map
-        else:
-            self.substitution_map = {}
 
-        self.context = (u"WB", u"WB")
+class BigramModel(NGramModel):
+    order = 2
 
-        self.log_sum = 0
-        self.transitions_handled = 0
 
-        self.transition_count = collections.defaultdict(int)
+class BigramModelPerplexitySink(NGramModelPerplexitySink):
+    order = 2
 
-    def push_context(self, item):
-        self.context = (self.context[-1], item)
 
-    def _handle_transition(self, context, state):
-        ctx1 = self.substitution_map.get(context[0], context[0])
-        ctx2 = self.substitution_map.get(context[1], context[1])
-        substituted_state = self.substitution_map.get(state, state)
+class BigramModelKitaDistanceSink(NGramModelKitaDistanceSink):
+    order = 2
 
-        key = (ctx1, ctx2, substituted_state)
-        probability = self.model.probability(key, None)
-        corpus_probability = self.corpus_model.probability(key, None)
 
-        self.transition_count[key] += 1
-        if corpus_probability is None or probability is None:
-            pass
-        else:
-            contribution = abs(math.log(corpus_probability, 2) - math.log(probability, 2))
-            self.log_sum += contribution
-            self.transitions_handled += 1
+class TrigramModelBuilderTokenSink(NGramModelBuilderTokenSink):
+    def __init__(self, logger):
+        super(TrigramModelBuilderTokenSink, self).__init__(3, logger)
+
+
+class TrigramModel(NGramModel):
+    order = 3
+
+
+class TrigramModelPerplexitySink(NGramModelPerplexitySink):
+    order = 3
+
+
+class TrigramModelKitaDistanceSink(NGramModelKitaDistanceSink):
+    order = 3
+
+
+class MultiOrderModelBuilderTokenSink(object):
+    """Counts unigrams, bigrams and trigrams in a single pass over the tokens.
+
+    The bigram counts are the trigram counts summed over their first token:
+    both are taken over the same stream, starting from word boundaries.
+
+    """
+    def __init__(self, logger):
+        self.unigram_sink = UnigramModelBuilderTokenSink(logger)
+        self.trigram_sink = TrigramModelBuilderTokenSink(logger)
 
     def handle(self, token):
-        self._handle_transition(self.context, token.letter)
-        self.push_context(token.letter)
+        self.unigram_sink.handle(token)
+        self.trigram_sink.handle(token)
 
-        if token.is_ending:
-            self._handle_transition(self.context, u"WB")
-            self.push_context(u"WB")
+    def handle_batch(self, batch):
+        self.unigram_sink.handle_batch(batch)
+        self.trigram_sink.handle_batch(batch)
 
-    def distance(self):
-        return self.log_sum / float(self.transitions_handled)
+    def merge(self, other):
+        self.unigram_sink.merge(other.unigram_sink)
+        self.trigram_sink.merge(other.trigram_sink)
+
+    @property
+    def token_counts(self):
+        return self.unigram_sink.token_counts
+
+    @property
+    def bigram_counts(self):
+        result = collections.defaultdict(int)
+        for (_, previous, current), count in self.trigram_sink.transition_counts.iteritems():
+            result[(previous, current)] += count
+        return result
+
+    @property
+    def trigram_counts(self):
+        return self.trigram_sink.transition_counts
 
 
 class DeletedInterpolationBigramModel(object):
+    order = 2
+
     def __init__(self, bigram_model, unigram_model):
         self.bigram_model = bigram_model
         self.unigram_model = unigram_model
@@ -537,14 +485,27 @@ class DeletedInterpolationBigramModel(object):
         self.bigram_model_weight = self.lambda1
         self.unigram_model_weight = 1.0 - self.lambda1
 
+        # Interpolated probabilities and log probabilities computed so far
+        self._probabilities = {}
+        self._log_probabilities = {}
+
     def probability(self, key, missing_value=None):
+        tmp = self._probabilities.get(key, None)
+        if tmp is None:
+            tmp = self._interpolated_probability(key)
+            if tmp is None:
+                return missing_value
+            self._probabilities[key] = tmp
+        return tmp
+
+    def _interpolated_probability(self, key):
         bg_key = key
 
         bg_p = self.bigram_model.probability(bg_key, None)
         ug_p = self.unigram_model.probability(key[1], None)
 
         if bg_p is None and ug_p is None:
-            return missing_value
+            return None
         else:
             if bg_p is None:
                 bg_p = 0.0
@@ -555,8 +516,25 @@ class DeletedInterpolationBigramModel(object):
             bg_p * self.bigram_model_weight + \
             ug_p * self.unigram_model_weight
 
+    def log_probability(self, key, missing_value=None):
+        tmp = self._log_probabilities.get(key, None)
+        if tmp is None:
+            probability = self.probability(key, None)
+            if probability is None:
+                return missing_value
+            tmp = math.log(probability, 2)
+            self._log_probabilities[key] = tmp
+        return tmp
+
+    def compile(self):
+        """Flatten into a single lookup table; the components must share a symbol table."""
+        from ngram.compiled import CompiledInterpolationModel
+        return CompiledInterpolationModel(self)
+
 
 class DeletedInterpolationTrigramModel(object):
+    order = 3
+
     def __init__(self, trigram_model, bigram_model, unigram_model):
         self.trigram_model = trigram_model
         self.bigram_model = bigram_model
@@ -571,7 +549,20 @@ class DeletedInterpolationTrigramModel(object):
         self.bigram_model_weight = self.lambda2
         self.unigram_model_weight = 1.0 - self.lambda1 - self.lambda2
 
+        # Interpolated probabilities and log probabilities computed so far
+        self._probabilities = {}
+        self._log_probabilities = {}
+
     def probability(self, key, missing_value=None):
+        tmp = self._probabilities.get(key, None)
+        if tmp is None:
+            tmp = self._interpolated_probability(key)
+            if tmp is None:
+                return missing_value
+            self._probabilities[key] = tmp
+        return tmp
+
+    def _interpolated_probability(self, key):
         tg_key = key
         bg_key = (key[1], key[2])
 
@@ -580,7 +571,7 @@ class DeletedInterpolationTrigramModel(object):
         ug_p = self.unigram_model.probability(key[2], None)
 
         if tg_p is None and bg_p is None and ug_p is None:
-            return missing_value
+            return None
         else:
             if tg_p is None:
                 tg_p = 0.0
@@ -594,17 +585,42 @@ class DeletedInterpolationTrigramModel(object):
             bg_p * self.bigram_model_weight + \
             ug_p * self.unigram_model_weight
 
+    def log_probability(self, key, missing_value=None):
+        tmp = self._log_probabilities.get(key, None)
+        if tmp is None:
+            probability = self.probability(key, None)
+            if probability is None:
+                return missing_value
+            tmp = math.log(probability, 2)
+            self._log_probabilities[key] = tmp
+        return tmp
+
+    def compile(self):
+        """Flatten into a single lookup table; the components must share a symbol table."""
+        from ngram.compiled import CompiledInterpolationModel
+        return CompiledInterpolationModel(self)
+
 
 def calculate_perplexity(model, tokens):
-    if isinstance(model, UnigramModel):
+    # Models over a single symbol table are scored in one batch instead of token by token
+    from ngram.batch import model_symbols, TokenBatch, BatchPerplexityScorer
+    symbols = model_symbols(model)
+    if symbols is not None:
+        scorer = BatchPerplexityScorer(model)
+        if isinstance(tokens, TokenBatch):
+            scorer.score(tokens.recode(symbols))
+        else:
+            scorer.score(TokenBatch.from_tokens(tokens, symbols))
+        return scorer.distance()
+
+    if model.order == 1:
         sink = UnigramModelPerplexitySink(model)
-    elif isinstance(model, BigramModel) or isinstance(model, DeletedInterpolationBigramModel):
-        sink = BigramModelPerplexitySink(model)
-    elif isinstance(model, TrigramModel) or isinstance(model, DeletedInterpolationTrigramModel):
-        sink = TrigramModelPerplexitySink(model)
     else:
-        raise Exception(u'No sink defined for {}'.format(type(model)))
+        sink = NGramModelPerplexitySink(model)
 
-    for token in tokens:
-        sink.handle(token)
+    if isinstance(tokens, TokenBatch):
+        sink.handle_batch(tokens)
+    else:
+        for token in tokens:
+            sink.handle(token)
     return sink.distance()
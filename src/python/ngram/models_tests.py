@@ -22,9 +22,13 @@
 import unittest
 
 import collections
+import logging
+import pickle
 
 from ngram.models import UnigramModel, BigramModel, DeletedInterpolationBigramModel, TrigramModel, \
-    DeletedInterpolationTrigramModel
+    DeletedInterpolationTrigramModel, UnigramModelBuilderTokenSink, BigramModelBuilderTokenSink, \
+    TrigramModelBuilderTokenSink, NGramModelBuilderTokenSink, MultiOrderModelBuilderTokenSink
+from ngram.testing import random_tokens
 
 
 def unigram_test_scaffold():
@@ -256,3 +260,57 @@ class DeletedInterpolationTrigramModelProbabilityMassTest(unittest.TestCase):
 
         test_sum_from_model(sum_from_model_a)
         test_sum_from_model(sum_from_model_b)
+
+
+class BuilderTokenSinkMergeTest(unittest.TestCase):
+    def test_merge(self):
+        tokens = random_tokens(u'abcde', 1000, 5)
+        logger = logging.getLogger(__name__)
+        ends = [index + 1 for index, token in enumerate(tokens) if token.is_ending]
+        # Shards end at word boundaries; include empty and single-word shards
+        boundaries = [0, 0, ends[0], ends[1], ends[10], ends[11], ends[40], len(tokens)]
+
+        for sink_factory in [UnigramModelBuilderTokenSink, BigramModelBuilderTokenSink, TrigramModelBuilderTokenSink,
+                             lambda logger: NGramModelBuilderTokenSink(5, logger)]:
+            single_pass = sink_factory(logger)
+            for token in tokens:
+                single_pass.handle(token)
+
+            merged = sink_factory(logger)
+            for start, end in zip(boundaries, boundaries[1:]):
+                shard = sink_factory(logger)
+                for token in tokens[start:end]:
+                    shard.handle(token)
+                merged.merge(pickle.loads(pickle.dumps(shard)))
+
+            if isinstance(merged, UnigramModelBuilderTokenSink):
+                self.assertEqual(dict(single_pass.token_counts), dict(merged.token_counts))
+                self.assertEqual(single_pass.previous, merged.previous)
+            else:
+                self.assertEqual(dict(single_pass.transition_counts), dict(merged.transition_counts))
+                self.assertEqual(single_pass.context, merged.context)
+
+    def test_multi_order(self):
+        tokens = random_tokens(u'abcde', 1000, 6)
+        logger = logging.getLogger(__name__)
+        ends = [index + 1 for index, token in enumerate(tokens) if token.is_ending]
+
+        sinks = [MultiOrderModelBuilderTokenSink(logger), UnigramModelBuilderTokenSink(logger),
+                 BigramModelBuilderTokenSink(logger), TrigramModelBuilderTokenSink(logger)]
+        for token in tokens:
+            for sink in sinks:
+                sink.handle(token)
+        fused, unigram, bigram, trigram = sinks
+        self.assertEqual(dict(unigram.token_counts), dict(fused.token_counts))
+        self.assertEqual(dict(bigram.transition_counts), dict(fused.bigram_counts))
+        self.assertEqual(dict(trigram.transition_counts), dict(fused.trigram_counts))
+
+        merged = MultiOrderModelBuilderTokenSink(logger)
+        for start, end in zip([0, ends[3]], [ends[3], len(tokens)]):
+            shard = MultiOrderModelBuilderTokenSink(logger)
+            for token in tokens[start:end]:
+                shard.handle(token)
+            merged.merge(pickle.loads(pickle.dumps(shard)))
+        self.assertEqual(dict(fused.token_counts), dict(merged.token_counts))
+        self.assertEqual(dict(fused.bigram_counts), dict(merged.bigram_counts))
+        self.assertEqual(dict(fused.trigram_counts), dict(merged.trigram_counts))
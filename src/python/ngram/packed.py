@@ -0,0 +1,646 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import collections
+import math
+import struct
+
+import numpy as np
+
+
+# Tables with at most this many cells (vocabulary size to the power of the
+# n-gram order) are stored densely, i.e. indexed directly by the packed key.
+# Larger ones, such as character trigrams over big text alphabets, fall back
+# to sorted packed keys and binary search.
+DENSE_TABLE_LIMIT = 1 << 22
+
+# Binary model files start with the magic string and a header of format
+# version, n-gram order, vocabulary size, entry count and vocabulary length
+# in bytes.  The vocabulary follows as NUL separated UTF-8, then, aligned to
+# 8 bytes, the sorted packed keys and their counts as little-endian int64.
+# From version 2 on, the header also has the number of distinct contexts, and
+# the counts are followed by the unsmoothed probabilities and log2
+# probabilities of the keys as little-endian float64, then the sorted context
+# keys and their total counts as int64.
+BINARY_MAGIC = b"DLTNGRAM"
+BINARY_VERSION = 2
+_BINARY_HEADER = struct.Struct("<8sIIQQQ")
+_BINARY_CONTEXT_HEADER = struct.Struct("<Q")
+
+# math.log(x, 2) is computed as log(x) / log(2); dividing by the same constant
+# gives log2 values bit-identical to it.
+LOG_2 = math.log(2)
+
+# Marks keys not yet in a lookup cache, as None is a cached missing value
+_NOT_CACHED = object()
+
+
+class SymbolTable(object):
+    """Interns tokens into a dense integer id space."""
+    def __init__(self, tokens=None):
+        self.token2id = {}
+        self.id2token = []
+        if tokens is not None:
+            self.update(tokens)
+
+    def add(self, token):
+        id_ = self.token2id.get(token, None)
+        if id_ is None:
+            id_ = len(self.id2token)
+            self.token2id[token] = id_
+            self.id2token.append(token)
+        return id_
+
+    def update(self, tokens):
+        for token in tokens:
+            self.add(token)
+
+    def get(self, token, default=None):
+        return self.token2id.get(token, default)
+
+    def encode(self, tokens, missing_id=-1):
+        return np.array([self.token2id.get(token, missing_id) for token in tokens], dtype=np.int64)
+
+    def decode(self, ids):
+        return [self.id2token[id_] for id_ in ids]
+
+    def __len__(self):
+        return len(self.id2token)
+
+    def __contains__(self, token):
+        return token in self.token2id
+
+    def __iter__(self):
+        return iter(self.id2token)
+
+
+def pack_ids(id_columns, radix):
+    """Packs columns of symbol ids (i_1, ..., i_n) into i_1 * radix^(n-1) + ... + i_n."""
+    packed = np.zeros(np.shape(id_columns[0]), dtype=np.int64)
+    for column in id_columns:
+        packed = packed * radix + column
+    return packed
+
+
+def unpack_ids(packed, radix, order):
+    columns = []
+    for _ in xrange(order):
+        columns.append(packed % radix)
+        packed = packed // radix
+    return tuple(reversed(columns))
+
+
+def context_totals(keys, counts, radix):
+    """Context keys of sorted packed keys, the total count of each context, and each key's context total."""
+    context_keys = keys // radix
+    if len(context_keys) == 0:
+        return context_keys, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, context_keys[1:] != context_keys[:-1]])
+    totals = np.add.reduceat(counts, starts)
+    return context_keys[starts], totals, np.repeat(totals, np.diff(np.r_[starts, len(context_keys)]))
+
+
+class PackedTable(object):
+    """Maps packed n-gram keys to values; missing keys read as `default`.
+
+    A dense table only fills in its array on the first lookup, so tables that
+    are never looked up, such as the counts of a model or the per-order
+    probabilities of a compiled one, take no more memory than their keys and
+    values.
+
+    """
+    def __init__(self, order, radix, keys, values, default=np.nan, dense=None):
+        self.order = order
+        self.radix = radix
+        self.default = default
+
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values)
+        # Keys read from binary model files are already sorted and may be memory-mapped
+        if len(keys) > 1 and not (keys[1:] > keys[:-1]).all():
+            sort_order = np.argsort(keys, kind='mergesort')
+            keys = keys[sort_order]
+            values = values[sort_order]
+        self.keys = keys
+        self.values = values
+
+        if dense is None:
+            dense = radix ** order <= DENSE_TABLE_LIMIT
+        self._is_dense = dense
+        self._dense = None
+
+    @property
+    def is_dense(self):
+        return self._is_dense
+
+    def _dense_table(self):
+        if self._dense is None:
+            size = self.radix ** self.order
+            dtype = np.result_type(self.values, self.default)
+            if len(self.keys) == size and self.values.dtype == dtype:
+                # Sorted distinct keys for every cell, so the values are the table as they are
+                self._dense = self.values
+            else:
+                self._dense = np.empty(size, dtype=dtype)
+                self._dense.fill(self.default)
+                self._dense[self.keys] = self.values
+        return self._dense
+
+    def lookup(self, packed):
+        """Vectorized lookup of an array of packed keys."""
+        packed = np.asarray(packed, dtype=np.int64)
+        if self._is_dense:
+            return self._dense_table()[packed]
+
+        result = np.empty(packed.shape, dtype=np.result_type(self.values, self.default))
+        result.fill(self.default)
+        if len(self.keys) > 0:
+            index = np.minimum(np.searchsorted(self.keys, packed), len(self.keys) - 1)
+            found = self.keys[index] == packed
+            result[found] = self.values[index[found]]
+        return result
+
+    def get(self, packed):
+        if self._is_dense:
+            return self._dense_table()[packed]
+
+        index = np.searchsorted(self.keys, packed)
+        if index < len(self.keys) and self.keys[index] == packed:
+            return self.values[index]
+        return self.default
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class PackedTableView(collections.Mapping):
+    """Read-only dict view of a model's PackedTable, keyed by tokens like the model.
+
+    Keys looked up once are kept in a plain dict, which is much faster than
+    packing them again for the next lookup.
+
+    """
+    def __init__(self, model, table):
+        self._model = model
+        self._table = table
+        self._cache = {}
+
+    def _lookup(self, key):
+        packed = self._model.pack_key(key)
+        if packed is not None:
+            value = self._table.get(packed)
+            # Missing keys read as the table default, which is NaN or zero
+            if value == value and value != self._table.default:
+                return value.item()
+        return None
+
+    def get(self, key, default=None):
+        value = self._cache.get(key, _NOT_CACHED)
+        if value is _NOT_CACHED:
+            value = self._cache[key] = self._lookup(key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        for packed in self._table.keys:
+            yield self._model.unpack_key(packed)
+
+    def iteritems(self):
+        for packed, value in zip(self._table.keys, self._table.values):
+            yield self._model.unpack_key(packed), value.item()
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __len__(self):
+        return len(self._table)
+
+
+class NGramModel(object):
+    """N-gram model of any order, with counts and probabilities in NumPy arrays indexed by packed symbol ids.
+
+    Keys are tuples of `order` tokens, or bare tokens for order 1.  Models that
+    share a SymbolTable share the id space, so their n-grams can be scored in
+    batches (see ngram.batch).
+
+    """
+    order = None
+
+    def __init__(self, transition_counts, additional_vocabulary=None,
+                 additive_smoothing=False, additive_smoothing_a=0.1, symbols=None, order=None):
+        if order is not None:
+            self.order = order
+        elif self.order is None:
+            raise Exception(u"Model order not given")
+
+        keys = list(transition_counts.iterkeys())
+        counts = np.array([transition_counts[k] for k in keys], dtype=np.int64)
+        if self.order == 1:
+            keys = [(k,) for k in keys]
+
+        tokens = set()
+        for key in keys:
+            tokens.update(key)
+        self._init_vocabulary(tokens, additional_vocabulary, symbols)
+
+        id_columns = [np.array([self.symbols.token2id[k[i]] for k in keys], dtype=np.int64)
+                      for i in xrange(self.order)]
+        self._init_tables(pack_ids(id_columns, self.radix), counts, additive_smoothing, additive_smoothing_a)
+
+    def _init_vocabulary(self, tokens, additional_vocabulary, symbols):
+        self.vocabulary = set(tokens)
+        if additional_vocabulary is not None:
+            self.vocabulary.update(additional_vocabulary)
+
+        if symbols is None:
+            symbols = SymbolTable()
+        symbols.update(sorted(self.vocabulary))
+        self.symbols = symbols
+        # Symbols interned to a shared table after this point are unknown to this model
+        self.radix = len(symbols)
+        if self.radix ** self.order >= 1 << 63:
+            raise Exception(u"{}-grams over {} symbols don't fit in packed keys".format(self.order, self.radix))
+
+    def _init_tables(self, packed_keys, counts, additive_smoothing, additive_smoothing_a, tables=None):
+        """Count and probability tables; tables holds unsmoothed ones read from a binary file, if any."""
+        # Per-key lookups are answered from plain dicts once seen
+        self._probability_cache = {}
+        self._log_probability_cache = {}
+        self._views = {}
+
+        if tables is not None and not additive_smoothing:
+            probabilities, log_probabilities, context_keys, totals = tables
+            self.counts = PackedTable(self.order, self.radix, packed_keys, counts, default=0)
+            self.total_count = int(self.counts.values.sum())
+            self.context_counts = PackedTable(self.order - 1, self.radix, context_keys, totals, default=0) \
+                if self.order > 1 else None
+            self._additive_smoothing_a = None
+            self._vocab_times_a = None
+            self.probabilities = PackedTable(self.order, self.radix, packed_keys, probabilities,
+                                             dense=self.counts.is_dense)
+            self.log_probabilities = PackedTable(self.order, self.radix, packed_keys, log_probabilities,
+                                                 dense=self.counts.is_dense)
+            self.log_fallback = None
+            return
+
+        self.counts = PackedTable(self.order, self.radix, packed_keys, counts, default=0)
+        self.total_count = int(self.counts.values.sum())
+
+        # Per-context totals; keys are sorted, so each context is a contiguous run
+        if self.order > 1:
+            context_keys, totals, per_transition_total = context_totals(self.counts.keys, self.counts.values,
+                                                                        self.radix)
+            self.context_counts = PackedTable(self.order - 1, self.radix, context_keys, totals, default=0)
+        else:
+            self.context_counts = None
+            per_transition_total = np.empty(len(self.counts), dtype=np.int64)
+            per_transition_total.fill(self.total_count)
+
+        # Finish with populating transition probabilities
+        if additive_smoothing:
+            # https://en.wikipedia.org/wiki/Additive_smoothing
+            self._additive_smoothing_a = additive_smoothing_a
+            self._vocab_times_a = len(self.vocabulary) * float(additive_smoothing_a)
+            probabilities = (self.counts.values + additive_smoothing_a) / \
+                            (per_transition_total.astype(np.float64) + self._vocab_times_a)
+        else:
+            self._additive_smoothing_a = None
+            self._vocab_times_a = None
+            probabilities = self.counts.values / per_transition_total.astype(np.float64)
+        self.probabilities = PackedTable(self.order, self.radix, self.counts.keys, probabilities,
+                                         dense=self.counts.is_dense)
+
+        # log2 probability tables
+        self.log_probabilities = PackedTable(self.order, self.radix, self.counts.keys,
+                                             np.log(probabilities) / LOG_2, dense=self.counts.is_dense)
+        if additive_smoothing:
+            # Log probability of an unseen continuation, per context; unseen contexts get the default
+            if self.order == 1:
+                self.log_fallback = math.log(self._additive_smoothing_a / (self.total_count + self._vocab_times_a), 2)
+            else:
+                self.log_fallback = PackedTable(
+                    self.order - 1, self.radix, self.context_counts.keys,
+                    np.log(self._additive_smoothing_a /
+                           (self.context_counts.values.astype(np.float64) + self._vocab_times_a)) / LOG_2,
+                    default=math.log(self._additive_smoothing_a / self._vocab_times_a, 2),
+                    dense=self.context_counts.is_dense)
+        else:
+            self.log_fallback = None
+
+    def key_ids(self, key):
+        """Symbol ids of a key, or None if some token is unknown to this model."""
+        if self.order == 1:
+            key = (key,)
+        ids = []
+        for token in key:
+            id_ = self.symbols.token2id.get(token, None)
+            if id_ is None or id_ >= self.radix:
+                return None
+            ids.append(id_)
+        return ids
+
+    def pack_key(self, key):
+        ids = self.key_ids(key)
+        if ids is None:
+            return None
+        packed = 0
+        for id_ in ids:
+            packed = packed * self.radix + id_
+        return packed
+
+    def unpack_key(self, packed):
+        ids = unpack_ids(int(packed), self.radix, self.order)
+        if self.order == 1:
+            return self.symbols.id2token[ids[0]]
+        return tuple(self.symbols.id2token[id_] for id_ in ids)
+
+    def context_count(self, context):
+        if self.order == 1:
+            return self.total_count
+        packed = self.pack_key(context)
+        if packed is None:
+            return 0
+        return int(self.context_counts.get(packed))
+
+    def batch_probability(self, id_columns):
+        """Vectorized probability() over columns of symbol ids; missing values are NaN."""
+        context_known = np.ones(len(id_columns[0]), dtype=bool)
+        for column in id_columns[:-1]:
+            context_known &= column < self.radix
+        known = context_known & (id_columns[-1] < self.radix)
+        packed = pack_ids([np.where(column < self.radix, column, 0) for column in id_columns], self.radix)
+        result = self.probabilities.lookup(packed)
+        result[~known] = np.nan
+
+        if self._vocab_times_a is not None:
+            unseen = np.isnan(result)
+            if self.order == 1:
+                result[unseen] = self._additive_smoothing_a / (self.total_count + self._vocab_times_a)
+            else:
+                context_counts = self.context_counts.lookup(packed[unseen] // self.radix)
+                context_counts[~context_known[unseen]] = 0
+                result[unseen] = self._additive_smoothing_a / \
+                                 (context_counts.astype(np.float64) + self._vocab_times_a)
+        return result
+
+    def batch_log_probability(self, id_columns):
+        """Vectorized log_probability() over columns of symbol ids; missing values are NaN."""
+        context_known = np.ones(len(id_columns[0]), dtype=bool)
+        for column in id_columns[:-1]:
+            context_known &= column < self.radix
+        known = context_known & (id_columns[-1] < self.radix)
+        packed = pack_ids([np.where(column < self.radix, column, 0) for column in id_columns], self.radix)
+        result = self.log_probabilities.lookup(packed)
+        result[~known] = np.nan
+
+        if self.log_fallback is not None:
+            unseen = np.isnan(result)
+            if self.order == 1:
+                result[unseen] = self.log_fallback
+            else:
+                fallback = self.log_fallback.lookup(packed[unseen] // self.radix)
+                fallback[~context_known[unseen]] = self.log_fallback.default
+                result[unseen] = fallback
+        return result
+
+    def log_probability(self, key, missing_value=None):
+        log_probability = self._log_probability_cache.get(key, _NOT_CACHED)
+        if log_probability is _NOT_CACHED:
+            log_probability = self._log_probability_cache[key] = self._log_probability(key)
+        return missing_value if log_probability is None else log_probability
+
+    def _log_probability(self, key):
+        packed = self.pack_key(key)
+        if packed is not None:
+            tmp = self.log_probabilities.get(packed)
+            if tmp == tmp:
+                return float(tmp)
+
+        if self.log_fallback is None:
+            return None
+        elif self.order == 1:
+            return self.log_fallback
+
+        packed_context = self.pack_key(key[:-1])
+        if packed_context is None:
+            return self.log_fallback.default
+        return float(self.log_fallback.get(packed_context))
+
+    def probability(self, key, missing_value=None, log_fn=None):
+        # Lookups that may log go around the cache so that they log every time
+        if log_fn is not None:
+            probability = self._probability(key, log_fn)
+        else:
+            probability = self._probability_cache.get(key, _NOT_CACHED)
+            if probability is _NOT_CACHED:
+                probability = self._probability_cache[key] = self._probability(key)
+        return missing_value if probability is None else probability
+
+    def _probability(self, key, log_fn=None):
+        packed = self.pack_key(key)
+        if packed is not None:
+            tmp = self.probabilities.get(packed)
+            if tmp == tmp:
+                return float(tmp)
+
+        if self._vocab_times_a is None:
+            return None
+
+        if log_fn is not None:
+            for token in (key,) if self.order == 1 else key:
+                if token not in self.vocabulary:
+                    log_fn(u"Token {} not part of model's vocabulary".format(token))
+                    break
+        if self.order == 1:
+            return self._additive_smoothing_a / (self.total_count + self._vocab_times_a)
+        return self._additive_smoothing_a / float(self.context_count(key[:-1]) + self._vocab_times_a)
+
+    @classmethod
+    def _read_counts(cls, stream, order=None):
+        counts = {}
+        for line in stream:
+            line = line.replace('\n', '')
+            fields = line.split('\t')
+            if order is None:
+                order = len(fields) - 1
+            elif len(fields) != order + 1:
+                raise Exception(u"Expected {}-gram counts, got line: {}".format(order, line))
+            key = fields[0] if order == 1 else tuple(fields[:-1])
+            counts[key] = int(fields[-1])
+        return counts, order
+
+    @classmethod
+    def read_from_file(cls, file, *args, **kwargs):
+        counts, order = cls._read_counts(file, kwargs.pop('order', cls.order))
+        if cls.order is None:
+            kwargs['order'] = order
+        return cls(counts, *args, **kwargs)
+
+    @classmethod
+    def read_binary(cls, path, additional_vocabulary=None, additive_smoothing=False, additive_smoothing_a=0.1,
+                    symbols=None):
+        """Loads a model written by write_binary().
+
+        The keys, counts and, without additive smoothing, the probability
+        tables stored in the file are memory-mapped where possible.  Dense
+        tables are still filled in, as they depend on the symbol table.
+
+        """
+        order, tokens, keys, counts, tables = read_binary_model(path)
+        if cls.order is not None and order != cls.order:
+            raise Exception(u"Expected a {}-gram model, {} has order {}".format(cls.order, path, order))
+
+        model = cls.__new__(cls)
+        model.order = order
+        model._init_vocabulary(tokens, additional_vocabulary, symbols)
+
+        file_ids = np.array([model.symbols.token2id[token] for token in tokens], dtype=np.int64)
+        if len(tokens) != model.radix or (file_ids != np.arange(len(tokens))).any():
+            keys = pack_ids([file_ids[column] for column in unpack_ids(keys, len(tokens), order)], model.radix)
+            if tables is not None and order > 1:
+                probabilities, log_probabilities, context_keys, totals = tables
+                context_keys = pack_ids([file_ids[column] for column in unpack_ids(context_keys, len(tokens),
+                                                                                   order - 1)], model.radix)
+                tables = probabilities, log_probabilities, context_keys, totals
+        model._init_tables(keys, counts, additive_smoothing, additive_smoothing_a, tables=tables)
+        return model
+
+    def write_binary(self, file):
+        """Writes the counts in the binary format to a file opened in binary mode."""
+        id_columns = unpack_ids(self.counts.keys, self.radix, self.order)
+        used_ids = np.unique(np.concatenate(id_columns)) if len(self.counts) > 0 else np.zeros(0, dtype=np.int64)
+        tokens = sorted(self.symbols.id2token[id_] for id_ in used_ids)
+
+        file_ids = np.zeros(self.radix, dtype=np.int64)
+        for file_id, token in enumerate(tokens):
+            file_ids[self.symbols.token2id[token]] = file_id
+        keys = pack_ids([file_ids[column] for column in id_columns], len(tokens))
+        sort_order = np.argsort(keys, kind='mergesort')
+        write_binary_counts(file, self.order, tokens, keys[sort_order], self.counts.values[sort_order])
+
+    def write_to_file(self, file):
+        for key, count in self.transition_counts.iteritems():
+            if self.order == 1:
+                key = (key,)
+            file.write(u"{}\t{}\n".format(u"\t".join(key), count))
+
+    def _view(self, name):
+        # Views are kept so that their lookup caches are too
+        if name not in self._views:
+            self._views[name] = PackedTableView(self, getattr(self, name))
+        return self._views[name]
+
+    @property
+    def transition_counts(self):
+        return self._view('counts')
+
+    @property
+    def transition_probabilities(self):
+        return self._view('probabilities')
+
+
+def write_binary_counts(file, order, tokens, keys, counts):
+    """Writes sorted packed keys and their counts, with the unsmoothed probability tables computed from them."""
+    keys = np.asarray(keys, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    if order > 1:
+        context_keys, totals, per_transition_total = context_totals(keys, counts, len(tokens))
+    else:
+        context_keys, totals = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        per_transition_total = np.empty(len(counts), dtype=np.int64)
+        per_transition_total.fill(counts.sum())
+    probabilities = counts / per_transition_total.astype(np.float64)
+
+    vocabulary = u"\x00".join(tokens).encode('utf-8')
+    file.write(_BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, order, len(tokens), len(keys), len(vocabulary)))
+    file.write(_BINARY_CONTEXT_HEADER.pack(len(context_keys)))
+    file.write(vocabulary)
+    file.write(b"\x00" * (-(_BINARY_HEADER.size + _BINARY_CONTEXT_HEADER.size + len(vocabulary)) % 8))
+    file.write(keys.astype('<i8').tostring())
+    file.write(counts.astype('<i8').tostring())
+    file.write(probabilities.astype('<f8').tostring())
+    file.write((np.log(probabilities) / LOG_2).astype('<f8').tostring())
+    file.write(context_keys.astype('<i8').tostring())
+    file.write(totals.astype('<i8').tostring())
+
+
+def _read_binary_header(file, path):
+    magic, version, order, vocabulary_size, entry_count, vocabulary_length = \
+        _BINARY_HEADER.unpack(file.read(_BINARY_HEADER.size))
+    if magic != BINARY_MAGIC:
+        raise Exception(u"{} is not a binary n-gram model file".format(path))
+    if version not in (1, BINARY_VERSION):
+        raise Exception(u"Unsupported binary n-gram model version {} in {}".format(version, path))
+    # Version 1 files have no probability tables
+    context_count = _BINARY_CONTEXT_HEADER.unpack(file.read(_BINARY_CONTEXT_HEADER.size))[0] \
+        if version > 1 else None
+
+    vocabulary = file.read(vocabulary_length).decode('utf-8')
+    tokens = vocabulary.split(u"\x00") if vocabulary_size > 0 else []
+    if len(tokens) != vocabulary_size:
+        raise Exception(u"Corrupt vocabulary in {}".format(path))
+    offset = file.tell()
+    return order, tokens, entry_count, context_count, offset + (-offset % 8)
+
+
+def read_binary_vocabulary(path):
+    """Only the vocabulary of a binary model file, without touching the counts."""
+    with open(path, 'rb') as file:
+        return _read_binary_header(file, path)[1]
+
+
+def _memmap(path, dtype, offset, count):
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+
+def read_binary_model(path):
+    """(order, tokens, keys, counts, tables) of a binary model file, with the arrays memory-mapped.
+
+    tables is (probabilities, log probabilities, context keys, context
+    totals), or None for files written before they were stored.
+
+    """
+    with open(path, 'rb') as file:
+        order, tokens, entry_count, context_count, offset = _read_binary_header(file, path)
+    keys = _memmap(path, '<i8', offset, entry_count)
+    counts = _memmap(path, '<i8', offset + 8 * entry_count, entry_count)
+    if context_count is None:
+        return order, tokens, keys, counts, None
+    tables = (_memmap(path, '<f8', offset + 16 * entry_count, entry_count),
+              _memmap(path, '<f8', offset + 24 * entry_count, entry_count),
+              _memmap(path, '<i8', offset + 32 * entry_count, context_count),
+              _memmap(path, '<i8', offset + 32 * entry_count + 8 * context_count, context_count))
+    return order, tokens, keys, counts, tables
+
+
+def read_binary_counts(path):
+    """(order, tokens, keys, counts) of a binary model file, with keys and counts memory-mapped."""
+    return read_binary_model(path)[:4]
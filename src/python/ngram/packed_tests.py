@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import io
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import ngram.packed
+from ngram.batch import TokenBatch, BatchPerplexityScorer
+from ngram.testing import random_tokens, NullLogger
+from ngram.models import UnigramModel, BigramModel, TrigramModel, NGramModelBuilderTokenSink, \
+    NGramModelPerplexitySink
+from ngram.models_tests import unigram_test_scaffold, bigram_test_scaffold, trigram_test_scaffold
+from ngram.packed import NGramModel, PackedTable, SymbolTable, read_binary_vocabulary
+
+
+def _keys(vocabulary, order):
+    keys = [()]
+    for _ in xrange(order):
+        keys = [k + (v,) for k in keys for v in vocabulary]
+    return keys
+
+
+def _reference_probability(counts, key, vocabulary, additive_smoothing=False, additive_smoothing_a=0.1):
+    if isinstance(key, tuple):
+        context_count = sum(v for k, v in counts.iteritems() if k[:-1] == key[:-1])
+    else:
+        context_count = sum(counts.itervalues())
+    if additive_smoothing:
+        return (counts.get(key, 0) + additive_smoothing_a) / \
+               (float(context_count) + len(vocabulary) * float(additive_smoothing_a))
+    elif key in counts:
+        return counts[key] / float(context_count)
+    return None
+
+
+class NGramModelTest(unittest.TestCase):
+    def setUp(self):
+        self.ug_vocab_a, self.ug_vocab_b, self.ug_counts_a, _ = unigram_test_scaffold()
+        self.bg_vocab_a, self.bg_vocab_b, self.bg_counts_a, _ = bigram_test_scaffold()
+        self.tg_vocab_a, self.tg_vocab_b, self.tg_counts_a, _ = trigram_test_scaffold()
+        # Includes tokens outside of the models' vocabularies
+        self.all_tokens = sorted(self.ug_vocab_a | self.ug_vocab_b | {u'q'})
+
+    def assert_probabilities(self, counts, model, keys, **kwargs):
+        for key in keys:
+            probability = _reference_probability(counts, key, model.vocabulary, **kwargs)
+            self.assertEqual(probability, model.probability(key))
+            self.assertEqual(-1.0 if probability is None else probability,
+                             model.probability(key, missing_value=-1.0))
+            log_probability = None if probability is None else math.log(probability, 2)
+            self.assertEqual(log_probability, model.log_probability(key))
+
+        symbols = model.symbols
+        id_columns = [np.array([symbols.add(k[i] if isinstance(k, tuple) else k) for k in keys])
+                      for i in xrange(model.order)]
+        expected = [model.probability(key, missing_value=np.nan) for key in keys]
+        np.testing.assert_array_equal(expected, model.batch_probability(id_columns))
+        np.testing.assert_array_equal(np.log(expected) / math.log(2), model.batch_log_probability(id_columns))
+
+    def test_unigram(self):
+        for kwargs in [{}, {'additive_smoothing': True},
+                       {'additive_smoothing': True, 'additive_smoothing_a': 100}]:
+            model = UnigramModel(self.ug_counts_a, additional_vocabulary=self.ug_vocab_b, **kwargs)
+            self.assert_probabilities(self.ug_counts_a, model, self.all_tokens, **kwargs)
+            self.assertEqual(self.ug_counts_a, dict(model.token_counts))
+
+    def test_bigram(self):
+        for kwargs in [{}, {'additive_smoothing': True}]:
+            model = BigramModel(self.bg_counts_a, additional_vocabulary=self.bg_vocab_b, **kwargs)
+            self.assert_probabilities(self.bg_counts_a, model, _keys(self.all_tokens, 2), **kwargs)
+
+    def test_trigram(self):
+        for kwargs in [{}, {'additive_smoothing': True}]:
+            model = TrigramModel(self.tg_counts_a, additional_vocabulary=self.tg_vocab_b, **kwargs)
+            self.assert_probabilities(self.tg_counts_a, model, _keys(self.all_tokens, 3), **kwargs)
+            self.assertEqual(self.tg_counts_a, dict(model.transition_counts))
+
+    def test_cached_lookups(self):
+        model = TrigramModel(self.tg_counts_a)
+        for _ in xrange(2):
+            for key in _keys(self.all_tokens, 3):
+                self.assertEqual(key in self.tg_counts_a, key in model.transition_counts)
+                self.assertEqual(self.tg_counts_a.get(key, -1), model.transition_counts.get(key, -1))
+                if key not in self.tg_counts_a:
+                    self.assertRaises(KeyError, lambda: model.transition_probabilities[key])
+                    self.assertEqual(-1.0, model.log_probability(key, missing_value=-1.0))
+
+    def test_sparse_storage(self):
+        dense_limit = ngram.packed.DENSE_TABLE_LIMIT
+        ngram.packed.DENSE_TABLE_LIMIT = 0
+        try:
+            model = TrigramModel(self.tg_counts_a, additive_smoothing=True)
+        finally:
+            ngram.packed.DENSE_TABLE_LIMIT = dense_limit
+        self.assertFalse(model.probabilities.is_dense)
+        self.assert_probabilities(self.tg_counts_a, model, _keys(self.all_tokens, 3), additive_smoothing=True)
+
+    def test_dense_tables_filled_on_lookup(self):
+        model = TrigramModel(self.tg_counts_a)
+        tables = [model.counts, model.probabilities, model.log_probabilities]
+        self.assertTrue(all(table.is_dense and table._dense is None for table in tables))
+        keys = _keys(self.all_tokens, 3)
+        id_columns = [np.array([model.symbols.add(k[i]) for k in keys]) for i in xrange(3)]
+        model.batch_probability(id_columns)
+        self.assertEqual([table._dense is None for table in tables], [True, False, True])
+
+        # A table with every cell needs no copy of its values
+        values = np.arange(8, dtype=np.float64)
+        table = PackedTable(3, 2, np.arange(8), values)
+        self.assertIs(table._dense_table(), table.values)
+        np.testing.assert_array_equal(table.lookup([7, 0, 3]), [7., 0., 3.])
+
+    def test_higher_order(self):
+        tokens = random_tokens(u'abcdef', 3000, 4)
+        for order in [4, 5]:
+            sink = NGramModelBuilderTokenSink(order, NullLogger())
+            for token in tokens:
+                sink.handle(token)
+            counts = dict(sink.transition_counts)
+            self.assertEqual(len(tokens) + sum(1 for t in tokens if t.is_ending), sum(counts.itervalues()))
+
+            model = NGramModel(counts, additive_smoothing=True, order=order)
+            self.assert_probabilities(counts, model, counts.keys()[:50] + _keys(u'abq', order), additive_smoothing=True)
+
+            stream = io.StringIO()
+            model.write_to_file(stream)
+            stream.seek(0)
+            self.assertEqual(counts, dict(NGramModel.read_from_file(stream).transition_counts))
+
+            perplexity_sink = NGramModelPerplexitySink(model)
+            for token in tokens:
+                perplexity_sink.handle(token)
+            scorer = BatchPerplexityScorer(model)
+            scorer.score(TokenBatch.from_tokens(tokens, model.symbols))
+            self.assertEqual(perplexity_sink.log_sum, scorer.log_sum)
+
+    def test_binary_format(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trigram_model.bin')
+            with open(path, 'wb') as f:
+                TrigramModel(self.tg_counts_a).write_binary(f)
+            self.assertEqual(sorted(self.tg_vocab_a), read_binary_vocabulary(path))
+
+            for kwargs in [{}, {'additive_smoothing': True, 'additional_vocabulary': self.tg_vocab_b},
+                           {'symbols': SymbolTable([u'q', u'z'])}]:
+                model = TrigramModel.read_binary(path, **kwargs)
+                self.assertEqual(self.tg_counts_a, dict(model.transition_counts))
+                self.assert_probabilities(self.tg_counts_a, model, _keys(self.all_tokens, 3),
+                                          additive_smoothing=kwargs.get('additive_smoothing', False))
+            self.assertRaises(Exception, BigramModel.read_binary, path)
+
+            # The stored probability tables are used as they are
+            model = TrigramModel.read_binary(path)
+            self.assertIsInstance(model.log_probabilities.values.base, np.memmap)
+            for model_class, counts, keys in [(UnigramModel, self.ug_counts_a, self.all_tokens),
+                                              (BigramModel, self.bg_counts_a, _keys(self.all_tokens, 2))]:
+                with open(path, 'wb') as f:
+                    model_class(counts).write_binary(f)
+                self.assert_probabilities(counts, model_class.read_binary(path), keys)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_binary_format_version_1(self):
+        # Files without probability tables compute them when read
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trigram_model.bin')
+            model = TrigramModel(self.tg_counts_a)
+            vocabulary = u"\x00".join(model.symbols.id2token).encode('utf-8')
+            with open(path, 'wb') as f:
+                f.write(ngram.packed._BINARY_HEADER.pack(ngram.packed.BINARY_MAGIC, 1, 3, model.radix,
+                                                         len(model.counts), len(vocabulary)))
+                f.write(vocabulary)
+                f.write(b"\x00" * (-(ngram.packed._BINARY_HEADER.size + len(vocabulary)) % 8))
+                f.write(model.counts.keys.astype('<i8').tostring())
+                f.write(model.counts.values.astype('<i8').tostring())
+            model = TrigramModel.read_binary(path)
+            self.assertEqual(self.tg_counts_a, dict(model.transition_counts))
+            self.assert_probabilities(self.tg_counts_a, model, _keys(self.all_tokens, 3))
+        finally:
+            shutil.rmtree(directory)
+
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import random
+
+from ngram.models import UnigramModelBuilderTokenSink, BigramModelBuilderTokenSink, TrigramModelBuilderTokenSink, \
+    UnigramModel, BigramModel, TrigramModel
+
+
+class Token(object):
+    def __init__(self, letter, is_beginning, is_ending):
+        self.letter = letter
+        self.is_beginning = is_beginning
+        self.is_ending = is_ending
+
+
+class NullLogger(object):
+    def debug(self, *args, **kwargs):
+        pass
+
+
+def random_tokens(alphabet, count, seed):
+    rnd = random.Random(seed)
+    tokens = []
+    while len(tokens) < count:
+        word = [rnd.choice(alphabet) for _ in xrange(rnd.randint(1, 6))]
+        for index, letter in enumerate(word):
+            tokens.append(Token(letter, index == 0, index == len(word) - 1))
+    # Leave the last word unfinished
+    return tokens[:count]
+
+
+def build_models(tokens, symbols, **kwargs):
+    sinks = [UnigramModelBuilderTokenSink(NullLogger()), BigramModelBuilderTokenSink(NullLogger()),
+             TrigramModelBuilderTokenSink(NullLogger())]
+    for token in tokens:
+        for sink in sinks:
+            sink.handle(token)
+    return (UnigramModel(sinks[0].token_counts, additive_smoothing=True, symbols=symbols, **kwargs),
+            BigramModel(sinks[1].transition_counts, symbols=symbols, **kwargs),
+            TrigramModel(sinks[2].transition_counts, symbols=symbols, **kwargs))
@@ -27,36 +27,81 @@ import collections
 import logging
 
 import codecs
+import hashlib
+import itertools
+import multiprocessing
 import os
-import random
+import Queue
 import sqlite3
+import sys
+import threading
+import time
+import uuid
 
 import europarl_utils
-from espeak_transcript import espeak_transcribe
+from espeak_transcript import EspeakPool, batches, single_line
 from patharg import PathType
 
 
 Document = collections.namedtuple('Document', ['language', 'relative_path'])
 
 
-def collect_files(root_dir):
-    for directory, _, files in os.walk(root_dir, topdown=False):
+def _document(root_dir, directory, item):
+    language = [part for part in directory.split(os.sep) if len(part) == 2][0]
+    return Document(language=language, relative_path=os.path.relpath(os.path.join(directory, item), root_dir))
+
+
+def collect_files(root_dir, directory=''):
+    for directory, _, files in os.walk(os.path.join(root_dir, directory), topdown=False):
+        for item in files:
+            yield _document(root_dir, directory, item)
+
+
+def _with_stats(root_dir, document):
+    stat = os.stat(os.path.join(root_dir, document.relative_path))
+    return document, stat.st_mtime, stat.st_size
+
+
+def _scan_directory(args):
+    root_dir, directory = args
+    return [_with_stats(root_dir, document) for document in collect_files(root_dir, directory)]
+
+
+def scan_files(root_dir, pool):
+    """(Document, mtime, size) of every file, with the subdirectories of root_dir walked in the pool."""
+    items = sorted(os.listdir(root_dir))
+    directories = [(root_dir, item) for item in items if os.path.isdir(os.path.join(root_dir, item))]
+    for files in pool.imap(_scan_directory, directories):
         for item in files:
-            language = [part for part in directory.split(os.sep) if len(part) == 2][0]
-            yield Document(language=language, relative_path=os.path.relpath(os.path.join(directory, item), root_dir))
+            yield item
+    for item in items:
+        if os.path.isfile(os.path.join(root_dir, item)):
+            yield _with_stats(root_dir, _document(root_dir, root_dir, item))
+
+
+def _classify(args):
+    input_dir, document, mtime, size = args
+    try:
+        empty_doc = europarl_utils.is_empty_doc(os.path.join(input_dir, document.relative_path))
+        failed = False
+    except:
+        empty_doc = True
+        failed = True
+    return document, mtime, size, empty_doc, failed
 
 
 def init(args, logger):
+    """Fills in the documents table; run again, only adds or updates the documents whose files changed."""
     input_dir = args.input_directory
     output_dir = args.output_directory
 
     logger.info("Initializing transcription process...")
 
-    conn = sqlite3.connect(args.database)
+    conn = connect(args.database)
     c = conn.cursor()
 
     # Create table
-    c.execute('''CREATE TABLE documents
+    c.execute('''CREATE TABLE IF NOT EXISTS documents
                  (language TEXT,
                   input_dir TEXT,
                   output_dir TEXT,
@@ -64,77 +109,425 @@ def init(args, logger):
                   started BOOLEAN,
                   finished BOOLEAN,
                   empty_doc BOOLEAN,
-                  token_count INT)''')
+                  token_count INT,
+                  claim TEXT,
+                  lease_expires REAL,
+                  mtime REAL,
+                  size INT)''')
+    upgrade_schema(conn)
 
-    for idx, f in enumerate(collect_files(input_dir)):
-        try:
-            empty_doc = europarl_utils.is_empty_doc(os.path.join(input_dir, f.relative_path))
-        except:
-            logger.warn(u"Couldn't determine if document {} is empty or not; skipping"
-                        .format(f.relative_path))
-            empty_doc = True
-        c.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                  (f.language, input_dir, output_dir, f.relative_path, False, False, empty_doc, 0))
-        if idx % 1000 == 0:
-            conn.commit()
-            logger.info("{} added".format(idx))
+    known = {}
+    for row in c.execute("SELECT relative_path, mtime, size FROM documents"):
+        known[row["relative_path"]] = (row["mtime"], row["size"])
+    if len(known) > 0:
+        logger.info("{} documents already known; scanning for changes".format(len(known)))
+
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        changed = []
+        for document, mtime, size in scan_files(input_dir, pool):
+            if known.pop(document.relative_path, None) != (mtime, size):
+                changed.append((input_dir, document, mtime, size))
+        logger.info("{} new or changed documents, {} removed".format(len(changed), len(known)))
+
+        inserts = []
+        updates = []
+        stored = 0
+        for document, mtime, size, empty_doc, failed in pool.imap_unordered(_classify, changed, chunksize=16):
+            if failed:
+                logger.warn(u"Couldn't determine if document {} is empty or not; skipping"
+                            .format(document.relative_path))
+            inserts.append((document.language, input_dir, output_dir, document.relative_path, False, False,
+                            empty_doc, 0, None, None, mtime, size))
+            updates.append((empty_doc, mtime, size, input_dir, output_dir, document.relative_path))
+            if len(inserts) == 1000:
+                stored += _store_documents(c, inserts, updates)
+                inserts, updates = [], []
+                logger.info("{} stored".format(stored))
+        stored += _store_documents(c, inserts, updates)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    c.executemany("DELETE FROM documents WHERE relative_path=?", [(path,) for path in known])
+    # All of it in a single transaction
     conn.commit()
+    logger.info("{} stored".format(stored))
     conn.close()
 
 
+def _store_documents(c, inserts, updates):
+    # Changed documents are transcribed again; the ones only missing the file stats keep their progress
+    c.executemany("""UPDATE documents SET started=0, finished=0, token_count=0, claim=NULL, lease_expires=NULL
+                     WHERE relative_path=? AND mtime IS NOT NULL""",
+                  [(update[-1],) for update in updates])
+    c.executemany("""UPDATE documents SET empty_doc=?, mtime=?, size=?, input_dir=?, output_dir=?
+                     WHERE relative_path=?""", updates)
+    c.executemany("INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", inserts)
+    return len(inserts)
+
+
+def connect(database, check_same_thread=True):
+    # Workers wait for each other's writes instead of failing, and WAL lets reads go on meanwhile
+    conn = sqlite3.connect(database, timeout=60, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def upgrade_schema(conn):
+    """Adds the claim and file stat columns to databases initialized before they existed."""
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(documents)")]
+    for column, column_type in [("claim", "TEXT"), ("lease_expires", "REAL"), ("mtime", "REAL"), ("size", "INT")]:
+        if column not in columns:
+            conn.execute("ALTER TABLE documents ADD COLUMN {} {}".format(column, column_type))
+    conn.execute("CREATE INDEX IF NOT EXISTS documents_claim ON documents (claim)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS documents_path ON documents (relative_path)")
+    conn.commit()
+
+
+def claim_documents(conn, count, lease_seconds):
+    """Claims up to count documents nobody is working on; returns the claim token and the documents.
+
+    A single UPDATE claims the documents, so no two workers get the same
+    document.  Documents whose lease has expired, e.g. because their worker
+    crashed, are claimed again.
+
+    """
+    token = uuid.uuid4().hex
+    now = time.time()
+    conn.execute("""UPDATE documents SET started=1, claim=?, lease_expires=?
+                    WHERE rowid IN (SELECT rowid FROM documents
+                                    WHERE finished=0 AND empty_doc=0
+                                    AND (started=0 OR lease_expires IS NULL OR lease_expires < ?)
+                                    ORDER BY RANDOM() LIMIT ?)""",
+                 (token, now + lease_seconds, now, count))
+    conn.commit()
+    rows = conn.execute("SELECT rowid, * FROM documents WHERE claim=? AND finished=0", (token,)).fetchall()
+    return token, rows
+
+
+def renew_lease(conn, token, lease_seconds):
+    conn.execute("UPDATE documents SET lease_expires=? WHERE claim=? AND finished=0",
+                 (time.time() + lease_seconds, token))
+    conn.commit()
+
+
+def holds_claim(conn, token, row):
+    """Whether the document is still claimed with token and its lease hasn't run out."""
+    return conn.execute("SELECT 1 FROM documents WHERE rowid=? AND claim=? AND finished=0 AND lease_expires>?",
+                        (row["rowid"], token, time.time())).fetchone() is not None
+
+
+def finish_document(conn, token, row, token_count):
+    cursor = conn.execute("UPDATE documents SET finished=1, token_count=? WHERE rowid=? AND claim=?",
+                          (token_count, row["rowid"], token))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def skip_document(conn, token, row):
+    """Marks a claimed document that couldn't be transcribed to be skipped, like those init couldn't read."""
+    cursor = conn.execute("UPDATE documents SET empty_doc=1 WHERE rowid=? AND claim=? AND finished=0",
+                          (row["rowid"], token))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def release_documents(conn, token):
+    """Gives back the unfinished documents of a claim."""
+    conn.execute("UPDATE documents SET started=0, claim=NULL, lease_expires=NULL WHERE claim=? AND finished=0",
+                 (token,))
+    conn.commit()
+
+
+def normalize_line(line):
+    return u" ".join(line.split())
+
+
+class TranscriptCache(object):
+    """Transcripts of single lines, keyed by a hash of the language and the normalized line."""
+    # Keys per query, below SQLite's limit on query parameters
+    QUERY_SIZE = 500
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("CREATE TABLE IF NOT EXISTS line_transcripts (key TEXT PRIMARY KEY, transcript TEXT)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(language, line):
+        return hashlib.sha1(u"{}\t{}".format(language, line).encode('utf-8')).hexdigest()
+
+    def get_many(self, language, lines):
+        """Cached transcripts of normalized lines, as a dict."""
+        keys = dict((self.key(language, line), line) for line in set(lines))
+        key_list = list(keys)
+        result = {}
+        for start in xrange(0, len(key_list), self.QUERY_SIZE):
+            query_keys = key_list[start:start + self.QUERY_SIZE]
+            for key, transcript in self.conn.execute(
+                    "SELECT key, transcript FROM line_transcripts WHERE key IN ({})"
+                    .format(", ".join("?" * len(query_keys))), query_keys):
+                result[keys[key]] = transcript
+        return result
+
+    def put_many(self, language, transcripts):
+        """Stores (normalized line, transcript) pairs."""
+        self.conn.executemany("INSERT OR IGNORE INTO line_transcripts VALUES (?, ?)",
+                              [(self.key(language, line), transcript) for line, transcript in transcripts])
+        self.conn.commit()
+
+
+def transcribe_lines(language, lines, pool, cache):
+    """Transcripts of the lines, with eSpeak only transcribing lines missing from the cache."""
+    lines = [normalize_line(line) for line in lines]
+    transcripts = cache.get_many(language, lines)
+    missing = []
+    for line in lines:
+        if line not in transcripts:
+            transcripts[line] = None
+            missing.append(line)
+
+    # The batches of a long document are spread over the pool's workers; each is stored as soon as it's done,
+    # so after a crash only the unfinished batches are transcribed again
+    missing_batches = list(batches(missing))
+    for batch, batch_transcripts in itertools.izip(missing_batches,
+                                                   pool.transcribe_batches(missing_batches, per_line=True)):
+        cache.put_many(language, zip(batch, batch_transcripts))
+        transcripts.update(zip(batch, batch_transcripts))
+    return [transcripts[line] for line in lines]
+
+
+def read_document(row):
+    """The lines of a document left after filtering."""
+    with codecs.open(os.path.join(row["input_dir"], row["relative_path"]), 'r', encoding='utf-8') as f:
+        return europarl_utils.filter_document(f.read().split('\n'))
+
+
+def count_tokens(text):
+    token_count = 0
+    for line in text.splitlines():
+        for word in line.strip().split(" "):
+            token_count += len(word.split("_"))
+    return token_count
+
+
+def write_document(row, transcripts, compression=None):
+    """Writes the transcript of a document, a line per input line, gzip or xz compressed if asked to.
+
+    Returns the token count of the transcript.
+
+    """
+    to_path = os.path.join(row["output_dir"], row["relative_path"])
+    try:
+        os.makedirs(os.path.split(to_path)[0])
+    except:
+        pass
+    extension = europarl_utils.COMPRESSION_EXTENSIONS[compression] if compression is not None else ""
+    text = u"".join(single_line(transcript) for transcript in transcripts)
+    # Renamed into place when complete, so that a partly written file is never taken for a transcript;
+    # the extension stays at the end, as open_text() compresses according to it
+    part_path = to_path + ".part" + extension
+    with europarl_utils.open_text(part_path, 'w') as of:
+        of.write(text)
+    os.rename(part_path, to_path + extension)
+    return count_tokens(text)
+
+
+_END_OF_STAGE = object()
+# In place of the result of a document that failed in an earlier stage
+_FAILED = object()
+
+
+class _StageFailure(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def _run_stage(items, function, output):
+    try:
+        for item in items:
+            if isinstance(item, _StageFailure):
+                output.put(item)
+                return
+            output.put(function(item))
+        output.put(_END_OF_STAGE)
+    except Exception:
+        output.put(_StageFailure(sys.exc_info()))
+
+
+def _queued_items(queue):
+    while True:
+        item = queue.get()
+        if item is _END_OF_STAGE:
+            return
+        yield item
+
+
+def pipeline(items, functions, queue_size=4):
+    """Applies the functions in turn to the items, each function in a thread of its own.
+
+    The threads hand items on through queues of queue_size, so no stage
+    runs far ahead of the next one.  Results come out in order, and an
+    exception in any stage is raised here.
+
+    """
+    for function in functions:
+        queue = Queue.Queue(queue_size)
+        thread = threading.Thread(target=_run_stage, args=(items, function, queue))
+        thread.daemon = True
+        thread.start()
+        items = _queued_items(queue)
+    for item in items:
+        if isinstance(item, _StageFailure):
+            raise item.exc_info[0], item.exc_info[1], item.exc_info[2]
+        yield item
+
+
+def _claimed_documents(conn, args, tokens):
+    """Claims documents until there are none left, yielding (claim token, document) pairs."""
+    while True:
+        token, rows = claim_documents(conn, args.claim_size, args.lease)
+        tokens.append(token)
+        if len(rows) == 0:
+            return
+        for row in rows:
+            yield token, row
+
+
+def _renew_leases(database, tokens, lease_seconds, stop):
+    """Renews the leases of the claims in tokens every third of the lease, until stop is set."""
+    conn = connect(database)
+    try:
+        while not stop.wait(lease_seconds / 3.0):
+            for token in list(tokens):
+                renew_lease(conn, token, lease_seconds)
+    finally:
+        conn.close()
+
+
+def transcribe_worker(args, logger, make_pool=EspeakPool):
+    """Transcribes claimed documents until there are none left to claim.
+
+    Reading, transcribing and writing run in a pipeline, so the next
+    documents are read and the previous ones written while eSpeak works.
+    Meanwhile a thread keeps renewing the leases of all the documents
+    claimed and not yet finished.  A document whose lease was lost anyway
+    is left for the worker that claimed it next.  A document that can't be
+    read or transcribed is logged and marked to be skipped, and the worker
+    goes on with the next one.
+
+    """
+    conn = connect(args.database)
+    # Each of these is only used by the thread of one pipeline stage
+    claim_conn = connect(args.database, check_same_thread=False)
+    cache_conn = connect(args.cache or args.database, check_same_thread=False)
+    write_conn = connect(args.database, check_same_thread=False)
+    cache = TranscriptCache(cache_conn)
+    # eSpeak workers are kept running per language, from one document to the next
+    pools = {}
+    tokens = []
+    stop_renewing = threading.Event()
+    renewer = threading.Thread(target=_renew_leases, args=(args.database, tokens, args.lease, stop_renewing))
+    renewer.daemon = True
+    renewer.start()
+
+    def read(claimed):
+        token, row = claimed
+        logger.info("Transcribing {}".format(row["relative_path"]))
+        try:
+            return token, row, read_document(row)
+        except Exception:
+            logger.exception(u"Couldn't read {}".format(row["relative_path"]))
+            return token, row, _FAILED
+
+    def transcribe(read):
+        token, row, lines = read
+        if lines is _FAILED:
+            return read
+        if row["language"] not in pools:
+            pools[row["language"]] = make_pool(row["language"], workers=args.espeak_workers)
+        try:
+            return token, row, transcribe_lines(row["language"], lines, pools[row["language"]], cache)
+        except Exception:
+            logger.exception(u"Couldn't transcribe {}".format(row["relative_path"]))
+            return token, row, _FAILED
+
+    def write(transcribed):
+        token, row, transcripts = transcribed
+        if transcripts is _FAILED:
+            return transcribed
+        if not holds_claim(write_conn, token, row):
+            return token, row, None
+        return token, row, write_document(row, transcripts, compression=args.compression)
+
+    documents_done = 0
+    documents_skipped = 0
+    try:
+        for token, row, token_count in pipeline(_claimed_documents(claim_conn, args, tokens),
+                                                [read, transcribe, write]):
+            # Documents come out in the order they were claimed, so earlier claims are done with
+            while tokens[0] != token:
+                del tokens[0]
+            if token_count is _FAILED:
+                if skip_document(conn, token, row):
+                    logger.warn(u"Skipping {}".format(row["relative_path"]))
+                    documents_skipped += 1
+                continue
+            if token_count is None or not finish_document(conn, token, row, token_count):
+                logger.warn("Lease on {} was lost before it was transcribed; left to the worker that has it now"
+                            .format(row["relative_path"]))
+                continue
+            documents_done += 1
+    finally:
+        stop_renewing.set()
+        renewer.join()
+        for token in tokens:
+            release_documents(conn, token)
+        for pool in pools.values():
+            pool.close()
+        cache_conn.close()
+        write_conn.close()
+        claim_conn.close()
+        conn.close()
+    logger.info("No documents left to transcribe; {} transcribed, {} skipped".format(documents_done,
+                                                                                   documents_skipped))
+
+
+def _run_worker(args, index):
+    logger = logging.getLogger("transcribe_europarl.worker{}".format(index))
+    try:
+        transcribe_worker(args, logger)
+    except KeyboardInterrupt:
+        pass
+
+
 def transcribe(args, logger):
     logger.info("Transcriber started")
 
-    documents_done = 0
-    while True:
-        conn = sqlite3.connect(args.database)
-        c = conn.cursor()
-        c.row_factory = sqlite3.Row
-
-        # Pick a random language
-        c.execute("SELECT DISTINCT language FROM documents")
-        lang = random.choice(c.fetchall())[0]
-
-        # Start work on a document
-        c.execute("SELECT * FROM documents WHERE language=? AND started=0 AND empty_doc=0", (lang,))
-        row = c.fetchone()
-        relative_path = row["relative_path"]
-        c.execute("UPDATE documents SET started=1 WHERE relative_path=?", (relative_path,))
-        conn.commit()
-        logger.info("Transcribing {}".format(relative_path))
-
-        # c.execute("SELECT * FROM documents WHERE relative_path=?", (relative_path,))
-        # print(c.fetchone())
-
-        from_path = os.path.join(row["input_dir"], relative_path)
-        to_path = os.path.join(row["output_dir"], relative_path)
-        logger.info("{} => {}".format(from_path, to_path))
-
-        with codecs.open(from_path, 'r', encoding='utf-8') as f:
-            lines = f.read().split('\n')
-            filtered = europarl_utils.filter_document(lines)
-
-            try:
-                os.makedirs(os.path.split(to_path)[0])
-            except:
-                pass
-            with codecs.open(to_path, 'w', encoding='utf-8') as of:
-                espeak_transcribe(row["language"], filtered, of)
-            with codecs.open(to_path, 'r', encoding='utf-8') as of:
-                token_count = 0
-                for line in of:
-                    line = line.strip().replace('\n', '')
-                    words = line.split(" ")
-                    for word in words:
-                        tokens = word.split("_")
-                        token_count += len(tokens)
-                c.execute("UPDATE documents SET token_count=? WHERE relative_path=?",
-                          (token_count, relative_path))
-                conn.commit()
-
-        c.execute("UPDATE documents SET finished=1 WHERE relative_path=?", (relative_path,))
-        conn.commit()
-        documents_done += 1
+    conn = connect(args.database)
+    upgrade_schema(conn)
+
+    if args.workers <= 1:
+        transcribe_worker(args, logger)
+    else:
+        workers = [multiprocessing.Process(target=_run_worker, args=(args, index))
+                   for index in xrange(args.workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # The workers got the interrupt too, and give back their claims on the way out
+            for worker in workers:
+                worker.join()
+            raise
+
+    unfinished = conn.execute("SELECT COUNT(*) FROM documents WHERE finished=0 AND empty_doc=0").fetchone()[0]
+    if unfinished > 0:
+        logger.info("{} documents are still leased to other transcribers".format(unfinished))
     conn.close()
 
 
@@ -147,9 +540,26 @@ if __name__ == '__main__':
     init_parser = subparsers.add_parser("init")
     init_parser.add_argument('input_directory', type=PathType(exists=True, type='dir'))
     init_parser.add_argument('output_directory')
+    init_parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                             help='Number of processes scanning the documents')
     init_parser.set_defaults(func=init)
 
     transcribe_parser = subparsers.add_parser("transcribe")
+    transcribe_parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                                   help='Number of transcribing processes')
+    transcribe_parser.add_argument('--espeak-workers', type=int, default=1,
+                                   help='Number of eSpeak processes per language in each transcribing process')
+    transcribe_parser.add_argument('--claim-size', type=int, default=10,
+                                   help='Number of documents claimed at a time')
+    transcribe_parser.add_argument('--cache', default=None,
+                                   help='SQLite database for the transcripts of single lines, shared by all runs; '
+                                        'by default kept in the state database')
+    transcribe_parser.add_argument('--lease', type=float, default=3600,
+                                   help='Seconds after which a document being transcribed can be claimed by another '
+                                        'worker')
+    transcribe_parser.add_argument('--compression', choices=sorted(europarl_utils.COMPRESSION_EXTENSIONS),
+                                   default=None,
+                                   help='Compress the transcripts; EuroparlText reads them all the same')
     transcribe_parser.set_defaults(func=transcribe)
 
     args = parser.parse_args()
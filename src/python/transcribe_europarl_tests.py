@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016-2017 University of Helsinki.
+#
+# This file is part of data-driven-language-typology distribution.
+#
+# data-driven-language-typology is free software: you can
+# redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# data-driven-language-typology is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with data-driven-language-typology.  If not, see
+# <http://www.gnu.org/licenses/>.
+#
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from transcribe_europarl import connect, upgrade_schema, claim_documents, renew_lease, finish_document, \
+    holds_claim, release_documents, _renew_leases, TranscriptCache, transcribe_lines, init, pipeline, write_document, \
+    transcribe_worker
+from europarl_utils import open_text, read_lines, lzma
+
+
+class _UppercasingPool(object):
+    def __init__(self):
+        self.transcribed = []
+
+    def transcribe_batches(self, batches, per_line=False):
+        for batch in batches:
+            self.transcribed.extend(batch)
+            yield [line.upper() + u"\n" for line in batch]
+
+
+class _CrashingPool(_UppercasingPool):
+    def __init__(self, language, workers=1):
+        super(_CrashingPool, self).__init__()
+
+    def transcribe_batches(self, batches, per_line=False):
+        for batch in batches:
+            if any(u"crash" in line for line in batch):
+                raise Exception("eSpeak exited in the middle of a batch")
+            yield [line.upper() + u"\n" for line in batch]
+
+    def close(self):
+        pass
+
+
+class ClaimTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, "state.db")
+        conn = sqlite3.connect(self.database)
+        # The table as initialized before documents could be claimed
+        conn.execute("""CREATE TABLE documents (language TEXT, input_dir TEXT, output_dir TEXT, relative_path TEXT,
+                        started BOOLEAN, finished BOOLEAN, empty_doc BOOLEAN, token_count INT)""")
+        conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [("fi", "txt", "phon", "fi/{}.txt".format(index), False, False, index % 5 == 0, 0)
+                          for index in xrange(20)])
+        conn.commit()
+        conn.close()
+        self.conn = connect(self.database)
+        upgrade_schema(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory)
+
+    def test_claims_are_disjoint(self):
+        other = connect(self.database)
+        claimed = []
+        while True:
+            _, rows = claim_documents(self.conn if len(claimed) % 2 == 0 else other, 3, 60)
+            if len(rows) == 0:
+                break
+            claimed.append([row["relative_path"] for row in rows])
+        other.close()
+        paths = [path for paths in claimed for path in paths]
+        self.assertEqual(len(paths), 16)
+        self.assertEqual(len(set(paths)), 16)
+
+    def test_expired_leases(self):
+        token, rows = claim_documents(self.conn, 4, -1)
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(finish_document(self.conn, token, rows[0], 10))
+
+        # The lease already ran out, so the unfinished documents can be claimed again
+        other_token, other_rows = claim_documents(self.conn, 20, 60)
+        self.assertEqual(len(other_rows), 15)
+        self.assertFalse(finish_document(self.conn, token, rows[1], 10))
+        renew_lease(self.conn, other_token, 60)
+        self.assertEqual(len(claim_documents(self.conn, 20, 60)[1]), 0)
+
+        release_documents(self.conn, other_token)
+        self.assertEqual(len(claim_documents(self.conn, 20, 60)[1]), 15)
+        self.assertTrue(self.conn.execute("SELECT MIN(lease_expires) FROM documents WHERE finished=0 AND empty_doc=0")
+                        .fetchone()[0] > time.time())
+
+    def test_lost_claim(self):
+        token, rows = claim_documents(self.conn, 2, -1)
+        self.assertFalse(holds_claim(self.conn, token, rows[0]))
+        other_token, other_rows = claim_documents(self.conn, 20, 60)
+        self.assertTrue(holds_claim(self.conn, other_token, rows[0]))
+        # Renewing the old claim doesn't take the documents back
+        renew_lease(self.conn, token, 60)
+        self.assertFalse(holds_claim(self.conn, token, rows[0]))
+
+    def test_renewed_while_in_flight(self):
+        token, rows = claim_documents(self.conn, 3, 0.6)
+        stop = threading.Event()
+        renewer = threading.Thread(target=_renew_leases, args=(self.database, [token], 0.6, stop))
+        renewer.start()
+        try:
+            time.sleep(1.5)
+            self.assertTrue(all(holds_claim(self.conn, token, row) for row in rows))
+            self.assertEqual(len(claim_documents(self.conn, 20, 60)[1]), 13)
+        finally:
+            stop.set()
+            renewer.join()
+
+
+class TranscriptCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.conn = connect(os.path.join(self.directory, "cache.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory)
+
+    def test_only_new_lines_transcribed(self):
+        cache = TranscriptCache(self.conn)
+        pool = _UppercasingPool()
+        self.assertEqual(transcribe_lines("fi", [u"a b", u"c", u"a  b "], pool, cache), [u"A B\n", u"C\n", u"A B\n"])
+        self.assertEqual(pool.transcribed, [u"a b", u"c"])
+
+        # Cached per language, and across connections
+        cache = TranscriptCache(connect(os.path.join(self.directory, "cache.db")))
+        pool = _UppercasingPool()
+        self.assertEqual(transcribe_lines("fi", [u"c", u"d", u" a b"], pool, cache), [u"C\n", u"D\n", u"A B\n"])
+        self.assertEqual(transcribe_lines("sv", [u"c"], pool, cache), [u"C\n"])
+        self.assertEqual(pool.transcribed, [u"d", u"c"])
+
+    def test_finished_batches_kept(self):
+        class FailingPool(_UppercasingPool):
+            def transcribe_batches(self, batches, per_line=False):
+                for batch, transcripts in zip(batches, _UppercasingPool.transcribe_batches(self, batches)):
+                    if u"crash" in batch:
+                        raise Exception(u"eSpeak exited in the middle of a batch")
+                    yield transcripts
+
+        cache = TranscriptCache(self.conn)
+        lines = [u"line {}".format(index) for index in xrange(2500)] + [u"crash"]
+        with self.assertRaises(Exception):
+            transcribe_lines("fi", lines, FailingPool(), cache)
+        pool = _UppercasingPool()
+        transcribe_lines("fi", lines, pool, cache)
+        self.assertEqual(pool.transcribed, lines[2000:])
+
+
+class PipelineTest(unittest.TestCase):
+    def test_order(self):
+        self.assertEqual(list(pipeline(xrange(100), [lambda x: x * 2, str], queue_size=1)),
+                         [str(x * 2) for x in xrange(100)])
+
+    def test_failure(self):
+        def fail(x):
+            if x == 5:
+                raise ValueError(x)
+            return x
+
+        results = []
+        with self.assertRaises(ValueError):
+            for result in pipeline(xrange(100), [fail, lambda x: x]):
+                results.append(result)
+        self.assertEqual(results, range(5))
+
+    def test_token_count(self):
+        directory = tempfile.mkdtemp()
+        try:
+            row = {"output_dir": directory, "relative_path": "fi/1.txt"}
+            self.assertEqual(write_document(row, [u"a_b c\n", u"\n", u"d_e_f\n"]), 7)
+            with open(os.path.join(directory, "fi", "1.txt")) as f:
+                self.assertEqual(f.read(), "a_b c\n\nd_e_f\n")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_aligned_lines(self):
+        # eSpeak may split the transcript of a line, or give none at all
+        directory = tempfile.mkdtemp()
+        try:
+            row = {"output_dir": directory, "relative_path": "fi/1.txt"}
+            transcripts = [u"a b\nc\n", u" d  e \n\n", u"", u"f\n"]
+            self.assertEqual(write_document(row, transcripts), 7)
+            with open(os.path.join(directory, "fi", "1.txt")) as f:
+                lines = f.read().split("\n")
+            self.assertEqual(lines[:-1], ["a b c", "d e", "", "f"])
+            self.assertEqual(len(lines) - 1, len(transcripts))
+        finally:
+            shutil.rmtree(directory)
+
+    def check_compression(self, compression, extension):
+        directory = tempfile.mkdtemp()
+        try:
+            row = {"output_dir": directory, "relative_path": "fi/1.txt"}
+            self.assertEqual(write_document(row, [u"a_b c\n", u"d\n"], compression=compression), 4)
+            self.assertEqual(os.listdir(os.path.join(directory, "fi")), ["1.txt" + extension])
+            path = os.path.join(directory, "fi", "1.txt" + extension)
+            with open(path, "rb") as f:
+                self.assertNotEqual(f.read(), b"a_b c\nd\n")
+            with open_text(path) as f:
+                self.assertEqual(list(read_lines(f)), [u"a_b c", u"d", u""])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_gzip(self):
+        self.check_compression("gzip", ".gz")
+
+    def test_xz(self):
+        if lzma is None:
+            self.skipTest("no lzma module")
+        self.check_compression("xz", ".xz")
+
+
+class InitTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, "state.db")
+        self.input_dir = os.path.join(self.directory, "txt")
+        for language in ["fi", "sv"]:
+            os.makedirs(os.path.join(self.input_dir, language))
+            for index in xrange(6):
+                self.write_document(language, index, 2 if index == 0 else 6)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_document(self, language, index, line_count):
+        with open(os.path.join(self.input_dir, language, "ep-{}.txt".format(index)), "w") as f:
+            for line in xrange(line_count):
+                f.write("Line {} of {}\n".format(line, index))
+
+    def init(self):
+        init(argparse.Namespace(input_directory=self.input_dir, output_directory="phon", database=self.database,
+                                workers=2), logging.getLogger("transcribe_europarl_tests"))
+        conn = connect(self.database)
+        rows = dict((row["relative_path"], row) for row in conn.execute("SELECT * FROM documents"))
+        conn.close()
+        return rows
+
+    def test_incremental(self):
+        rows = self.init()
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(sorted(path for path, row in rows.items() if row["empty_doc"]), ["fi/ep-0.txt", "sv/ep-0.txt"])
+
+        conn = connect(self.database)
+        conn.execute("UPDATE documents SET started=1, finished=1")
+        conn.commit()
+        conn.close()
+        self.write_document("fi", 1, 7)
+        self.write_document("fi", 6, 7)
+        os.remove(os.path.join(self.input_dir, "sv", "ep-5.txt"))
+
+        rows = self.init()
+        self.assertEqual(len(rows), 12)
+        self.assertNotIn("sv/ep-5.txt", rows)
+        self.assertEqual(sorted(path for path, row in rows.items() if not row["finished"]),
+                         ["fi/ep-1.txt", "fi/ep-6.txt"])
+
+    def test_upgraded_database(self):
+        self.init()
+        conn = connect(self.database)
+        # As if initialized before file stats were recorded
+        conn.execute("UPDATE documents SET started=1, finished=1, mtime=NULL, size=NULL")
+        conn.commit()
+        conn.close()
+
+        rows = self.init()
+        self.assertTrue(all(row["finished"] and row["size"] > 0 for row in rows.values()))
+
+
+class WorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, "state.db")
+        self.input_dir = os.path.join(self.directory, "txt")
+        self.output_dir = os.path.join(self.directory, "phon")
+        os.makedirs(os.path.join(self.input_dir, "fi"))
+        for index in xrange(4):
+            self.write_document(index, "".join("Line {} of {}\n".format(line, index) for line in xrange(6)))
+        init(argparse.Namespace(input_directory=self.input_dir, output_directory=self.output_dir,
+                                database=self.database, workers=1), logging.getLogger("transcribe_europarl_tests"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_document(self, index, text):
+        with open(os.path.join(self.input_dir, "fi", "ep-{}.txt".format(index)), "w") as f:
+            f.write(text)
+
+    def test_failed_documents_skipped(self):
+        # Changed since init: one can't be decoded, and eSpeak fails on the other
+        self.write_document(1, "Line \xff\n" * 6)
+        self.write_document(2, "Line to crash on\n" * 6)
+        args = argparse.Namespace(database=self.database, cache=None, claim_size=1, lease=60, espeak_workers=1,
+                                  compression=None)
+        transcribe_worker(args, logging.getLogger("transcribe_europarl_tests"), make_pool=_CrashingPool)
+
+        conn = connect(self.database)
+        rows = dict((row["relative_path"], row) for row in conn.execute("SELECT * FROM documents"))
+        conn.close()
+        self.assertEqual(sorted(path for path, row in rows.items() if row["finished"]), ["fi/ep-0.txt", "fi/ep-3.txt"])
+        self.assertEqual(sorted(path for path, row in rows.items() if row["empty_doc"]), ["fi/ep-1.txt", "fi/ep-2.txt"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.output_dir, "fi"))), ["ep-0.txt", "ep-3.txt"])
+        # A second worker finds nothing left to do
+        transcribe_worker(args, logging.getLogger("transcribe_europarl_tests"), make_pool=_CrashingPool)